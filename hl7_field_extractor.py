@@ -0,0 +1,243 @@
+import argparse
+import concurrent.futures
+import json
+import math
+import mmap
+import os
+import time
+
+from hl7_message_parser import DEFINITIONS_FILE, HL7_VERSION, MessageParser, _position_from_name
+from hl7_message_reader import SNIFF_BYTES, detect_framing, iter_mapped_messages, message_boundary
+
+try:
+    import numpy # Optional; columns come back as lists (and .json output) without it
+except ImportError:
+    numpy = None
+try:
+    import pyarrow # Optional; needed for .arrow / .feather / .parquet output
+except ImportError:
+    pyarrow = None
+
+# --- Constants (Adjust to your archive) ---
+# Pulls a few fields out of large message archives into columns (one value per message, or per segment with --rows).
+# Field paths are resolved against the definitions: "PID.patientIdentifierList", "PID.patientName.familyName",
+# "OBX.observationValue", or positional "PID-3.1" / "PID.3.1" (1-based, as in the HL7 standard).
+SHARD_BYTES = 64 * 1024 * 1024 # Files are cut into shards of about this size (at message boundaries), one task each
+NUMERIC_TYPES = ("NM", "SI") # Leaf data types extracted as floats (NaN / null when empty or not a number)
+OUTPUT_FORMATS = (".npz", ".arrow", ".feather", ".parquet", ".json")
+PREVIEW_ROWS = 5
+
+# --- Helper Functions ---
+
+class FieldPath:
+    """One column: a field path resolved to segment id, field index and 0-based component / sub-component positions."""
+    __slots__ = ("text", "segment_id", "key", "segment_repeats", "index", "component", "sub_component", "numeric")
+
+    def __init__(self, text, layout, index, component=None, sub_component=None, data_type=None):
+        self.text = text; self.segment_id = layout.segment_id; self.key = layout.key; self.segment_repeats = layout.repeats
+        self.index = index; self.component = component; self.sub_component = sub_component
+        self.numeric = data_type in NUMERIC_TYPES
+
+    def __repr__(self):
+        return f"FieldPath({self.text!r}, {self.segment_id}-{self.index}, component={self.component}, sub_component={self.sub_component})"
+
+def _resolve_part(name, descriptors, prefix, what):
+    """1-based position of a path part given by name or number within `descriptors`; raises ValueError if unknown."""
+    if name.isdigit(): position = int(name)
+    else:
+        position = next((number for number, descriptor in enumerate(descriptors, 1) if descriptor.name == name), None)
+        if position is None: position = _position_from_name(name, prefix)
+    if not position:
+        known = ", ".join(descriptor.name for descriptor in descriptors) or "none defined"
+        raise ValueError(f"Unknown {what} '{name}' (known: {known})")
+    return position
+
+def resolve_segment(parser, segment_id):
+    """Layout for a segment id defined in the definitions (or an explicit Z-segment); raises ValueError otherwise."""
+    segment_id = segment_id.upper()
+    if segment_id not in parser.defined_segments and not (len(segment_id) == 3 and segment_id.isalnum() and segment_id.startswith("Z")):
+        raise ValueError(f"Unknown segment '{segment_id}' (not in the definitions; only Z-segments may be undefined)")
+    return parser.layout(segment_id)
+
+def resolve_field_path(parser, text):
+    """Parses "SEG.field[.component[.subComponent]]" (names or 1-based numbers; "PID-3.1" also works) into a FieldPath."""
+    segment_id, separator, rest = text[:3], text[3:4], text[4:]
+    if len(segment_id) != 3 or separator not in (".", "-") or not rest: raise ValueError(f"Field path '{text}' must look like SEG.field[.component[.subComponent]]")
+    parts = rest.split(".")
+    if len(parts) > 3: raise ValueError(f"Field path '{text}' has more than three levels")
+    layout = resolve_segment(parser, segment_id)
+    index = _resolve_part(parts[0], layout.fields[1:], "field", f"field of {segment_id}")
+    descriptor = layout.fields[index] if index < len(layout.fields) else None
+    positions = []
+    for part, prefix in zip(parts[1:], ("component", "subComponent")):
+        components = descriptor.components if descriptor else ()
+        position = _resolve_part(part, components, prefix, f"{prefix} of {text}")
+        descriptor = components[position - 1] if position <= len(components) else None
+        positions.append(position - 1)
+    positions += [None] * (2 - len(positions))
+    leaf_type = descriptor.type if descriptor is not None and not descriptor.components else None
+    return FieldPath(text, layout, index, positions[0], positions[1], leaf_type)
+
+def _to_number(value):
+    try: return float(value)
+    except (TypeError, ValueError): return None
+
+class ColumnExtractor:
+    """
+    Extracts resolved field paths from raw messages into column lists, using lazy views (only the segments
+    named by the paths are split). With `rows` = a segment id, each occurrence of that segment is one row and
+    paths on other segments repeat their message's first occurrence; otherwise each message is one row.
+    """
+    def __init__(self, parser, paths, rows=None):
+        self.parser = parser
+        self.paths = [path if isinstance(path, FieldPath) else resolve_field_path(parser, path) for path in paths]
+        self.rows = resolve_segment(parser, rows) if rows else None
+        self.messages = 0; self.skipped = 0
+
+    def new_columns(self):
+        return {path.text: [] for path in self.paths}
+
+    def _first_view(self, message, path, cache):
+        view = cache.get(path.key, cache)
+        if view is cache:
+            view = message.get(path.key)
+            if view is not None and path.segment_repeats: view = view[0]
+            cache[path.key] = view
+        return view
+
+    @staticmethod
+    def _read(view, path):
+        value = view.leaf(path.index, path.component, path.sub_component) if view is not None else None
+        return _to_number(value) if path.numeric else value
+
+    def extract_message(self, text, columns):
+        """Appends the row(s) of one raw message to `columns`; messages that are not HL7 count as skipped."""
+        try: message = self.parser.parse_lazy(text)
+        except ValueError: self.skipped += 1; return
+        self.messages += 1; cache = {}
+        if self.rows is None: row_views = (None,) # One row per message
+        else:
+            row_views = message.get(self.rows.key) or ()
+            if not self.rows.repeats: row_views = (row_views,) if row_views else ()
+        shared = {path.text: self._read(self._first_view(message, path, cache), path) for path in self.paths # Read once per message
+                  if self.rows is None or path.segment_id != self.rows.segment_id}
+        for row_view in row_views:
+            for path in self.paths:
+                columns[path.text].append(shared[path.text] if path.text in shared else self._read(row_view, path))
+
+    def extract(self, messages, columns=None):
+        """Column lists for an iterable of raw message strings."""
+        columns = columns if columns is not None else self.new_columns()
+        for text in messages: self.extract_message(text, columns)
+        return columns
+
+def plan_shards(file_paths, shard_bytes=SHARD_BYTES):
+    """[(path, start, end, framing)]: every file cut at message boundaries into pieces of about `shard_bytes`."""
+    shards = []
+    for file_path in file_paths:
+        with open(file_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0: continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                framing = detect_framing(mapped[:SNIFF_BYTES])
+                start = 0
+                while start < len(mapped):
+                    end = message_boundary(mapped, start + shard_bytes, framing) if start + shard_bytes < len(mapped) else len(mapped)
+                    shards.append((file_path, start, end, framing)); start = end
+    return shards
+
+_worker_extractor = None # Set per process by _init_worker
+
+def _init_worker(definitions_file, version, paths, rows):
+    """ProcessPoolExecutor initializer: compiles the definitions and the field paths once per process."""
+    global _worker_extractor
+    _worker_extractor = ColumnExtractor(MessageParser.from_file(definitions_file, version), paths, rows)
+
+def extract_shard(shard):
+    """Worker: (columns, messages, skipped) for one (path, start, end, framing) shard."""
+    file_path, start, end, framing = shard
+    extractor = _worker_extractor; messages, skipped = extractor.messages, extractor.skipped
+    columns = extractor.extract(iter_mapped_messages(file_path, framing, start, end))
+    return columns, extractor.messages - messages, extractor.skipped - skipped
+
+def extract_archive(file_paths, paths, definitions_file=DEFINITIONS_FILE, version=HL7_VERSION, rows=None, workers=None,
+                    shard_bytes=SHARD_BYTES):
+    """
+    Extracts `paths` from every message in `file_paths` (MLLP or batch files) across a process pool, one task per shard.
+    Returns (columns {path: list} in file order, [FieldPath], message count, skipped count). `workers=1` runs inline.
+    """
+    field_paths = ColumnExtractor(MessageParser.from_file(definitions_file, version), paths, rows).paths # Fail fast on bad paths
+    shards = plan_shards(file_paths, shard_bytes)
+    columns = {path.text: [] for path in field_paths}; message_count = skipped_count = 0
+    executor = None
+    if workers == 1: _init_worker(definitions_file, version, paths, rows)
+    else: executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(definitions_file, version, paths, rows))
+    try:
+        for shard_columns, messages, skipped in (executor.map(extract_shard, shards) if executor else map(extract_shard, shards)): # In shard order
+            for name, values in shard_columns.items(): columns[name].extend(values)
+            message_count += messages; skipped_count += skipped
+    finally:
+        if executor: executor.shutdown(cancel_futures=True)
+    return columns, field_paths, message_count, skipped_count
+
+def to_numpy(columns, field_paths):
+    """{path: numpy array}: float64 (NaN for missing) for numeric leaves, fixed-width unicode ("" for missing) otherwise."""
+    if numpy is None: raise RuntimeError("numpy is required for array output (pip install numpy)")
+    arrays = {}
+    for path in field_paths:
+        values = columns[path.text]
+        if path.numeric: arrays[path.text] = numpy.fromiter((math.nan if value is None else value for value in values), numpy.float64, len(values))
+        else: arrays[path.text] = numpy.array(["" if value is None else value for value in values], dtype=str)
+    return arrays
+
+def to_arrow(columns, field_paths):
+    """pyarrow.Table with one float64 / string column per path (missing values are nulls)."""
+    if pyarrow is None: raise RuntimeError("pyarrow is required for Arrow/Parquet output (pip install pyarrow)")
+    return pyarrow.table({path.text: pyarrow.array(columns[path.text], pyarrow.float64() if path.numeric else pyarrow.string()) for path in field_paths})
+
+def write_columns(output_path, columns, field_paths):
+    """Writes the columns in the format implied by the extension (see OUTPUT_FORMATS)."""
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension == ".npz":
+        arrays = to_numpy(columns, field_paths)
+        numpy.savez(output_path, **arrays)
+    elif extension in (".arrow", ".feather"):
+        table = to_arrow(columns, field_paths)
+        import pyarrow.feather
+        pyarrow.feather.write_feather(table, output_path)
+    elif extension == ".parquet":
+        table = to_arrow(columns, field_paths)
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(table, output_path)
+    elif extension == ".json":
+        with open(output_path, "w", encoding="utf-8") as f: json.dump(columns, f, ensure_ascii=False)
+    else: raise ValueError(f"Unsupported output '{output_path}' (use one of {', '.join(OUTPUT_FORMATS)})")
+
+# --- Main execution block for standalone running ---
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+    arg_parser = argparse.ArgumentParser(description="Extract HL7 fields from message archives into columns, in parallel across file shards.")
+    arg_parser.add_argument("files", nargs="+", help="MLLP or FHS/BHS batch files")
+    arg_parser.add_argument("--field", action="append", required=True, dest="fields", help="Field path, e.g. PID.patientIdentifierList or OBX-5 (repeatable)")
+    arg_parser.add_argument("--rows", help="One row per occurrence of this segment (e.g. OBX) instead of one per message")
+    arg_parser.add_argument("--output", help=f"Write the columns here ({', '.join(OUTPUT_FORMATS)}); otherwise print a preview")
+    arg_parser.add_argument("--workers", type=int, default=None, help="Extractor processes (default: all cores; 1 = no pool)")
+    arg_parser.add_argument("--shard-mb", type=int, default=SHARD_BYTES // (1024 * 1024))
+    arg_parser.add_argument("--definitions", default=os.path.join(script_dir, DEFINITIONS_FILE))
+    arg_parser.add_argument("--version", default=HL7_VERSION)
+    args = arg_parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        extracted, resolved, message_total, skipped_total = extract_archive(args.files, args.fields, args.definitions, args.version, args.rows,
+                                                                            args.workers, args.shard_mb * 1024 * 1024)
+    except ValueError as e:
+        print(f"Error: {e}")
+        raise SystemExit(1)
+    elapsed = time.perf_counter() - start
+    row_total = len(next(iter(extracted.values()), []))
+    print(f"{message_total} messages ({skipped_total} skipped), {row_total} rows in {elapsed:.2f}s ({message_total / elapsed if elapsed else 0:,.0f} msg/s).")
+    if args.output:
+        write_columns(args.output, extracted, resolved)
+        print(f"Wrote {len(resolved)} columns to {args.output}.")
+    else:
+        for row in range(min(PREVIEW_ROWS, row_total)): print("  " + " | ".join(f"{path.text}={extracted[path.text][row]}" for path in resolved))
@@ -0,0 +1,158 @@
+import asyncio
+import random
+import threading
+import time
+
+# --- Constants (Adjust to your Gemini quota) ---
+REQUESTS_PER_MINUTE = 60 # Sustained request rate shared by every caller of the stage
+BURST = 4 # Requests allowed back-to-back before the rate applies
+BACKOFF_BASE_S = 2.0
+BACKOFF_CAP_S = 60.0
+
+# --- Helper Functions ---
+
+def backoff_delay(attempt, base=BACKOFF_BASE_S, cap=BACKOFF_CAP_S):
+    """Exponential backoff with full jitter: uniform in [0, min(cap, base * 2**attempt)], so retries do not align."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class TokenBucket:
+    """asyncio token bucket: refills `rate` tokens/s up to `capacity`. pause() holds back every caller (e.g. after a 429)."""
+    def __init__(self, rate, capacity):
+        self.rate = rate; self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity); self._updated = time.monotonic(); self._paused_until = 0.0
+        self._lock = asyncio.Lock() # Waiters are served in arrival order
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now); continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate); self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1; return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds); self._tokens = 0.0
+
+class AsyncGeminiStage:
+    """
+    Runs LLM requests as coroutines on a private event loop thread, so callers (browser workers) hand off and move on.
+    Every call passes a shared token bucket and an in-flight cap; `max_in_flight` may be a callable (re-read per call).
+    """
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, burst=BURST, max_in_flight=4):
+        self.requests_per_minute = requests_per_minute; self.burst = burst
+        self.batcher = None # Optional RequestBatcher (set by the owner) for packing several pages into one request
+        self._max_in_flight = max_in_flight if callable(max_in_flight) else (lambda: max_in_flight)
+        self._loop = None; self._thread = None; self._bucket = None; self._slots = None
+        self._in_flight = 0
+        self._pending = set() # concurrent.futures.Future of every submitted job not yet done
+        self._pending_lock = threading.Lock()
+
+    def start(self):
+        ready = threading.Event()
+        def run_loop():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._bucket = TokenBucket(self.requests_per_minute / 60.0, self.burst); self._slots = asyncio.Condition()
+            ready.set()
+            self._loop.run_forever()
+            self._loop.close()
+        self._thread = threading.Thread(target=run_loop, name="GeminiStage", daemon=True)
+        self._thread.start(); ready.wait()
+        return self
+
+    def submit(self, coroutine, on_done=None):
+        """
+        Schedules a coroutine on the stage loop (thread-safe). Returns a concurrent.futures.Future for its result.
+        `on_done(future)` runs before the job stops counting as pending, so pending_count() == 0 means all callbacks ran.
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        with self._pending_lock: self._pending.add(future)
+        if on_done: future.add_done_callback(on_done)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future):
+        with self._pending_lock: self._pending.discard(future)
+
+    def pending_count(self):
+        """Submitted jobs that have not finished (queued for a token/slot, in flight or backing off)."""
+        with self._pending_lock: return len(self._pending)
+
+    async def call(self, request):
+        """Awaits a token and an in-flight slot, then awaits `request()` (a zero-arg coroutine function)."""
+        await self._bucket.acquire()
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._in_flight < max(1, self._max_in_flight()))
+            self._in_flight += 1
+        try:
+            return await request()
+        finally:
+            async with self._slots:
+                self._in_flight -= 1
+                self._slots.notify_all() # The limit may have been raised meanwhile
+
+    def cancel_pending(self):
+        """Cancels every submitted job that has not finished (e.g. on a stop request)."""
+        with self._pending_lock: pending = list(self._pending)
+        for future in pending: future.cancel()
+
+    def rate_limited(self, seconds):
+        """Holds back every request of the stage for `seconds` (call from stage coroutines after a 429)."""
+        self._bucket.pause(seconds)
+
+    def stop(self, cancel=False, timeout=30.0):
+        """Stops the loop thread; with `cancel`, pending jobs are cancelled first (their futures report CancelledError)."""
+        if not self._loop: return
+        if cancel: self.cancel_pending()
+        async def drain():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            if tasks: await asyncio.wait(tasks, timeout=timeout)
+        try: asyncio.run_coroutine_threadsafe(drain(), self._loop).result(timeout + 5)
+        except Exception: pass # Timed out; the loop is stopped regardless
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5.0)
+        self._loop = None
+
+class RequestBatcher:
+    """
+    Groups requests that arrive close together (per group key) into one batched call on the stage loop.
+    A group is sent when it reaches `max_cost` or `max_items`, or `window_s` after its first item.
+    `send_batch(group_key, items)` is a coroutine function returning one result per item, in order.
+    """
+    def __init__(self, send_batch, max_cost, max_items=10, window_s=1.0):
+        self.send_batch = send_batch; self.max_cost = max_cost; self.max_items = max(1, max_items); self.window_s = window_s
+        self.batches_sent = self.items_sent = 0
+        self._open = {} # group_key -> {"items": [...], "futures": [...], "cost": n, "timer": TimerHandle}
+
+    async def submit(self, group_key, item, cost):
+        """Adds one item to its group's open batch and waits for that item's result."""
+        loop = asyncio.get_running_loop()
+        batch = self._open.get(group_key)
+        if batch and batch["cost"] + cost > self.max_cost: self._flush(group_key) # Would overflow the budget: send what is there
+        batch = self._open.get(group_key)
+        if not batch:
+            batch = self._open[group_key] = {"items": [], "futures": [], "cost": 0, "timer": loop.call_later(self.window_s, self._flush, group_key)}
+        future = loop.create_future()
+        batch["items"].append(item); batch["futures"].append(future); batch["cost"] += cost
+        if len(batch["items"]) >= self.max_items or batch["cost"] >= self.max_cost: self._flush(group_key)
+        return await future
+
+    def _flush(self, group_key):
+        batch = self._open.pop(group_key, None)
+        if not batch: return
+        batch["timer"].cancel()
+        self.batches_sent += 1; self.items_sent += len(batch["items"])
+        asyncio.get_running_loop().create_task(self._send(group_key, batch))
+
+    async def _send(self, group_key, batch):
+        try:
+            results = await self.send_batch(group_key, batch["items"])
+        except Exception as e:
+            for future in batch["futures"]:
+                if not future.done(): future.set_exception(e)
+            return
+        for future, result in zip(batch["futures"], results):
+            if not future.done(): future.set_result(result) # Skips waiters cancelled meanwhile (stop request)
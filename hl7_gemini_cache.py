@@ -0,0 +1,91 @@
+import collections
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+from hl7_snapshot_store import write_atomic
+
+# --- Constants (Adjust if your folders differ) ---
+# Layout: <root>/<ab>/<sha256>.json   one parsed Gemini answer per (model, prompt version, definition, prompt HTML)
+# Recency is the file mtime (touched on every hit), so the LRU order survives restarts and is shared by processes.
+GEMINI_CACHE_DIR = "gemini_cache"
+GEMINI_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# --- Helper Functions ---
+
+def response_cache_key(model_name, prompt_version, definition_type, definition_name, prompt_html):
+    """SHA-256 cache key. Includes the definition because the prompt text names it; the HTML is the (minimized) page sent."""
+    html_digest = hashlib.sha256(prompt_html.encode("utf-8")).hexdigest()
+    return hashlib.sha256("\0".join([model_name, str(prompt_version), definition_type, str(definition_name), html_digest]).encode("utf-8")).hexdigest()
+
+class GeminiResponseCache:
+    """
+    On-disk cache of parsed Gemini responses with size-bounded LRU eviction.
+    Safe to share between threads; processes sharing the directory each track their own byte total.
+    """
+    def __init__(self, root_dir=GEMINI_CACHE_DIR, max_bytes=GEMINI_CACHE_MAX_BYTES):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict() # key -> size in bytes, least recently used first
+        self._total_bytes = 0
+        self.hits = self.misses = 0
+        os.makedirs(root_dir, exist_ok=True)
+        self._load_entries()
+
+    def _load_entries(self):
+        found = []
+        for dir_path, _, file_names in os.walk(self.root_dir):
+            for file_name in file_names:
+                if not file_name.endswith(".json"): continue # Skips leftover .tmp files
+                try: stat = os.stat(os.path.join(dir_path, file_name))
+                except OSError: continue
+                found.append((stat.st_mtime, file_name[:-len(".json")], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.root_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Parsed response stored under `key` (marked as recently used), or None."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f: payload = json.load(f)
+            os.utime(path) # Recency for the next process that loads the cache
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+                size = self._entries.pop(key, None)
+                if size: self._total_bytes -= size
+            return None
+        with self._lock:
+            self.hits += 1
+            if key in self._entries: self._entries.move_to_end(key)
+        return payload.get("response")
+
+    def put(self, key, response, **metadata):
+        """Stores a parsed response (plus descriptive metadata) and evicts least recently used entries over the size limit."""
+        payload = dict(metadata, createdAt=datetime.now(timezone.utc).isoformat(timespec="seconds"), response=response)
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, data)
+        with self._lock:
+            self._total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            evicted = []
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try: os.remove(self._path(old_key))
+            except FileNotFoundError: pass # Already evicted by another process
+
+    def stats(self):
+        """(entries, total_bytes, hits, misses) for logging."""
+        with self._lock: return len(self._entries), self._total_bytes, self.hits, self.misses
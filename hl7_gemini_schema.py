@@ -0,0 +1,97 @@
+import json
+
+# --- Constants (Gemini structured-output schemas; OpenAPI subset with upper-case type names) ---
+HL7_VERSION = "2.6" # Ensure this matches the version used in generation
+TABLE_ROWS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"value": {"type": "STRING"}, "description": {"type": "STRING"}},
+        "required": ["value", "description"],
+    },
+}
+DEFINITION_PART_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "name": {"type": "STRING"}, "type": {"type": "STRING"}, "length": {"type": "INTEGER"},
+        "mandatory": {"type": "BOOLEAN"}, "repeats": {"type": "BOOLEAN"}, "table": {"type": "STRING"},
+    },
+    "required": ["name", "type", "length"],
+}
+DEFINITION_SCHEMA = { # DataTypes and Segments share the structure built by build_definition_structure
+    "type": "OBJECT",
+    "properties": {
+        "separator": {"type": "STRING"},
+        "versions": {
+            "type": "OBJECT",
+            "properties": {
+                HL7_VERSION: {
+                    "type": "OBJECT",
+                    "properties": {
+                        "appliesTo": {"type": "STRING"}, "totalFields": {"type": "INTEGER"}, "length": {"type": "INTEGER"},
+                        "parts": {"type": "ARRAY", "items": DEFINITION_PART_SCHEMA},
+                    },
+                    "required": ["appliesTo", "totalFields", "length", "parts"],
+                },
+            },
+            "required": [HL7_VERSION],
+        },
+    },
+    "required": ["separator", "versions"],
+}
+SALVAGE_MAX_CUTS = 200 # Cut points tried (newest first) before a malformed answer is given up on
+
+# --- Helper Functions ---
+
+def response_schema(category, definition_names):
+    """Schema for an answer keyed by definition name(s): {name: rows} for Tables, {name: definition} otherwise."""
+    value_schema = TABLE_ROWS_SCHEMA if category == "Tables" else DEFINITION_SCHEMA
+    keys = [str(name) for name in definition_names]
+    return {"type": "OBJECT", "properties": {key: value_schema for key in keys}, "required": keys}
+
+def strip_code_fences(text):
+    """Removes a surrounding ```json ... ``` block (JSON mode answers have none; prompt-only answers often do)."""
+    json_text = text.strip()
+    if json_text.startswith("```json"): json_text = json_text[7:]
+    elif json_text.startswith("```"): json_text = json_text[3:]
+    if json_text.endswith("```"): json_text = json_text[:-3]
+    return json_text.strip()
+
+def _cut_points(text):
+    """Yields (end, open_brackets) after every complete value inside a container, scanning strings/escapes correctly."""
+    stack = []; in_string = False; escaped = False
+    for position, char in enumerate(text):
+        if in_string:
+            if escaped: escaped = False
+            elif char == "\\": escaped = True
+            elif char == '"': in_string = False
+            continue
+        if char == '"': in_string = True
+        elif char in "{[": stack.append(char)
+        elif char in "}]":
+            if not stack: return
+            stack.pop()
+            if not stack: return # Top-level value closed; anything after it is trailing text
+            yield position + 1, "".join(stack)
+
+def salvage_json(text):
+    """
+    Parses a model answer tolerantly. Returns (parsed, salvaged) where `salvaged` is True if the answer was malformed
+    or truncated and only its longest valid prefix was kept (e.g. the complete rows of a cut-off array).
+    Raises json.JSONDecodeError if nothing usable is found.
+    """
+    json_text = strip_code_fences(text)
+    start = min((i for i in (json_text.find("{"), json_text.find("[")) if i >= 0), default=-1)
+    if start < 0: return json.loads(json_text), False # No JSON at all; raises with the model's text position
+    try:
+        parsed, _ = json.JSONDecoder().raw_decode(json_text, start) # Ignores trailing prose after the object
+        return parsed, False
+    except json.JSONDecodeError as e:
+        decode_error = e
+    body = json_text[start:]
+    cuts = list(_cut_points(body))
+    for end, open_brackets in reversed(cuts[-SALVAGE_MAX_CUTS:]):
+        candidate = body[:end] + "".join("}" if bracket == "{" else "]" for bracket in reversed(open_brackets))
+        try: return json.loads(candidate), True
+        except json.JSONDecodeError: continue
+    raise decode_error
@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from hl7_html_parser import parse_definition_page_html
+from hl7_llm_backend import RECORD_DIR, load_recording
+
+# --- Constants (Adjust to the load you want to simulate) ---
+# Local stand-in for the Gemini generateContent endpoint (POST /v1beta/models/<model>:generateContent).
+# Answers come from recordings (LLM_RECORD_DIR in main4.py) or, failing that, from the deterministic HTML parser.
+HOST = "127.0.0.1"
+PORT = 8766
+TYPE_CATEGORIES = {"Table": "Tables", "DataType": "DataTypes", "Segment": "Segments"}
+PROMPT_NAME_PATTERN = re.compile(r"HL7 (Table|DataType|Segment) definition page for (?:ID )?'([^']+)'")
+BATCH_PAGE_PATTERN = re.compile(r"^=== (Table|DataType|Segment) (\S+) ===$", re.M) # main4.send_gemini_batch_async page markers
+HTML_SOURCE_MARKER = "HTML SOURCE:\n```html\n"
+
+# --- Helper Functions ---
+
+def split_prompt_pages(prompt_text):
+    """Returns [(category, name, html)] for the page(s) in a main4.py analysis prompt (single or batched)."""
+    marker = prompt_text.find(HTML_SOURCE_MARKER)
+    if marker < 0: return []
+    html_source = prompt_text[marker + len(HTML_SOURCE_MARKER):]
+    if html_source.endswith("\n```"): html_source = html_source[:-4]
+    headers = list(BATCH_PAGE_PATTERN.finditer(html_source))
+    if headers:
+        return [(TYPE_CATEGORIES[header.group(1)], header.group(2),
+                 html_source[header.end():headers[i + 1].start() if i + 1 < len(headers) else len(html_source)])
+                for i, header in enumerate(headers)]
+    match = PROMPT_NAME_PATTERN.search(prompt_text)
+    return [(TYPE_CATEGORIES[match.group(1)], match.group(2), html_source)] if match else []
+
+def answer_from_parser(prompt_text):
+    """Builds the answer the model should give, using hl7_html_parser on the page HTML inside the prompt."""
+    answer = {}
+    for category, name, html_content in split_prompt_pages(prompt_text):
+        parsed = parse_definition_page_html(category, name, html_content)
+        if parsed: answer.update(parsed)
+        elif category == "Tables": answer[name] = [] # What the model says for a table without values (fails validation, as it should)
+    return json.dumps(answer, ensure_ascii=False)
+
+class StandinState:
+    """Run settings plus counters (shared by all handler threads)."""
+    def __init__(self, record_dir=None, latency_ms=0, jitter_ms=0, rate_429=0.0, rate_503=0.0, malformed_rate=0.0, seed=None):
+        self.record_dir = record_dir; self.latency_ms = latency_ms; self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429; self.rate_503 = rate_503; self.malformed_rate = malformed_rate
+        self.random = random.Random(seed); self.lock = threading.Lock()
+        self.counts = {"requests": 0, "recorded": 0, "parser": 0, "429": 0, "503": 0, "malformed": 0}
+
+    def draw(self):
+        """One locked draw per request (keeps a seeded run reproducible for a given request order): (delay_s, fault, cut_fraction)."""
+        with self.lock:
+            self.counts["requests"] += 1
+            delay_s = max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms) / 1000.0) if self.latency_ms or self.jitter_ms else 0.0
+            roll = self.random.random(); cut_fraction = self.random.uniform(0.3, 0.8)
+        if roll < self.rate_429: fault = "429"
+        elif roll < self.rate_429 + self.rate_503: fault = "503"
+        elif roll < self.rate_429 + self.rate_503 + self.malformed_rate: fault = "malformed"
+        else: fault = None
+        return delay_s, fault, cut_fraction
+
+    def count(self, key):
+        with self.lock: self.counts[key] += 1
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Answers generateContent requests like the real API, with injected latency and faults."""
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real client connection
+    state = StandinState()
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.state.lock: self._send_json(200, dict(self.state.counts))
+        else: self._send_json(404, {"error": {"code": 404, "message": f"No route for {self.path}", "status": "NOT_FOUND"}})
+
+    def do_POST(self):
+        request_body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if ":generateContent" not in self.path:
+            self._send_json(404, {"error": {"code": 404, "message": f"No route for {self.path}", "status": "NOT_FOUND"}}); return
+        try:
+            payload = json.loads(request_body)
+            prompt_text = "".join(part.get("text", "") for content in payload.get("contents", []) for part in content.get("parts", []))
+        except (ValueError, AttributeError):
+            self._send_json(400, {"error": {"code": 400, "message": "Invalid JSON payload", "status": "INVALID_ARGUMENT"}}); return
+        json_mode = (payload.get("generationConfig") or {}).get("responseMimeType") == "application/json"
+
+        delay_s, fault, cut_fraction = self.state.draw()
+        if delay_s: time.sleep(delay_s)
+        if fault == "429":
+            self.state.count("429")
+            self._send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).", "status": "RESOURCE_EXHAUSTED"}}); return
+        if fault == "503":
+            self.state.count("503")
+            self._send_json(503, {"error": {"code": 503, "message": "The model is overloaded. Please try again later.", "status": "UNAVAILABLE"}}); return
+
+        answer_text = load_recording(self.state.record_dir, prompt_text) if self.state.record_dir else None
+        if answer_text is not None: self.state.count("recorded")
+        else:
+            answer_text = answer_from_parser(prompt_text); self.state.count("parser")
+            if not json_mode: answer_text = f"```json\n{answer_text}\n```" # Prompt-only JSON usually arrives fenced
+        if fault == "malformed":
+            self.state.count("malformed")
+            answer_text = answer_text[:max(1, int(len(answer_text) * cut_fraction))] # Truncated mid-answer
+        self._send_json(200, {"candidates": [{"content": {"role": "model", "parts": [{"text": answer_text}]}, "finishReason": "STOP"}]})
+
+    def log_message(self, format, *args):
+        pass # Quiet; main4.py logs every request already
+
+def make_standin_server(state=None, host=HOST, port=PORT):
+    """Builds (but does not start) a threaded stand-in server using `state` (settings + counters)."""
+    handler = type("BoundStandinHandler", (StandinHandler,), {"state": state or StandinState()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def start_standin_server(state=None, host=HOST, port=PORT):
+    """Starts the stand-in on a daemon thread. Returns the server (call .shutdown() to stop)."""
+    server = make_standin_server(state, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- Main execution block for standalone running ---
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+    arg_parser = argparse.ArgumentParser(description="Local Gemini stand-in: recorded or HTML-parser answers with injected latency and faults.")
+    arg_parser.add_argument("--record-dir", nargs="?", const=os.path.join(script_dir, RECORD_DIR), default=None,
+                            help="Answer from recordings made with LLM_RECORD_DIR (parser answers for unrecorded prompts)")
+    arg_parser.add_argument("--port", type=int, default=PORT)
+    arg_parser.add_argument("--latency-ms", type=float, default=0, help="Mean answer latency")
+    arg_parser.add_argument("--jitter-ms", type=float, default=0, help="Latency standard deviation")
+    arg_parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered 429 RESOURCE_EXHAUSTED")
+    arg_parser.add_argument("--rate-503", type=float, default=0.0, help="Fraction of requests answered 503 UNAVAILABLE")
+    arg_parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of answers truncated mid-JSON")
+    arg_parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible latency/fault draws")
+    args = arg_parser.parse_args()
+
+    standin_state = StandinState(args.record_dir, args.latency_ms, args.jitter_ms, args.rate_429, args.rate_503, args.malformed_rate, args.seed)
+    server = make_standin_server(standin_state, HOST, args.port)
+    print(f"Gemini stand-in on http://{HOST}:{args.port} (answers: {'recordings, then ' if args.record_dir else ''}HTML parser; "
+          f"latency {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms; 429 {args.rate_429:.0%}, 503 {args.rate_503:.0%}, malformed {args.malformed_rate:.0%})")
+    print(f"Set LLM_BACKEND = \"standin\" and LLM_STANDIN_URL = \"http://{HOST}:{args.port}\" in main4.py to use it.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nStand-in server stopped. {standin_state.counts}")
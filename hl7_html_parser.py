@@ -0,0 +1,230 @@
+import html
+import importlib.util
+import re
+from bs4 import BeautifulSoup, Comment
+
+# lxml is optional; several times faster than html.parser on the ~150 KB Angular pages
+HTML_PARSER_BACKEND = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+# --- Constants (Adjust if the site layout changes) ---
+HL7_VERSION = "2.6" # Ensure this matches the version used in generation
+# Header captions of the definition page tables -> canonical column keys
+DEFINITION_HEADER_KEYS = {
+    "field": "field", "seq": "seq", "sequence": "seq", "description": "desc", "name": "desc", "element name": "desc",
+    "length": "len", "len": "len", "data type": "type", "type": "type", "dt": "type",
+    "optionality": "opt", "opt": "opt", "usage": "opt", "repeatability": "rpt", "repeat": "rpt", "rpt": "rpt",
+    "table": "table", "table id": "table",
+}
+TABLE_HEADER_KEYS = {"value": "value", "code": "value", "description": "desc", "display name": "desc", "label": "desc"}
+# Angular Material column classes (cdk-column-<id>) -> canonical column keys (used when headers are missing)
+DEFINITION_COLUMN_CLASSES = {
+    "positionAndName": "field", "length": "len", "dataType": "type", "usage": "opt", "rpt": "rpt", "tableId": "table",
+}
+TABLE_COLUMN_CLASSES = {"value": "value", "description": "desc"}
+FIELD_PREFIX_PATTERN = re.compile(r"^([A-Z0-9]{2,3}[.\-]\d+)\s*-\s*(.*)$", re.S) # "AD.1 - Street Address" / "PID-1 - Set ID"
+NO_VALUES_MARKER = "There are no suggested values for this table"
+MINIMIZED_KEEP_TAGS = {"h1", "h2", "h3", "h4", "p", "table", "tr", "th", "td", "ul", "ol", "li", "dl", "dt", "dd"}
+
+# --- Row -> Part Rules (shared by every fetch backend: Selenium scrape, HTTP API, offline HTML) ---
+
+def convert_to_camel_case(text):
+    if not text: return "unknownFieldName"
+    text = re.sub(r"^[A-Z0-9]{3}\s*-\s*\d+\s*-\s*", "", text) # Remove PV1-1- type prefixes
+    text = re.sub(r"^[A-Z0-9]{3}\s*-\s*\d+\s*", "", text)    # Remove PV1-1 type prefixes
+    text = text.replace("/", " ")                           # "Date/Time" -> "dateTime", not "datetime"
+    s = re.sub(r"[^a-zA-Z0-9\s]", "", text).strip()          # Keep only letters, numbers, spaces
+    if not s: return "unknownFieldName"
+    s = s.title()                                           # Title Case
+    s = s.replace(" ", "")                                  # Remove spaces
+    return s[0].lower() + s[1:] if s else "unknownFieldName" # camelCase
+
+def is_table_id(text):
+    """True for numeric table IDs like '0004' or '0396.1'."""
+    return bool(text) and (text.isdigit() or (text.count('.') == 1 and all(p.isdigit() for p in text.split('.'))))
+
+def build_definition_part(desc_text, type_text, len_text, opt_text, repeat_text, table_text):
+    """Builds one DataType/Segment part dict from the seven definition-table column texts."""
+    part = {}
+    part['name'] = convert_to_camel_case(desc_text)
+    part['type'] = type_text if type_text else "Unknown"
+    try: part['length'] = int(len_text) if len_text.isdigit() else -1
+    except ValueError: part['length'] = -1
+    if opt_text.upper() in ['R', 'C', 'B']: part['mandatory'] = True # Expanded mandatory flags
+    if repeat_text and '-' not in repeat_text: part['repeats'] = True # Simpler repeats check
+    if is_table_id(table_text): part['table'] = table_text
+    return part
+
+def build_definition_structure(parts_data, overall_length=-1):
+    """Wraps a parts list in the standard DataType/Segment definition structure."""
+    return {
+        "separator": ".",
+        "versions": {
+            HL7_VERSION: {
+                "appliesTo": "equalOrGreater",
+                "totalFields": len(parts_data), # Will be updated later if standard part added
+                "length": overall_length,
+                "parts": parts_data
+            }
+        }
+    }
+
+def add_table_rows_from_matrix(row_matrix, table_data, processed_values, value_col_index=0, desc_col_index=1):
+    """Appends {value, description} dicts for unseen values from a cell-text matrix. Returns the number added."""
+    newly_added = 0
+    for cells in row_matrix:
+        if len(cells) <= desc_col_index: continue
+        value_text = cells[value_col_index]
+        if value_text and value_text not in processed_values:
+            processed_values.add(value_text)
+            table_data.append({"value": value_text, "description": cells[desc_col_index] or ""})
+            newly_added += 1
+    return newly_added
+
+def add_definition_parts_from_matrix(row_matrix, parts_data, processed_row_identifiers):
+    """Appends parts for unseen sequence IDs from 7-column (Seq/Desc/Type/Len/Opt/Repeat/Table) rows. Returns the number added."""
+    newly_added = 0
+    for cells in row_matrix:
+        if len(cells) < 7: continue # Need all columns
+        row_identifier = cells[0]
+        if not row_identifier or row_identifier in processed_row_identifiers: continue
+        processed_row_identifiers.add(row_identifier)
+        parts_data.append(build_definition_part(cells[1], cells[2], cells[3], cells[4].upper(), cells[5].upper(), cells[6]))
+        newly_added += 1
+    return newly_added
+
+# --- HTML Structure Helpers ---
+
+def make_soup(html_content):
+    """Parses page source, dropping scripts/styles/SVG so text extraction only sees content."""
+    soup = BeautifulSoup(html_content, HTML_PARSER_BACKEND)
+    for tag in soup(["script", "style", "noscript", "svg"]): tag.decompose()
+    return soup
+
+def cell_text(cell):
+    """Whitespace-normalised text of a cell (same as the scraper's textContent().trim(), minus inner runs)."""
+    return " ".join(cell.get_text(" ", strip=True).split())
+
+def column_keys(table, header_keys, class_keys):
+    """Canonical key per column index from the <thead> captions, else from cdk-column-* classes of the first row."""
+    headers = [cell_text(th).lower() for th in table.select("thead th")]
+    keys = [header_keys.get(caption) for caption in headers]
+    if any(keys): return keys
+    first_row = table.select_one("tbody > tr")
+    if not first_row: return []
+    keys = []
+    for cell in first_row.find_all("td", recursive=False):
+        column_ids = [c[len("cdk-column-"):] for c in cell.get("class", []) if c.startswith("cdk-column-")]
+        keys.append(next((class_keys[c] for c in column_ids if c in class_keys), None))
+    return keys
+
+def find_data_table(soup, header_keys, class_keys, required_keys):
+    """First <table> whose columns cover `required_keys`. Returns (table, column_keys) or (None, [])."""
+    for table in soup.find_all("table"):
+        keys = column_keys(table, header_keys, class_keys)
+        if required_keys.issubset(set(keys)) or (required_keys == {"field"} and {"seq", "desc"}.issubset(set(keys))):
+            return table, keys
+    return None, []
+
+def data_rows(table, column_count):
+    """Yields the cell texts of each body row that has a full set of columns (skips expanded-detail rows)."""
+    for row in table.select("tbody > tr"):
+        cells = row.find_all("td", recursive=False)
+        if len(cells) < column_count: continue
+        yield [cell_text(cell) for cell in cells]
+
+def split_field_caption(field_text):
+    """'AD.1 - Street Address' -> ('AD.1', 'Street Address'). Captions without a sequence prefix are returned whole."""
+    match = FIELD_PREFIX_PATTERN.match(field_text)
+    return (match.group(1), match.group(2).strip()) if match else (field_text, field_text)
+
+def parse_overall_length(soup):
+    """Overall length from the page's attribute block ('Length' caption + value), or -1."""
+    for caption in soup.find_all("span", string=re.compile(r"^\s*Length:?\s*$")):
+        if caption.find_parent("table"): continue # Column header/expanded detail, not the definition attribute
+        value = caption.find_next_sibling("span")
+        if value and cell_text(value).isdigit(): return int(cell_text(value))
+    for paragraph in soup.find_all("p", string=re.compile(r"^\s*Length:\s*\d+\s*$")): # minimize_definition_html output
+        return int(cell_text(paragraph).split(":")[1])
+    return -1
+
+# --- Page Parsers ---
+
+def extract_table_value_matrix(soup):
+    """Returns [[value, description], ...] from a Table page, or None if no value table is present."""
+    table, keys = find_data_table(soup, TABLE_HEADER_KEYS, TABLE_COLUMN_CLASSES, {"value", "desc"})
+    if not table: return None
+    value_index, desc_index = keys.index("value"), keys.index("desc")
+    return [[cells[value_index], cells[desc_index]] for cells in data_rows(table, max(value_index, desc_index) + 1)]
+
+def extract_definition_matrix(soup):
+    """Returns 7-column [Seq, Desc, Type, Len, Opt, Repeat, Table] rows from a DataType/Segment page, or None."""
+    table, keys = find_data_table(soup, DEFINITION_HEADER_KEYS, DEFINITION_COLUMN_CLASSES, {"field"})
+    if not table: return None
+    index = {}
+    for position, key in enumerate(keys):
+        if key and key not in index: index[key] = position # First column wins if a caption repeats
+    row_matrix = []
+    for cells in data_rows(table, max(index.values()) + 1):
+        if "field" in index: seq_text, desc_text = split_field_caption(cells[index["field"]])
+        else: seq_text, desc_text = cells[index["seq"]], cells[index["desc"]]
+        row_matrix.append([seq_text, desc_text] + [cells[index[key]] if key in index else "" for key in ("type", "len", "opt", "rpt", "table")])
+    return row_matrix
+
+def parse_table_html(html_content, table_id):
+    """Offline equivalent of scrape_table_details. Returns {table_id: [...]} or None if no values were found."""
+    soup = make_soup(html_content)
+    row_matrix = extract_table_value_matrix(soup)
+    table_data = []
+    if row_matrix: add_table_rows_from_matrix(row_matrix, table_data, set())
+    return {str(table_id): table_data} if table_data else None
+
+def parse_definition_html(html_content, definition_name):
+    """Offline equivalent of scrape_segment_or_datatype_details. Returns {name: structure} or None if no parts were found."""
+    soup = make_soup(html_content)
+    row_matrix = extract_definition_matrix(soup)
+    parts_data = []
+    if row_matrix: add_definition_parts_from_matrix(row_matrix, parts_data, set())
+    if not parts_data: return None
+    return {definition_name: build_definition_structure(parts_data, parse_overall_length(soup))}
+
+def parse_definition_page_html(definition_type, definition_name, html_content):
+    """Dispatches on category ('Tables', 'DataTypes', 'Segments'). Returns the parsed dict or None."""
+    if definition_type == "Tables": return parse_table_html(html_content, definition_name)
+    if definition_type in ("DataTypes", "Segments"): return parse_definition_html(html_content, definition_name)
+    return None
+
+def page_has_no_values(html_content):
+    """True for Table pages that state they have no suggested values (nothing for any parser or AI to find)."""
+    return NO_VALUES_MARKER in html_content
+
+# --- Prompt Minimizer (Gemini fallback input) ---
+
+def minimize_definition_html(html_content):
+    """
+    Cuts a definition page down to what the AI needs: the page title, the 'Length' attribute and the
+    definition/value table (header + data rows, expanded-detail rows dropped) as bare <tr>/<td> markup (text re-escaped).
+    Without a recognisable table, returns the <main> content with wrappers, attributes and comments removed.
+    """
+    soup = make_soup(html_content)
+    for tag in soup(["mat-icon", "button", "input", "img", "iframe"]): tag.decompose() # 'expand_more' icons, search box
+    kept = []
+    title = soup.find("title")
+    if title: kept.append(f"<title>{html.escape(cell_text(title))}</title>")
+    overall_length = parse_overall_length(soup)
+    if overall_length >= 0: kept.append(f"<p>Length: {overall_length}</p>")
+    table, keys = find_data_table(soup, DEFINITION_HEADER_KEYS, DEFINITION_COLUMN_CLASSES, {"field"})
+    if not table: table, keys = find_data_table(soup, TABLE_HEADER_KEYS, TABLE_COLUMN_CLASSES, {"value", "desc"})
+    if table:
+        column_count = max(position for position, key in enumerate(keys) if key) + 1 # Drops the trailing expand-icon column
+        header = "<tr>" + "".join(f"<th>{html.escape(cell_text(th))}</th>" for th in table.select("thead th")[:column_count]) + "</tr>"
+        rows = ["<tr>" + "".join(f"<td>{html.escape(text)}</td>" for text in cells[:column_count]) + "</tr>" for cells in data_rows(table, column_count)]
+        kept.append(f"<table><thead>{header}</thead><tbody>{''.join(rows)}</tbody></table>")
+    else:
+        content = soup.find("main") or soup.body or soup
+        for tag in content(["nav", "header", "footer", "aside", "app-search"]): tag.decompose()
+        for comment in content.find_all(string=lambda text: isinstance(text, Comment)): comment.extract()
+        for tag in content.find_all(True):
+            if tag.name in MINIMIZED_KEEP_TAGS: tag.attrs = {}
+            else: tag.unwrap() # div/span/app-*/mat-* wrappers carry no content of their own
+        kept.append(re.sub(r"\s*(<[^>]+>)\s*", r"\1", " ".join(content.decode_contents().split())))
+    return "\n".join(kept)
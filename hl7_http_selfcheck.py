@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+
+import main4
+from hl7_http_standin import CATEGORIES, HOST, start_standin_server
+
+# --- Constants (Sample responses in the documented API shape) ---
+# Runs main4.py's HTTP fetch backend against hl7_http_standin.py, offline. Without --capture-dir the stand-in
+# replays the samples below and the converted results are compared with EXPECTED_RESULTS.
+API_PATH = "/v2-api/1/HL7v2.6" # Same path prefix as main4.API_BASE_URL; the stand-in only looks at the last parts
+SAMPLE_RESPONSES = {
+    ("Tables", "index"): [{"Id": "0001", "Name": "Administrative Sex"}, {"Id": "0002", "Name": "Marital Status"}, {"Id": "Bogus"}],
+    ("Tables", "0001"): {"Id": "0001", "Name": "Administrative Sex", "Entries": [
+        {"Value": "F", "Description": "Female"}, {"Value": "M", "Description": "Male"}, {"Value": "F", "Description": "Duplicate"}]},
+    ("Tables", "0002"): {"Id": "0002", "Name": "Marital Status", "Entries": [{"Value": "A"}]}, # No Description: must be rejected
+    ("DataTypes", "index"): [{"Id": "CX", "Name": "Extended Composite ID with Check Digit"}],
+    ("DataTypes", "CX"): {"Id": "CX", "Length": 1913, "Fields": [
+        {"Name": "ID Number", "DataType": "ST", "Length": 15, "Usage": "R", "Rpt": "1", "TableId": None},
+        {"Name": "Identifier Check Digit", "DataType": "ST", "Length": 1, "Usage": "O", "Rpt": "1", "TableId": None}]},
+    ("Segments", "index"): [{"Id": "PID", "Name": "Patient Identification"}],
+    ("Segments", "PID"): {"Id": "PID", "Fields": [
+        {"Name": "Set ID - PID", "DataType": "SI", "Length": 4, "Usage": "O", "Rpt": "1", "TableId": None},
+        {"Name": "Patient Identifier List", "DataType": "CX", "Length": 250, "Usage": "R", "Rpt": "*", "TableId": None},
+        {"Name": "Administrative Sex", "DataType": "IS", "Length": 1, "Usage": "O", "Rpt": "1", "TableId": 1}]},
+}
+EXPECTED_LISTS = {"Tables": ["0001", "0002"], "DataTypes": ["CX"], "Segments": ["PID"]}
+EXPECTED_RESULTS = {
+    ("Tables", "0001"): {"0001": [{"value": "F", "description": "Female"}, {"value": "M", "description": "Male"}]},
+    ("Tables", "0002"): None,
+    ("Tables", "0003"): None, # Not captured: 404
+    ("DataTypes", "CX"): {"CX": {"separator": ".", "versions": {"2.6": {"appliesTo": "equalOrGreater", "totalFields": 2, "length": 1913, "parts": [
+        {"name": "idNumber", "type": "ST", "length": 15, "mandatory": True},
+        {"name": "identifierCheckDigit", "type": "ST", "length": 1}]}}}},
+    ("Segments", "PID"): {"PID": {"separator": ".", "versions": {"2.6": {"appliesTo": "equalOrGreater", "totalFields": 3, "length": -1, "parts": [
+        {"name": "setIdPid", "type": "SI", "length": 4},
+        {"name": "patientIdentifierList", "type": "CX", "length": 250, "mandatory": True, "repeats": True},
+        {"name": "administrativeSex", "type": "IS", "length": 1, "table": "0001"}]}}}},
+}
+EXPECTED_ERRORS = {("Tables", "0002")} # Fetches that must log an 'error' (shape mismatch) rather than a plain warning
+
+# --- Helper Functions ---
+
+class RecordingQueue:
+    """Stands in for the GUI status queue and keeps every (level, message) pair."""
+    def __init__(self): self.items = []
+    def put(self, item): self.items.append(item)
+    def levels(self): return {level for level, _ in self.items}
+
+def write_samples(capture_dir):
+    """Writes SAMPLE_RESPONSES in the <Category>/<Name>.json layout hl7_http_standin.py replays."""
+    for (category, name), payload in SAMPLE_RESPONSES.items():
+        os.makedirs(os.path.join(capture_dir, category), exist_ok=True)
+        with open(os.path.join(capture_dir, category, f"{name}.json"), 'w', encoding='utf-8') as f: json.dump(payload, f)
+
+def check_samples(stop_event):
+    """Fetches every sample through the stand-in and compares with the expected results. Returns failure messages."""
+    failures = []
+    for category, expected_names in EXPECTED_LISTS.items():
+        names = main4.get_definition_list_http(category, RecordingQueue(), stop_event)
+        if names != expected_names: failures.append(f"{category} list: got {names}, expected {expected_names}")
+    for (category, name), expected in EXPECTED_RESULTS.items():
+        status_queue = RecordingQueue()
+        result = main4.fetch_definition_via_http(category, name, status_queue, stop_event)
+        if result != expected: failures.append(f"{category}/{name}: got {json.dumps(result)}, expected {json.dumps(expected)}")
+        logged_error = 'error' in status_queue.levels()
+        if logged_error != ((category, name) in EXPECTED_ERRORS): failures.append(f"{category}/{name}: unexpected log levels {sorted(status_queue.levels())}")
+    return failures
+
+def check_captures(capture_dir, stop_event):
+    """Fetches every captured list and definition through the stand-in. Returns failure messages for shape errors."""
+    failures = []; converted = 0
+    for category in CATEGORIES:
+        category_dir = os.path.join(capture_dir, category)
+        if not os.path.isdir(category_dir): continue
+        names = [file_name[:-5] for file_name in sorted(os.listdir(category_dir)) if file_name.endswith(".json") and file_name != "index.json"]
+        if os.path.isfile(os.path.join(category_dir, "index.json")):
+            status_queue = RecordingQueue()
+            if not main4.get_definition_list_http(category, status_queue, stop_event): failures.append(f"{category} list: {status_queue.items}")
+        for name in names:
+            status_queue = RecordingQueue()
+            if main4.fetch_definition_via_http(category, name, status_queue, stop_event): converted += 1
+            elif 'error' in status_queue.levels(): failures.append(f"{category}/{name}: {status_queue.items[-1][1]}")
+    print(f"Converted {converted} captured definitions.")
+    return failures
+
+# --- Main execution block for standalone running ---
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Offline check of the HTTP fetch backend against the local API stand-in.")
+    arg_parser.add_argument("--capture-dir", default=None, help="Check real captures (HTTP_CAPTURE_DIR) instead of the built-in samples")
+    args = arg_parser.parse_args()
+
+    main4.HTTP_CAPTURE_DIR = None # Never re-record what the stand-in replays
+    stop_event = threading.Event()
+    with tempfile.TemporaryDirectory() as sample_dir:
+        capture_dir = args.capture_dir
+        if capture_dir is None: write_samples(sample_dir); capture_dir = sample_dir
+        elif not os.path.isdir(capture_dir): print(f"Error: Capture directory not found: {capture_dir}"); sys.exit(1)
+        server = start_standin_server(capture_dir, HOST, 0) # Port 0: any free port
+        main4.API_BASE_URL = f"http://{HOST}:{server.server_address[1]}{API_PATH}"
+        try: failures = check_captures(capture_dir, stop_event) if args.capture_dir else check_samples(stop_event)
+        finally: server.shutdown()
+
+    for failure in failures: print(f"FAIL: {failure}")
+    print("HTTP backend self-check " + (f"failed ({len(failures)} problems)." if failures else "passed."))
+    sys.exit(1 if failures else 0)
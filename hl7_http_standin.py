@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Constants (Adjust if your capture folder differs) ---
+# Replays API responses recorded by main4.py when HTTP_CAPTURE_DIR is set.
+# Layout: <CAPTURE_DIR>/<Category>/<Name>.json and <CAPTURE_DIR>/<Category>/index.json (category list).
+# Bodies are replayed as captured; main4.py expects the shape documented above its convert_api_* functions
+# (hl7_http_selfcheck.py checks sample or captured responses against it).
+CAPTURE_DIR = "http_capture"
+HOST = "127.0.0.1"
+PORT = 8765
+CATEGORIES = ("Tables", "DataTypes", "Segments")
+
+# --- Helper Functions ---
+
+def resolve_capture_path(capture_dir, request_path):
+    """Maps '/.../<Category>' or '/.../<Category>/<Name>' onto a captured JSON file path (or None)."""
+    parts = [p for p in request_path.split("?")[0].split("/") if p]
+    if not parts: return None
+    if parts[-1] in CATEGORIES: category, name = parts[-1], "index"
+    elif len(parts) >= 2 and parts[-2] in CATEGORIES: category, name = parts[-2], parts[-1]
+    else: return None
+    if os.sep in name or name in (".", ".."): return None # No path traversal out of the capture folder
+    return os.path.join(capture_dir, category, f"{name}.json")
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Serves captured JSON responses with keep-alive, like the real API."""
+    protocol_version = "HTTP/1.1" # Keep-alive so the client's connection pool is exercised
+    capture_dir = CAPTURE_DIR
+
+    def do_GET(self):
+        file_path = resolve_capture_path(self.capture_dir, self.path)
+        if not file_path or not os.path.isfile(file_path):
+            body = json.dumps({"error": f"No capture for {self.path}"}).encode("utf-8")
+            self.send_response(404)
+        else:
+            with open(file_path, "rb") as f: body = f.read()
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Quiet; main4.py logs every fetch already
+
+def make_standin_server(capture_dir=CAPTURE_DIR, host=HOST, port=PORT):
+    """Builds (but does not start) a threaded replay server bound to `capture_dir`."""
+    handler = type("BoundReplayHandler", (ReplayHandler,), {"capture_dir": capture_dir})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def start_standin_server(capture_dir=CAPTURE_DIR, host=HOST, port=PORT):
+    """Starts the replay server on a daemon thread. Returns the server (call .shutdown() to stop)."""
+    server = make_standin_server(capture_dir, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- Main execution block for standalone running ---
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+    capture_path = os.path.join(script_dir, sys.argv[1] if len(sys.argv) > 1 else CAPTURE_DIR)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else PORT
+    if not os.path.isdir(capture_path):
+        print(f"Error: Capture directory not found: {capture_path}")
+        sys.exit(1)
+    server = make_standin_server(capture_path, HOST, port)
+    print(f"Replaying captures from {capture_path} on http://{HOST}:{port}")
+    print(f"Set API_BASE_URL = \"http://{HOST}:{port}\" and FETCH_BACKEND = \"http\" in main4.py to use it.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStand-in server stopped.")
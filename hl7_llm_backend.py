@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import threading
+
+import requests
+import google.api_core.exceptions
+
+# --- Constants (Adjust if your stand-in runs elsewhere) ---
+# Backends return an object with generate_content(prompt_text, generation_config=None) -> response with .text,
+# raising google.api_core.exceptions on API errors, so main4.py's retry/backoff code works unchanged with any of them.
+STANDIN_URL = "http://127.0.0.1:8766"
+REQUEST_TIMEOUT = 120 # Seconds per stand-in request (injected latency included)
+STATUS_ERRORS = { # The exceptions google.generativeai raises for these statuses (429 is ResourceExhausted, not TooManyRequests)
+    429: google.api_core.exceptions.ResourceExhausted, 500: google.api_core.exceptions.InternalServerError,
+    503: google.api_core.exceptions.ServiceUnavailable, 504: google.api_core.exceptions.GatewayTimeout,
+}
+RECORD_DIR = "llm_recordings" # Layout: <RECORD_DIR>/<ab>/<sha256 of prompt>.json  {"model", "prompt_chars", "text"}
+
+# --- Recording (real answers, replayed by hl7_gemini_standin.py) ---
+
+def recording_path(record_dir, prompt_text):
+    digest = hashlib.sha256(prompt_text.encode("utf-8")).hexdigest()
+    return os.path.join(record_dir, digest[:2], f"{digest}.json")
+
+def record_response(record_dir, model_name, prompt_text, response_text):
+    """Saves one prompt -> answer text pair for offline replay."""
+    file_path = recording_path(record_dir, prompt_text)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "prompt_chars": len(prompt_text), "text": response_text}, f, ensure_ascii=False)
+
+def load_recording(record_dir, prompt_text):
+    """Recorded answer text for exactly this prompt, or None."""
+    try:
+        with open(recording_path(record_dir, prompt_text), "r", encoding="utf-8") as f: return json.load(f).get("text")
+    except (OSError, ValueError):
+        return None
+
+# --- Backends ---
+
+class LLMResponse:
+    """The part of a google.generativeai response main4.py uses."""
+    def __init__(self, text):
+        self.text = text
+
+class StandinModel:
+    """GenerativeModel look-alike for hl7_gemini_standin.py. Speaks the Gemini REST generateContent request/response shape."""
+    def __init__(self, model_name, base_url=STANDIN_URL, timeout=REQUEST_TIMEOUT):
+        self.model_name = model_name
+        self.url = f"{base_url.rstrip('/')}/v1beta/models/{model_name}:generateContent"
+        self.timeout = timeout
+        self._local = threading.local() # One keep-alive session per calling thread
+
+    def generate_content(self, prompt_text, generation_config=None):
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt_text}]}]}
+        if generation_config: # REST field names are camelCase
+            body["generationConfig"] = {"responseMimeType": generation_config.get("response_mime_type"),
+                                        "responseSchema": generation_config.get("response_schema")}
+        session = getattr(self._local, "session", None)
+        if session is None: session = self._local.session = requests.Session()
+        try:
+            response = session.post(self.url, json=body, timeout=self.timeout)
+        except requests.Timeout as e:
+            raise google.api_core.exceptions.GatewayTimeout(f"Stand-in timed out: {e}")
+        except requests.ConnectionError as e:
+            raise google.api_core.exceptions.ServiceUnavailable(f"Stand-in unreachable at {self.url}: {e}")
+        if response.status_code >= 400:
+            error_class = STATUS_ERRORS.get(response.status_code)
+            if error_class: raise error_class(response.text[:300])
+            raise google.api_core.exceptions.from_http_status(response.status_code, response.text[:300])
+        parts = response.json()["candidates"][0]["content"]["parts"]
+        return LLMResponse("".join(part.get("text", "") for part in parts))
+
+def make_gemini_model(model_name, api_key=None, **_):
+    import google.generativeai as genai # Only needed for the real API
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+def make_standin_model(model_name, standin_url=STANDIN_URL, **_):
+    return StandinModel(model_name, standin_url or STANDIN_URL)
+
+LLM_BACKENDS = {"gemini": make_gemini_model, "standin": make_standin_model} # Name -> factory(model_name, **options)
+BACKENDS_NEEDING_API_KEY = {"gemini"}
+
+def make_llm_model(backend, model_name, **options):
+    """Builds the model object for a backend name from LLM_BACKENDS (options: api_key, standin_url)."""
+    if backend not in LLM_BACKENDS: raise ValueError(f"Unknown LLM backend '{backend}' (choose from {', '.join(LLM_BACKENDS)})")
+    return LLM_BACKENDS[backend](model_name, **options)
@@ -0,0 +1,438 @@
+import json
+import os
+from collections.abc import Mapping
+
+# --- Constants (Adjust if your definitions file differs) ---
+# Parses ER7 ("pipe and hat") messages into named dicts using the layouts in hl7_definitions_v2.6.json.
+# The definitions are compiled once (MessageParser) into per-segment field plans; parse() then only splits strings.
+DEFINITIONS_FILE = "hl7_definitions_v2.6.json"
+HL7_VERSION = "2.6" # Ensure this matches the version used in generation
+SEGMENT_NAME_PART = "hl7SegmentName" # Field 0 of every segment layout (finalize_definitions also prepends it to 3-letter data types)
+DEFAULT_ENCODING_CHARACTERS = "^~\\&" # Component, repetition, escape, sub-component (MSH-2)
+ESCAPE_SEQUENCES = ("F", "S", "T", "R", "E") # \F\ \S\ \T\ \R\ \E\ -> the message's own delimiters; others (\H\, \X..\) stay as-is
+
+# --- Helper Functions ---
+
+def load_definitions(file_path=DEFINITIONS_FILE):
+    with open(file_path, "r", encoding="utf-8") as f: return json.load(f)
+
+def version_parts(definition, version=HL7_VERSION):
+    """The `parts` list of one definition for `version` (falls back to its first listed version), or []."""
+    versions = (definition or {}).get("versions") or {}
+    version_data = versions.get(version) or next(iter(versions.values()), None)
+    return list(version_data.get("parts") or []) if isinstance(version_data, dict) else []
+
+def type_parts(data_types, type_name, version=HL7_VERSION):
+    """Component parts of a data type (leading hl7SegmentName dropped); [] for primitive or unknown types."""
+    parts = version_parts(data_types.get(type_name), version)
+    if parts and parts[0].get("name") == SEGMENT_NAME_PART: parts = parts[1:]
+    if len(parts) < 2 or any(part.get("type") == type_name for part in parts): return [] # One part (NM -> numeric) or self-referencing (scraped DTM) = primitive
+    return parts
+
+def unescape(value, escape_char, delimiters):
+    """Replaces \\F\\ \\S\\ \\T\\ \\R\\ \\E\\ with the message's delimiters. `delimiters` maps F/S/T/R/E to characters."""
+    pieces = value.split(escape_char)
+    out = [pieces[0]]
+    for i in range(1, len(pieces) - 1, 2):
+        code = pieces[i]
+        out.append(delimiters[code] if code in delimiters else f"{escape_char}{code}{escape_char}")
+        out.append(pieces[i + 1])
+    if len(pieces) % 2 == 0: out.append(escape_char + pieces[-1]) # Unmatched escape character stays literal
+    return "".join(out)
+
+class FieldDescriptor:
+    """One compiled `parts` entry: name, type, repeats, table and length, plus the descriptors of its components."""
+    __slots__ = ("name", "type", "repeats", "table", "length", "mandatory", "components")
+
+    def __init__(self, part, components=()):
+        self.name = part.get("name") or ""; self.type = part.get("type"); self.repeats = bool(part.get("repeats"))
+        self.table = part.get("table"); self.length = part.get("length", -1); self.mandatory = bool(part.get("mandatory"))
+        self.components = tuple(components)
+
+    def __repr__(self):
+        return f"FieldDescriptor({self.name!r}, {self.type!r}, repeats={self.repeats}, components={len(self.components)})"
+
+class SegmentLayout:
+    """
+    Compiled layout of one segment: `fields[i]` describes field i (field 0 is the segment name).
+    `plan` is the same information as plain tuples for the parse loop:
+    (name, repeats, components) with components = None (primitive) or ((name, sub_names or None), ...);
+    plan[0] has name None so the loop skips the segment id. `index` / `component_index` map names to positions for lazy views.
+    """
+    def __init__(self, segment_id, key, repeats, fields):
+        self.segment_id = segment_id; self.key = key; self.repeats = repeats
+        self.fields = tuple(fields)
+        self.plan = ((None, False, None),) + tuple((field.name, field.repeats, self._component_plan(field)) for field in self.fields[1:])
+        self.index = {}
+        for position, field in enumerate(self.fields[1:], 1): self.index.setdefault(field.name, position)
+        self.component_index = tuple({name: position for position, (name, _) in reversed(list(enumerate(components)))} if components else None
+                                     for _, _, components in self.plan)
+
+    @staticmethod
+    def _component_plan(field):
+        if not field.components: return None
+        return tuple((component.name, tuple(sub.name for sub in component.components) or None) for component in field.components)
+
+def _position_from_name(name, prefix):
+    """Position for generated names like "field12" / "component3" (parts beyond the definition), else None."""
+    if name.startswith(prefix) and name[len(prefix):].isdigit(): return int(name[len(prefix):])
+    return None
+
+def _decode_sub_components(component, sub_names, encoding):
+    esc, sub_sep, delimiters = encoding[3], encoding[4], encoding[5]
+    sub_item = {}; sub_count = len(sub_names)
+    for sub_position, sub_value in enumerate(component.split(sub_sep)):
+        if not sub_value: continue
+        sub_item[sub_names[sub_position] if sub_position < sub_count else f"subComponent{sub_position + 1}"] = unescape(sub_value, esc, delimiters) if esc in sub_value else sub_value
+    return sub_item
+
+def materialize(value):
+    """Plain dicts/lists/strings for a lazy view (the same structure MessageParser.parse returns)."""
+    if isinstance(value, str): return value # Most values; checked first because the Mapping ABC check is slow
+    if isinstance(value, list): return [materialize(item) for item in value]
+    return {name: materialize(item) for name, item in value.items()}
+
+class LazyComponents(Mapping):
+    """A composite field value, split into components on first access; view[component name] -> str or sub-component dict."""
+    __slots__ = ("_value", "_components", "_component_index", "_encoding", "_values")
+
+    def __init__(self, value, components, component_index, encoding):
+        self._value = value; self._components = components; self._component_index = component_index; self._encoding = encoding
+        self._values = None
+
+    def _split(self):
+        if self._values is None: self._values = self._value.split(self._encoding[1])
+        return self._values
+
+    def _decode(self, position):
+        values = self._split()
+        component = values[position] if position < len(values) else ""
+        if not component: return None
+        sub_names = self._components[position][1] if position < len(self._components) else None
+        if sub_names is None:
+            esc = self._encoding[3]
+            return unescape(component, esc, self._encoding[5]) if esc in component else component
+        return _decode_sub_components(component, sub_names, self._encoding)
+
+    def _name(self, position):
+        return self._components[position][0] if position < len(self._components) else f"component{position + 1}"
+
+    def get(self, name, default=None):
+        position = self._component_index.get(name)
+        if position is None:
+            position = _position_from_name(name, "component")
+            position = position - 1 if position and position > len(self._components) else None
+        value = self._decode(position) if position is not None else None
+        return default if value is None else value
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None: raise KeyError(name)
+        return value
+
+    def values(self):
+        return [self._decode(position) for position, component in enumerate(self._split()) if component]
+
+    def items(self):
+        return [(self._name(position), self._decode(position)) for position, component in enumerate(self._split()) if component]
+
+    def __iter__(self):
+        return (self._name(position) for position, component in enumerate(self._split()) if component)
+
+    def __len__(self):
+        return sum(1 for component in self._split() if component)
+
+    @property
+    def raw(self):
+        return self._value
+
+    def to_dict(self):
+        return materialize(self)
+
+    def __repr__(self):
+        return f"LazyComponents({self._value!r})"
+
+class SegmentView(Mapping):
+    """
+    One segment of a LazyMessage, split into fields on the first read (unread segments are never split).
+    view[field name] -> str (primitive), LazyComponents (composite) or a list of those (repeating field).
+    """
+    __slots__ = ("_segment", "_layout", "_encoding", "_fields")
+
+    def __init__(self, segment, layout, encoding):
+        self._segment = segment; self._layout = layout; self._encoding = encoding
+        self._fields = None
+
+    @property
+    def segment_id(self):
+        return self._layout.segment_id
+
+    def _split(self):
+        if self._fields is None:
+            self._fields = self._segment.split(self._encoding[0])
+            if self._layout.segment_id == "MSH": self._fields.insert(1, self._encoding[0]) # MSH-1 is the field separator itself
+        return self._fields
+
+    def raw_field(self, index):
+        """Undecoded text of field `index` ("" if empty or absent)."""
+        fields = self._fields if self._fields is not None else self._split()
+        return fields[index] if index < len(fields) else ""
+
+    def leaf(self, index, component=None, sub_component=None):
+        """
+        Text at field `index` (first repetition) and 0-based component / sub-component positions, escape sequences
+        decoded, or None if empty. A composite addressed as a whole is returned as its undecoded ER7 text.
+        """
+        value = self.raw_field(index)
+        if not value: return None
+        plan = self._layout.plan; encoding = self._encoding
+        _, repeats, components = plan[index] if index < len(plan) else (None, False, None)
+        if repeats: value = value.split(encoding[2], 1)[0]
+        if component is not None:
+            pieces = value.split(encoding[1])
+            value = pieces[component] if component < len(pieces) else ""
+            components = (components[component][1] if components and component < len(components) else None) # Sub-component names
+            if sub_component is not None:
+                pieces = value.split(encoding[4])
+                value = pieces[sub_component] if sub_component < len(pieces) else ""; components = None
+        if not value: return None
+        if components is not None: return value
+        esc = encoding[3]
+        return unescape(value, esc, encoding[5]) if esc in value else value
+
+    def _decode(self, index, value):
+        plan = self._layout.plan
+        name, repeats, components = plan[index] if index < len(plan) else (None, False, None)
+        encoding = self._encoding; esc = encoding[3]
+        if components is None and not repeats: return unescape(value, esc, encoding[5]) if esc in value else value
+        component_index = self._layout.component_index[index]
+        decoded = []
+        for repetition in (value.split(encoding[2]) if repeats else (value,)):
+            if components is None: decoded.append(unescape(repetition, esc, encoding[5]) if esc in repetition else repetition)
+            else: decoded.append(LazyComponents(repetition, components, component_index, encoding))
+        return decoded if repeats else decoded[0]
+
+    def _index(self, name):
+        index = self._layout.index.get(name)
+        if index is None:
+            index = _position_from_name(name, "field")
+            if index is not None and index < len(self._layout.plan): index = None
+        return index
+
+    def get(self, name, default=None):
+        index = self._index(name)
+        value = self.raw_field(index) if index is not None else None
+        return self._decode(index, value) if value else default
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None: raise KeyError(name)
+        return value
+
+    def _name(self, index):
+        plan = self._layout.plan
+        return plan[index][0] if index < len(plan) else f"field{index}"
+
+    def items(self):
+        return [(self._name(index), self._decode(index, value)) for index, value in enumerate(self._split()) if index and value]
+
+    def __iter__(self):
+        return (self._name(index) for index, value in enumerate(self._split()) if index and value)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        return materialize(self)
+
+    def __repr__(self):
+        return f"SegmentView({self._segment!r})"
+
+class LazyMessage(Mapping):
+    """
+    A message split into segment strings (one C-level split) and indexed by segment id; nothing below the
+    segment is split or decoded until it is read. message[segment key] has the same shape as in
+    MessageParser.parse (a SegmentView, or a list of them if the segment repeats).
+    """
+    __slots__ = ("_parser", "_encoding", "_segments", "_ids", "_views")
+
+    def __init__(self, parser, text):
+        separator = parser.segment_separator
+        if "\n" in text and separator != "\n": text = text.replace("\r\n", separator).replace("\n", separator)
+        self._segments = text.split(separator)
+        self._ids = [segment[:3] for segment in self._segments] # HL7 segment ids are three characters
+        first = 0
+        while first < len(self._ids) and not self._ids[first]: first += 1
+        if first == len(self._ids) or self._ids[first] != "MSH": raise ValueError("HL7 message must start with an MSH segment")
+        field_sep, comp_sep, rep_sep, esc, sub_sep = parser.encoding(self._segments[first])
+        self._encoding = (field_sep, comp_sep, rep_sep, esc, sub_sep, dict(zip(ESCAPE_SEQUENCES, (field_sep, comp_sep, sub_sep, rep_sep, esc))))
+        self._parser = parser; self._views = {}
+
+    def get(self, key, default=None):
+        view = self._views.get(key)
+        if view is not None: return view
+        segment_id = self._parser.segment_id_for_key(key)
+        if segment_id not in self._ids: # C-level scan; unknown ids keep their case, so their key is not always id.upper()
+            segment_id = next((id_ for id_ in self._ids if id_ and id_.lower() == key), None)
+            if segment_id is None: return default
+        layout = self._parser.layout(segment_id)
+        if layout.key != key: return default
+        if not layout.repeats:
+            view = SegmentView(self._segments[self._ids.index(segment_id)], layout, self._encoding)
+        else:
+            view = [SegmentView(segment, layout, self._encoding) for segment, id_ in zip(self._segments, self._ids) if id_ == segment_id]
+        self._views[key] = view
+        return view
+
+    def __getitem__(self, key):
+        view = self.get(key)
+        if view is None: raise KeyError(key)
+        return view
+
+    def __iter__(self):
+        layout = self._parser.layout
+        return (layout(segment_id).key for segment_id in dict.fromkeys(self._ids) if segment_id)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        return materialize(self)
+
+class MessageParser:
+    """
+    Definition-driven ER7 parser. Compile once, then parse(message) -> {segment key: segment dict (or list if it repeats)}.
+    Segment dicts map field names to a string (primitive), a dict of components (composite; sub-components nest
+    one more level) or a list of those (repeating field). Empty fields are omitted. Segments missing from the
+    definitions (e.g. Z-segments) keep their unsplit (unescaped) field strings under "field1", "field2", ...
+    """
+    def __init__(self, definitions, version=HL7_VERSION):
+        self.version = version
+        self._data_types = definitions.get("dataTypes") or {}
+        message_definition = definitions.get("HL7") or self._data_types.get("HL7") # The reference file keeps it under dataTypes
+        self._message_parts = {part.get("type"): part for part in version_parts(message_definition, version) if part.get("type")}
+        self.segment_separator = (message_definition or {}).get("separator") or "\r"
+        self._layouts = {}
+        for segment_id, definition in self._data_types.items():
+            parts = version_parts(definition, version)
+            if parts and parts[0].get("name") == SEGMENT_NAME_PART and (segment_id in self._message_parts or definition.get("_original_type") == "Segments"):
+                self._layouts[segment_id] = self._compile_segment(segment_id, parts)
+        self._ids_by_key = {layout.key: segment_id for segment_id, layout in self._layouts.items()}
+        self.defined_segments = frozenset(self._layouts) # Ids with a compiled layout (layout() also serves unknown ones)
+
+    @classmethod
+    def from_file(cls, file_path=DEFINITIONS_FILE, version=HL7_VERSION):
+        return cls(load_definitions(file_path), version)
+
+    def _compile_type(self, type_name, depth):
+        """Component descriptors of a data type, `depth` levels deep (2 = components with their sub-components)."""
+        if depth <= 0: return ()
+        return tuple(FieldDescriptor(part, self._compile_type(part.get("type"), depth - 1))
+                     for part in type_parts(self._data_types, type_name, self.version))
+
+    def _compile_segment(self, segment_id, parts):
+        fields = [FieldDescriptor(part, self._compile_type(part.get("type"), 2) if index else ()) for index, part in enumerate(parts)]
+        if segment_id == "MSH": # MSH-1 is the field separator itself and MSH-2 the encoding characters: never split either
+            if len(fields) > 1 and fields[1].name != "fieldSeparator": # Older layouts start at encodingCharacters
+                fields.insert(1, FieldDescriptor({"name": "fieldSeparator", "type": "ST", "length": 1, "mandatory": True}))
+            for index in (1, 2):
+                if index < len(fields): fields[index].components = (); fields[index].repeats = False
+        message_part = self._message_parts.get(segment_id) or {}
+        return SegmentLayout(segment_id, message_part.get("name") or segment_id.lower(), message_part.get("repeats", segment_id != "MSH"), fields)
+
+    def segment_id_for_key(self, key):
+        """Segment id for a result key ("pid" -> "PID"); unknown keys are taken to be the lower-cased id."""
+        return self._ids_by_key.get(key) or key.upper()
+
+    def layout(self, segment_id):
+        """
+        Compiled layout for a segment id (an empty layout for unknown segments). Only well-formed unknown ids
+        (3 alphanumerics, e.g. Z-segments) are cached, so junk lines in a stream cannot grow the cache.
+        """
+        layout = self._layouts.get(segment_id)
+        if layout is None:
+            layout = SegmentLayout(segment_id, segment_id.lower(), True, [FieldDescriptor({"name": SEGMENT_NAME_PART, "type": "ST"})])
+            if len(segment_id) == 3 and segment_id.isalnum(): self._layouts[segment_id] = layout
+        return layout
+
+    def segments(self, message):
+        """Splits a message into segment strings (accepts \\r, \\n or \\r\\n between segments)."""
+        separator = self.segment_separator
+        if "\n" in message and separator != "\n": message = message.replace("\r\n", separator).replace("\n", separator)
+        return [segment for segment in message.split(separator) if segment]
+
+    @staticmethod
+    def encoding(msh_segment):
+        """(field, component, repetition, escape, sub-component) separators read from an MSH segment."""
+        field_sep = msh_segment[3] if len(msh_segment) > 3 else "|"
+        end = msh_segment.find(field_sep, 4)
+        encoding_chars = msh_segment[4:end] if end > 0 else msh_segment[4:]
+        encoding_chars = (encoding_chars + DEFAULT_ENCODING_CHARACTERS[len(encoding_chars):])[:4]
+        return field_sep, encoding_chars[0], encoding_chars[1], encoding_chars[2], encoding_chars[3]
+
+    def parse_lazy(self, message):
+        """
+        Indexes one ER7 message without decoding it: fields, repetitions and components are split only when read.
+        Much faster than parse() when only a few fields are used (routing). Raises ValueError if there is no leading MSH.
+        """
+        return LazyMessage(self, message)
+
+    def parse(self, message):
+        """Parses one ER7 message. Raises ValueError if it does not start with an MSH segment."""
+        segment_strings = self.segments(message)
+        if not segment_strings or not segment_strings[0].startswith("MSH"): raise ValueError("HL7 message must start with an MSH segment")
+        field_sep, comp_sep, rep_sep, esc, sub_sep = self.encoding(segment_strings[0])
+        delimiters = dict(zip(ESCAPE_SEQUENCES, (field_sep, comp_sep, sub_sep, rep_sep, esc)))
+        result = {}; layouts = self._layouts
+        for segment in segment_strings:
+            fields = segment.split(field_sep)
+            segment_id = segment[:3] # HL7 segment ids are three characters (as in LazyMessage)
+            if segment_id == "MSH": fields.insert(1, field_sep) # MSH-1 is the separator the split consumed
+            layout = layouts.get(segment_id) or self.layout(segment_id)
+            parsed = self._parse_fields(layout.plan, fields, comp_sep, rep_sep, sub_sep, esc if esc and esc in segment else None, delimiters)
+            if layout.repeats: result.setdefault(layout.key, []).append(parsed)
+            else: result.setdefault(layout.key, parsed) # A non-repeating segment keeps its first occurrence
+        return result
+
+    @staticmethod
+    def _parse_fields(plan, fields, comp_sep, rep_sep, sub_sep, esc, delimiters):
+        parsed = {}
+        for (name, repeats, components), value in zip(plan, fields): # plan[0] (segment id) has name None
+            if not value or name is None: continue
+            if components is None and not repeats: # Primitive (and MSH-1/MSH-2): no splitting at all
+                parsed[name] = unescape(value, esc, delimiters) if esc and esc in value else value
+                continue
+            decoded = []
+            for repetition in (value.split(rep_sep) if repeats else (value,)):
+                if components is None:
+                    decoded.append(unescape(repetition, esc, delimiters) if esc and esc in repetition else repetition); continue
+                item = {}; component_values = repetition.split(comp_sep)
+                for (component_name, sub_names), component in zip(components, component_values):
+                    if not component: continue
+                    if sub_names is None or sub_sep not in component:
+                        if sub_names is not None: item[component_name] = {sub_names[0]: unescape(component, esc, delimiters) if esc and esc in component else component}
+                        else: item[component_name] = unescape(component, esc, delimiters) if esc and esc in component else component
+                        continue
+                    sub_item = {}; sub_count = len(sub_names)
+                    for sub_position, sub_value in enumerate(component.split(sub_sep)):
+                        if not sub_value: continue
+                        sub_name = sub_names[sub_position] if sub_position < sub_count else f"subComponent{sub_position + 1}"
+                        sub_item[sub_name] = unescape(sub_value, esc, delimiters) if esc and esc in sub_value else sub_value
+                    item[component_name] = sub_item
+                for position in range(len(components), len(component_values)): # Components beyond the definition
+                    component = component_values[position]
+                    if component: item[f"component{position + 1}"] = unescape(component, esc, delimiters) if esc and esc in component else component
+                decoded.append(item)
+            parsed[name] = decoded if repeats else decoded[0]
+        for index in range(len(plan), len(fields)): # Fields beyond the definition stay unsplit (but unescaped)
+            value = fields[index]
+            if value: parsed[f"field{index}"] = unescape(value, esc, delimiters) if esc and esc in value else value
+        return parsed
+
+# --- Main execution block for standalone running ---
+if __name__ == "__main__":
+    import sys
+    script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+    parser = MessageParser.from_file(os.path.join(script_dir, DEFINITIONS_FILE))
+    raw = open(sys.argv[1], "r", encoding="utf-8", newline="").read() if len(sys.argv) > 1 else sys.stdin.read()
+    print(json.dumps(parser.parse(raw), indent=2, ensure_ascii=False))
@@ -0,0 +1,182 @@
+import argparse
+import mmap
+import os
+import sys
+import time
+
+from hl7_message_parser import DEFINITIONS_FILE, MessageParser
+
+# --- Constants (Adjust to your feeds) ---
+# Frames messages in MLLP streams (<VT> message <FS><CR>) and FHS/BHS batch files (messages start at MSH segments)
+# without reading whole files: files are memory-mapped, other streams (sockets, pipes) are read in chunks.
+MLLP_START = b"\x0b"
+MLLP_END = b"\x1c\x0d"
+MESSAGE_HEADER = b"MSH"
+ENVELOPE_SEGMENTS = (b"FHS", b"BHS", b"BTS", b"FTS") # Batch/file header and trailer segments between messages
+SEGMENT_BREAKS = (b"\r", b"\n")
+SNIFF_BYTES = 4096 # Bytes inspected to tell MLLP from batch framing
+CHUNK_SIZE = 1024 * 1024 # Read size for non-mapped streams
+RELEASE_EVERY_BYTES = 16 * 1024 * 1024 # Mapped pages behind the read position are dropped this often (flat RSS on huge files)
+TEXT_ENCODING = "utf-8"
+TEXT_ERRORS = "replace" # Feeds are occasionally Latin-1; never fail a whole file on one byte
+
+# --- Helper Functions ---
+
+def find_segment(buf, tag, start, end=None):
+    """Offset of the first segment named `tag` beginning in buf[start:end] (at `start` itself or after \\r / \\n), or -1."""
+    end = len(buf) if end is None else end
+    position = buf.find(tag, start, end)
+    while position > start and buf[position - 1:position] not in SEGMENT_BREAKS: # Tag inside a field, not a segment start
+        position = buf.find(tag, position + 1, end)
+    return position # One forward scan (searching per break character would rescan to EOF when one never occurs)
+
+def next_mllp_frame(buf, pos, final=False):
+    """(start, end, next_pos) of the next complete MLLP frame from `pos`, or None. Bytes outside frames are skipped."""
+    start = buf.find(MLLP_START, pos)
+    if start < 0: return None
+    end = buf.find(MLLP_END, start + 1)
+    if end < 0:
+        if final and len(buf) > start + 1: return start + 1, len(buf), len(buf) # Unterminated last frame
+        return None
+    return start + 1, end, end + len(MLLP_END)
+
+def next_batch_message(buf, pos, final=False):
+    """(start, end, next_pos) of the next message in batch/plain framing: MSH up to the next MSH or envelope segment."""
+    start = find_segment(buf, MESSAGE_HEADER, pos)
+    if start < 0: return None
+    next_start = find_segment(buf, MESSAGE_HEADER, start + len(MESSAGE_HEADER))
+    if next_start < 0:
+        if not final: return None # The message may continue in the next chunk
+        next_start = len(buf)
+    end = next_start
+    for tag in ENVELOPE_SEGMENTS: # BTS/FTS trailers (or a new BHS) end the message early
+        envelope = find_segment(buf, tag, start + len(MESSAGE_HEADER), end)
+        if envelope >= 0: end = envelope
+    return start, end, next_start
+
+FRAMERS = {"mllp": next_mllp_frame, "batch": next_batch_message}
+
+def detect_framing(head):
+    """"mllp" if a <VT> start block precedes the first MSH in `head`, else "batch"."""
+    start_block = head.find(MLLP_START); header = head.find(MESSAGE_HEADER)
+    return "mllp" if start_block >= 0 and (header < 0 or start_block < header) else "batch"
+
+def message_boundary(buf, offset, framing):
+    """Offset of the first message starting at or after `offset` (len(buf) if none); used to cut files into shards."""
+    if framing == "mllp": position = buf.find(MLLP_START, offset)
+    else:
+        position = buf.find(MESSAGE_HEADER, offset)
+        while position > 0 and buf[position - 1:position] not in SEGMENT_BREAKS: position = buf.find(MESSAGE_HEADER, position + 1)
+    return len(buf) if position < 0 else position
+
+def decode_message(raw):
+    return bytes(raw).decode(TEXT_ENCODING, TEXT_ERRORS).strip("\r\n\x00 ")
+
+def _release_pages(mapped, upto):
+    """Drops mapped pages before `upto` from this process (they are re-read from the file if touched again)."""
+    length = upto - upto % mmap.PAGESIZE
+    if length > 0 and hasattr(mapped, "madvise") and hasattr(mmap, "MADV_DONTNEED"): mapped.madvise(mmap.MADV_DONTNEED, 0, length)
+
+def iter_mapped_messages(file_path, framing="auto", start=0, end=None):
+    """
+    Yields raw message strings from a file via mmap; only the bytes of one message are copied at a time.
+    With `start` / `end` (offsets from message_boundary) only the messages beginning in that byte range are read.
+    """
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0: return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"): mapped.madvise(mmap.MADV_SEQUENTIAL)
+            framer = FRAMERS[detect_framing(mapped[:SNIFF_BYTES]) if framing == "auto" else framing]
+            pos = released = start; limit = len(mapped) if end is None else end
+            lead = len(MLLP_START) if framer is next_mllp_frame else 0 # Frames start after the <VT>; boundaries are at it
+            while True:
+                frame = framer(mapped, pos, final=True)
+                if frame is None or frame[0] - lead >= limit: break # The next message belongs to the following shard
+                start, end, pos = frame
+                message = decode_message(mapped[start:end])
+                if message: yield message
+                if pos - released >= RELEASE_EVERY_BYTES: _release_pages(mapped, pos); released = pos
+
+def iter_stream_messages(stream, framing="auto", chunk_size=CHUNK_SIZE):
+    """Yields raw message strings from a binary stream (socket file, pipe, stdin) read `chunk_size` bytes at a time."""
+    buf = bytearray(); pos = 0; framer = None; eof = False
+    while True:
+        if framer is None and (eof or len(buf) >= SNIFF_BYTES):
+            framer = FRAMERS[detect_framing(bytes(buf[:SNIFF_BYTES])) if framing == "auto" else framing]
+        frame = framer(buf, pos, final=eof) if framer else None
+        if frame is not None:
+            start, end, pos = frame
+            message = decode_message(buf[start:end])
+            if message: yield message
+            continue
+        if eof: return
+        if pos: del buf[:pos]; pos = 0 # Keep only the unconsumed tail
+        chunk = stream.read(chunk_size)
+        if chunk: buf += chunk
+        else: eof = True
+
+def iter_raw_messages(source, framing="auto", chunk_size=CHUNK_SIZE, use_mmap=True):
+    """Raw message strings from a file path (memory-mapped unless `use_mmap` is False) or an open binary stream."""
+    if isinstance(source, (str, bytes, os.PathLike)):
+        if use_mmap:
+            yield from iter_mapped_messages(source, framing); return
+        with open(source, "rb") as f: yield from iter_stream_messages(f, framing, chunk_size)
+        return
+    yield from iter_stream_messages(source, framing, chunk_size)
+
+def iter_parsed_messages(source, parser=None, framing="auto", skip_invalid=False, lazy=False, **options):
+    """
+    Lazily parses every message of `source` with a MessageParser (default: compiled from DEFINITIONS_FILE).
+    With `skip_invalid`, frames that are not HL7 messages are skipped instead of raising ValueError.
+    With `lazy`, yields LazyMessage views (parse_lazy) instead of fully decoded dicts.
+    """
+    parser = parser or MessageParser.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), DEFINITIONS_FILE))
+    parse = parser.parse_lazy if lazy else parser.parse
+    for message in iter_raw_messages(source, framing, **options):
+        try: yield parse(message)
+        except ValueError:
+            if not skip_invalid: raise
+
+def write_sample_batch(file_path, messages, framing="batch"):
+    """Writes messages as an FHS/BHS batch file or as MLLP frames (for trying the reader on large inputs)."""
+    with open(file_path, "wb") as f:
+        if framing == "mllp":
+            for message in messages: f.write(MLLP_START + message.encode(TEXT_ENCODING) + MLLP_END)
+            return
+        f.write(b"FHS|^~\\&|LAB|HOSP\rBHS|^~\\&|LAB|HOSP\r")
+        for message in messages: f.write(message.encode(TEXT_ENCODING) + b"\r")
+        f.write(f"BTS|{len(messages)}\rFTS|1\r".encode(TEXT_ENCODING))
+
+def peak_rss_mb():
+    try:
+        import resource # Unix only
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    except (ImportError, AttributeError):
+        return None
+
+# --- Main execution block for standalone running ---
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+    arg_parser = argparse.ArgumentParser(description="Stream HL7 messages out of MLLP or FHS/BHS batch files and parse them with the generated definitions.")
+    arg_parser.add_argument("file", help="Input file (use - for stdin)")
+    arg_parser.add_argument("--framing", choices=["auto", "mllp", "batch"], default="auto")
+    arg_parser.add_argument("--chunked", action="store_true", help="Read in chunks instead of memory-mapping the file")
+    arg_parser.add_argument("--raw", action="store_true", help="Only frame messages (no parsing)")
+    arg_parser.add_argument("--lazy", action="store_true", help="Index messages with parse_lazy() instead of decoding every field")
+    arg_parser.add_argument("--definitions", default=os.path.join(script_dir, DEFINITIONS_FILE))
+    arg_parser.add_argument("--make-sample", type=int, metavar="N", help="Write N synthetic messages to FILE first (see hl7_parser_benchmark.py)")
+    args = arg_parser.parse_args()
+
+    if args.make_sample:
+        from hl7_parser_benchmark import make_sample_messages
+        write_sample_batch(args.file, make_sample_messages(args.make_sample), "mllp" if args.framing == "mllp" else "batch")
+        print(f"Wrote {args.make_sample} messages to {args.file} ({os.path.getsize(args.file) / 1e6:.1f} MB).")
+    source = sys.stdin.buffer if args.file == "-" else args.file
+    options = {"use_mmap": not args.chunked}
+    start = time.perf_counter(); count = 0
+    if args.raw: stream = iter_raw_messages(source, args.framing, **options)
+    else: stream = iter_parsed_messages(source, MessageParser.from_file(args.definitions), args.framing, skip_invalid=True, lazy=args.lazy, **options)
+    for _ in stream: count += 1
+    elapsed = time.perf_counter() - start
+    rss = peak_rss_mb()
+    print(f"{count} messages in {elapsed:.2f}s ({count / elapsed if elapsed else 0:,.0f} msg/s)" + (f", peak RSS {rss:.0f} MB" if rss else ""))
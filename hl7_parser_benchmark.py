@@ -0,0 +1,140 @@
+import argparse
+import os
+import random
+import time
+from collections.abc import Mapping
+
+from hl7_message_parser import (DEFINITIONS_FILE, HL7_VERSION, SEGMENT_NAME_PART, MessageParser, load_definitions,
+                                type_parts, unescape, version_parts)
+
+# --- Constants (Adjust to resemble your feeds) ---
+# Synthetic ADT/ORU traffic: every message has MSH, EVN, PID, PV1 plus OBX_PER_MESSAGE observations.
+MESSAGE_COUNT = 20000
+OBX_PER_MESSAGE = 4
+SEED = 7
+FAMILY_NAMES = ["Doe", "Smith", "Garcia", "Nguyen", "O\\S\\Brien", "Muller", "Okafor", "Kowalski"]
+GIVEN_NAMES = ["John", "Jane", "Ana", "Minh", "Sean", "Lena", "Chidi", "Ola"]
+OBSERVATIONS = [("GLU", "Glucose", "mg/dl"), ("NA", "Sodium", "mmol/l"), ("K", "Potassium", "mmol/l"), ("HGB", "Hemoglobin", "g/dl")]
+# Cases the synthetic traffic does not cover (escaped Z-segment, fields/components beyond the definition), checked for equivalence
+EDGE_CASE_MESSAGES = [
+    "MSH|^~\\&|LAB|HOSP|||20240101||ADT^A01|EDGE1|P|2.6\rZZZ|x\\S\\y|a^b\\T\\c~d\rEVN|A01",
+    "MSH|^~\\&|LAB|HOSP|||20240101||ADT^A01|EDGE2|P|2.6\rPID|1||123^^^HOSP^MR^X^Y^Z^Q^R^S^T^U\\F\\V||O\\S\\Brien" + "|" * 60 + "extra\\E\\field",
+]
+
+# --- Helper Functions ---
+
+def make_sample_messages(count=MESSAGE_COUNT, obx_per_message=OBX_PER_MESSAGE, seed=SEED):
+    """Deterministic synthetic ER7 messages (segments joined with \\r)."""
+    rng = random.Random(seed); messages = []
+    for number in range(count):
+        stamp = f"2024{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}{rng.randint(0, 23):02d}{rng.randint(0, 59):02d}00"
+        segments = [
+            f"MSH|^~\\&|LAB|HOSP|EHR|HOSP|{stamp}||ORU^R01^ORU_R01|MSG{number:08d}|P|2.6",
+            f"EVN|R01|{stamp}",
+            f"PID|1||{rng.randint(100000, 999999)}^^^HOSP&1.2.840.1&ISO^MR~{rng.randint(1000, 9999)}^^^NATL^SS||"
+            f"{rng.choice(FAMILY_NAMES)}^{rng.choice(GIVEN_NAMES)}^Q^^Dr||19{rng.randint(40, 99)}0{rng.randint(1, 9)}15|{rng.choice('MF')}|||"
+            f"{rng.randint(1, 999)} Main St^Apt {rng.randint(1, 20)}^Springfield^IL^62701^USA^H||555-{rng.randint(1000, 9999)}",
+            f"PV1|1|{rng.choice('IOE')}|WARD{rng.randint(1, 9)}^{rng.randint(100, 199)}^A|||||||MED",
+        ]
+        for index in range(obx_per_message):
+            code, text, units = rng.choice(OBSERVATIONS)
+            segments.append(f"OBX|{index + 1}|NM|{code}^{text}^LN||{rng.randint(1, 400) / 10}|{units}|3.5-5.0|N|||F|||{stamp}")
+        messages.append("\r".join(segments))
+    return messages
+
+def naive_parse(definitions, message, version=HL7_VERSION):
+    """
+    Baseline: same output as MessageParser.parse, but walks the definitions JSON for every field of every message
+    (the "split and look it up" approach). Used to measure what compiling the layouts buys.
+    """
+    data_types = definitions.get("dataTypes") or {}
+    message_definition = definitions.get("HL7") or data_types.get("HL7")
+    message_parts = {part.get("type"): part for part in version_parts(message_definition, version)}
+    segment_strings = [s for s in message.replace("\r\n", "\r").replace("\n", "\r").split("\r") if s]
+    msh = segment_strings[0]; field_sep = msh[3]
+    encoding_chars = msh[4:msh.find(field_sep, 4)]
+    comp_sep, rep_sep, esc, sub_sep = encoding_chars[0], encoding_chars[1], encoding_chars[2], encoding_chars[3]
+    delimiters = {"F": field_sep, "S": comp_sep, "T": sub_sep, "R": rep_sep, "E": esc}
+    leaf = lambda text: unescape(text, esc, delimiters) if esc in text else text
+    result = {}
+    for segment in segment_strings:
+        fields = segment.split(field_sep)
+        segment_id = segment[:3]
+        if segment_id == "MSH": fields.insert(1, field_sep)
+        parts = version_parts(data_types.get(segment_id), version)
+        if not parts or parts[0].get("name") != SEGMENT_NAME_PART: parts = [{"name": SEGMENT_NAME_PART}]
+        if segment_id == "MSH" and len(parts) > 1 and parts[1].get("name") != "fieldSeparator": parts.insert(1, {"name": "fieldSeparator"})
+        parsed = {}
+        for index in range(1, len(fields)):
+            value = fields[index]
+            if not value: continue
+            part = parts[index] if index < len(parts) else {"name": f"field{index}"}
+            if segment_id == "MSH" and index in (1, 2): parsed[part["name"]] = leaf(value); continue
+            components = type_parts(data_types, part.get("type"), version)
+            decoded = []
+            for repetition in (value.split(rep_sep) if part.get("repeats") else [value]):
+                if not components: decoded.append(leaf(repetition)); continue
+                item = {}
+                for position, component in enumerate(repetition.split(comp_sep)):
+                    if not component: continue
+                    component_part = components[position] if position < len(components) else {"name": f"component{position + 1}"}
+                    sub_parts = type_parts(data_types, component_part.get("type"), version)
+                    if not sub_parts: item[component_part["name"]] = leaf(component); continue
+                    sub_item = {}
+                    for sub_position, sub_value in enumerate(component.split(sub_sep)):
+                        if sub_value: sub_item[sub_parts[sub_position]["name"] if sub_position < len(sub_parts) else f"subComponent{sub_position + 1}"] = leaf(sub_value)
+                    item[component_part["name"]] = sub_item
+                decoded.append(item)
+            parsed[part["name"]] = decoded if part.get("repeats") else decoded[0]
+        message_part = message_parts.get(segment_id) or {}
+        key = message_part.get("name") or segment_id.lower()
+        if message_part.get("repeats", segment_id != "MSH"): result.setdefault(key, []).append(parsed)
+        else: result.setdefault(key, parsed)
+    return result
+
+def read_routing_fields(message):
+    """A routing-style consumer: message type, control id and first patient identifier (works on dicts and lazy views)."""
+    first_value = lambda value: next(iter(value.values()), None) if isinstance(value, Mapping) else value
+    msh = message["msh"]; patients = message.get("pid")
+    patient_ids = patients[0].get("patientIdentifierList") if patients else None
+    return first_value(msh.get("messageType")), msh.get("messageControlId"), first_value(patient_ids[0]) if patient_ids else None
+
+def time_run(label, function, messages):
+    """Parses every message once; returns messages per second."""
+    start = time.perf_counter()
+    for message in messages: function(message)
+    elapsed = time.perf_counter() - start
+    rate = len(messages) / elapsed if elapsed else float("inf")
+    print(f"  {label:<28} {elapsed:7.3f}s  {rate:10,.0f} msg/s  {elapsed / len(messages) * 1e6:7.1f} us/msg")
+    return rate
+
+# --- Main execution block for standalone running ---
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+    arg_parser = argparse.ArgumentParser(description="Benchmark the compiled HL7 message parser against a naive per-message baseline.")
+    arg_parser.add_argument("--definitions", default=os.path.join(script_dir, DEFINITIONS_FILE))
+    arg_parser.add_argument("--version", default=HL7_VERSION, help="Definition version to compile (the reference file uses 2.3.1)")
+    arg_parser.add_argument("--messages", type=int, default=MESSAGE_COUNT)
+    arg_parser.add_argument("--obx", type=int, default=OBX_PER_MESSAGE, help="OBX segments per message")
+    args = arg_parser.parse_args()
+
+    definitions = load_definitions(args.definitions)
+    compile_start = time.perf_counter()
+    parser = MessageParser(definitions, args.version)
+    print(f"Compiled {len(parser._layouts)} segment layouts in {(time.perf_counter() - compile_start) * 1000:.1f} ms.")
+    messages = make_sample_messages(args.messages, args.obx)
+    print(f"{len(messages)} messages, {sum(map(len, messages)) / len(messages):.0f} bytes on average.")
+    check_messages = messages[:200] + EDGE_CASE_MESSAGES
+    mismatches = sum(parser.parse(m) != naive_parse(definitions, m, args.version) for m in check_messages)
+    if mismatches: print(f"WARNING: {mismatches} of {len(check_messages)} sample messages parse differently from the baseline.")
+    lazy_mismatches = sum(parser.parse_lazy(m).to_dict() != parser.parse(m) for m in check_messages)
+    if lazy_mismatches: print(f"WARNING: {lazy_mismatches} of {len(check_messages)} sample messages decode differently in lazy mode.")
+    print("Full decode:")
+    naive_rate = time_run("naive (lookup per message)", lambda m: naive_parse(definitions, m, args.version), messages)
+    compiled_rate = time_run("compiled MessageParser", parser.parse, messages)
+    time_run("lazy, fully materialized", lambda m: parser.parse_lazy(m).to_dict(), messages)
+    print(f"Speed-up: {compiled_rate / naive_rate:.1f}x")
+    print("Routing (message type, control id, first patient id):")
+    eager_rate = time_run("parse() + read", lambda m: read_routing_fields(parser.parse(m)), messages)
+    lazy_rate = time_run("parse_lazy() + read", lambda m: read_routing_fields(parser.parse_lazy(m)), messages)
+    print(f"Speed-up: {lazy_rate / eager_rate:.1f}x")
@@ -0,0 +1,115 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import threading
+import time
+
+from hl7_html_parser import parse_definition_page_html
+from hl7_snapshot_store import SnapshotStore, read_blob
+
+# --- Constants (Adjust if your folders differ) ---
+# Rebuilds the definitions JSON from the saved fallback pages (or the newest page snapshots), without a browser, network or Gemini.
+FALLBACK_HTML_DIR = "fallback_html"
+SNAPSHOT_DIR = "page_snapshots"
+OUTPUT_JSON_FILE = "hl7_definitions_v2.6.json"
+CATEGORIES = ("Tables", "DataTypes", "Segments")
+EMPTY_PAGE_REASON = "no definition rows found" # e.g. primitive DataTypes, Tables without suggested values
+FALLBACK_NAME_PATTERN = re.compile(r"^(Tables|DataTypes|Segments)_(.+)_fallback\.html$") # {definition_type}_{definition_name}_fallback.html
+
+# --- Helper Functions ---
+
+class PrintQueue:
+    """Stands in for the GUI status queue when run from the command line."""
+    def put(self, item):
+        level, msg = item if isinstance(item, tuple) else ("info", item)
+        if level == "debug": return
+        prefix = f"{level.upper()}: " if level not in ("info", "status") else ""
+        print(f"{prefix}{msg}")
+
+def find_fallback_pages(html_dir):
+    """Returns [(category, name, path)] for every '{category}_{name}_fallback.html' file in `html_dir`."""
+    pages = []
+    for file_name in sorted(os.listdir(html_dir)):
+        match = FALLBACK_NAME_PATTERN.match(file_name)
+        if match: pages.append((match.group(1), match.group(2), os.path.join(html_dir, file_name)))
+    return pages
+
+def find_snapshot_pages(snapshot_dir):
+    """Returns [(category, name, blob_path)] for the newest snapshot of every page in a SnapshotStore."""
+    store = SnapshotStore(snapshot_dir); pages = []
+    for entry in sorted(store.latest_entries(), key=lambda e: (e["category"], e["name"])):
+        blob_path = store.blob_path(entry["sha256"])
+        if entry["category"] in CATEGORIES and blob_path: pages.append((entry["category"], entry["name"], blob_path))
+    return pages
+
+def reparse_page(page):
+    """Worker: parses one saved page. Returns (category, name, parsed_dict_or_None, error_text_or_None)."""
+    category, name, path = page
+    try:
+        html_content = read_blob(path) # Plain .html or compressed snapshot blob
+        return category, name, parse_definition_page_html(category, name, html_content), None
+    except Exception as e:
+        return category, name, None, f"{type(e).__name__}: {e}"
+
+def reparse_fallback_archive(html_dir, workers=None, status_queue=None, from_snapshots=False):
+    """
+    Parses every saved fallback page (or, with `from_snapshots`, the newest snapshot per page) across a process pool.
+    Returns ({category: {name: parsed_dict}}, [(category, name, reason)] for pages that yielded nothing).
+    """
+    status_queue = status_queue or PrintQueue()
+    pages = find_snapshot_pages(html_dir) if from_snapshots else find_fallback_pages(html_dir)
+    status_queue.put(('status', f"Re-parsing {len(pages)} saved pages from {html_dir} on {workers or os.cpu_count()} processes..."))
+    parsed = {category: {} for category in CATEGORIES}; failures = []
+    if not pages: return parsed, failures
+    chunk_size = max(1, len(pages) // ((workers or os.cpu_count() or 1) * 4)) # Few, larger IPC batches
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for category, name, result, error in executor.map(reparse_page, pages, chunksize=chunk_size):
+            if result: parsed[category][name] = result
+            else: failures.append((category, name, error or EMPTY_PAGE_REASON))
+    return parsed, failures
+
+# --- Main execution block for standalone running ---
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+    arg_parser = argparse.ArgumentParser(description="Rebuild the HL7 definitions JSON from saved fallback HTML pages (no network).")
+    arg_parser.add_argument("--html-dir", default=os.path.join(script_dir, FALLBACK_HTML_DIR))
+    arg_parser.add_argument("--snapshots", nargs="?", const=os.path.join(script_dir, SNAPSHOT_DIR), default=None,
+                            help="Re-parse the newest page snapshots from this store instead of --html-dir")
+    arg_parser.add_argument("--output", default=os.path.join(script_dir, OUTPUT_JSON_FILE))
+    arg_parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: all cores)")
+    arg_parser.add_argument("--fresh", action="store_true", help="Start from an empty file instead of merging into the existing output")
+    arg_parser.add_argument("--no-compare", action="store_true", help="Skip the comparison against the reference file")
+    args = arg_parser.parse_args()
+
+    source_dir = args.snapshots or args.html_dir
+    if not os.path.isdir(source_dir):
+        print(f"Error: Directory not found: {source_dir}")
+        raise SystemExit(1)
+
+    status_q = PrintQueue(); start = time.monotonic()
+    parsed_by_category, failed_pages = reparse_fallback_archive(source_dir, args.workers, status_q, from_snapshots=bool(args.snapshots))
+    for category in CATEGORIES:
+        empty_names = [name for failed_category, name, reason in failed_pages if failed_category == category and reason == EMPTY_PAGE_REASON]
+        if empty_names: status_q.put(('warning', f"{len(empty_names)} {category} pages had no definition rows: {', '.join(empty_names)}"))
+    for category, name, reason in failed_pages:
+        if reason != EMPTY_PAGE_REASON: status_q.put(('error', f"{category} '{name}': {reason}"))
+
+    # Same validation, merge and post-processing as run_parser_orchestrator (imported here so workers stay light)
+    from main4 import load_existing_definitions, validate_definition_result, finalize_definitions
+    final_definitions = {} if args.fresh else (load_existing_definitions(args.output, status_q) or {})
+    never_stopped = threading.Event(); merged_count = 0
+    for category, results in parsed_by_category.items():
+        target = final_definitions.setdefault("tables" if category == "Tables" else "dataTypes", {})
+        for name, result in results.items():
+            value = validate_definition_result(category, name, result, status_q, never_stopped, "Reparse")
+            if value is not None: target[str(name) if category == "Tables" else name] = value; merged_count += 1
+    finalize_definitions(final_definitions, status_q)
+
+    with open(args.output, 'w', encoding='utf-8') as f: json.dump(final_definitions, f, indent=2, ensure_ascii=False)
+    status_q.put(('status', f"Wrote {merged_count} re-parsed definitions ({len(failed_pages)} pages without rows) to {args.output} in {time.monotonic() - start:.1f}s."))
+
+    if not args.no_compare:
+        import hl7_comparison
+        hl7_comparison.compare_hl7_definitions(args.output, os.path.join(script_dir, hl7_comparison.REFERENCE_FILE), status_q)
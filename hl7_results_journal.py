@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+# --- Constants (Adjust if your folders differ) ---
+# One line per validated definition, appended (and fsynced) the moment it completes:
+#   {"category": "Tables"|"DataTypes"|"Segments", "name": ..., "savedAt": ..., "data": <validated value>}
+# The output JSON is compacted from it at the end of a run; a crashed run replays it on restart and skips those items.
+JOURNAL_FILE = "hl7_definitions_v2.6.journal.jsonl"
+
+# --- Helper Functions ---
+
+def merge_definition_result(definitions, category, name, data):
+    """Puts one validated value into the output structure (Tables -> "tables", DataTypes/Segments -> "dataTypes")."""
+    if category == "Tables": definitions.setdefault("tables", {})[str(name)] = data
+    else: definitions.setdefault("dataTypes", {})[name] = data
+
+class ResultsJournal:
+    """
+    Append-only JSONL journal of validated definitions. Each append is flushed and fsynced, so a crash or
+    Ctrl+C loses at most the line being written; a torn last line is dropped (and cut off) on replay.
+    """
+    def __init__(self, file_path=JOURNAL_FILE, fsync=True):
+        self.file_path = file_path; self.fsync = fsync
+        self.appended = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def replay(self, status_queue=None):
+        """Returns [(category, name, data)] in write order (later lines win when merged) and truncates any torn tail."""
+        entries = []; good_offset = 0
+        try:
+            with open(self.file_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"): break # Torn by a crash mid-write
+                    try: entry = json.loads(line)
+                    except ValueError: break # Anything after a corrupt line is suspect as well
+                    good_offset += len(line)
+                    if isinstance(entry, dict) and entry.get("category") and "name" in entry and entry.get("data") is not None:
+                        entries.append((entry["category"], entry["name"], entry["data"]))
+                file_size = f.seek(0, os.SEEK_END)
+        except FileNotFoundError:
+            return entries
+        if good_offset < file_size:
+            if status_queue: status_queue.put(('warning', f"Dropping {file_size - good_offset} bytes of incomplete journal tail in {os.path.basename(self.file_path)}."))
+            with open(self.file_path, "r+b") as f: f.truncate(good_offset) # Next append starts on a clean line
+        return entries
+
+    def append(self, category, name, data):
+        """Durably records one validated definition."""
+        line = json.dumps({"category": category, "name": name, "savedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                           "data": data}, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None: self._file = open(self.file_path, "a", encoding="utf-8")
+            self._file.write(line); self._file.flush()
+            if self.fsync: os.fsync(self._file.fileno())
+            self.appended += 1
+
+    def clear(self):
+        """Removes the journal (call once its contents are safely in the output JSON)."""
+        with self._lock:
+            self._close_file()
+            try: os.remove(self.file_path)
+            except FileNotFoundError: pass
+
+    def _close_file(self):
+        if self._file is not None: self._file.close(); self._file = None
+
+    def close(self):
+        with self._lock: self._close_file()
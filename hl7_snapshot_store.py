@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import datetime, timezone
+
+try:
+    import zstandard # Optional; ~3x faster and smaller than gzip on the Angular page boilerplate
+except ImportError:
+    zstandard = None
+
+# --- Constants (Adjust if your folders differ) ---
+# Layout: <root>/blobs/<ab>/<sha256>.html.(zst|gz)   one compressed page per distinct content fingerprint
+#         <root>/results/<result key>.json            parsed definition for that page + content (written after a successful parse);
+#                                                     result key = sha256 of (category, name, content sha256), see result_key()
+#         <root>/index.jsonl                          one line per fetch: category, name, fetchedAt, sha256, kind, bytes
+SNAPSHOT_DIR = "page_snapshots"
+INDEX_FILE_NAME = "index.jsonl"
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+# Per-render noise stripped before fingerprinting, so an unchanged definition always hashes the same:
+# scripts (analytics URLs/timestamps), inline styles, Angular view-encapsulation ids and generated CDK ids.
+VOLATILE_PATTERNS = [
+    re.compile(r"<(script|style)\b.*?</\1>", re.S | re.I),
+    re.compile(r'\s?\[?_ng(?:content|host)-[a-z0-9]+-c\d+(?:=""|\])?'),
+    re.compile(r"\bng-tns-c\d+-\d+\b"),
+    re.compile(r"\bcdk-(?:describedby-message|overlay|drop-list|accordion-child)-\d+\b"),
+    re.compile(r'\sstyle="[^"]*"'),
+]
+
+# --- Helper Functions ---
+
+def content_fingerprint(html_content):
+    """SHA-256 of the page with per-render noise removed (the content address of a snapshot)."""
+    normalized = html_content
+    for pattern in VOLATILE_PATTERNS: normalized = pattern.sub("", normalized)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def compress_html(html_content):
+    """Returns (file_extension, compressed_bytes) using zstd if available, else gzip."""
+    raw = html_content.encode("utf-8")
+    if zstandard: return ".html.zst", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return ".html.gz", gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0) # mtime=0: identical input -> identical bytes
+
+def read_blob(blob_path):
+    """Decompresses a stored page (codec chosen by file extension)."""
+    with open(blob_path, "rb") as f: data = f.read()
+    if blob_path.endswith(".zst"):
+        if not zstandard: raise RuntimeError(f"zstandard is required to read {blob_path}")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif blob_path.endswith(".gz"): data = gzip.decompress(data)
+    return data.decode("utf-8")
+
+def result_key(category, name, digest):
+    """File key of a stored parse result: the same page bytes under another definition must not share a result."""
+    return hashlib.sha256(json.dumps([category, str(name), digest]).encode("utf-8")).hexdigest()
+
+def write_atomic(file_path, data):
+    """Writes bytes via a temp file + rename so readers (and other processes) never see a partial file."""
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f: f.write(data)
+    os.replace(tmp_path, file_path)
+
+class SnapshotStore:
+    """
+    Content-addressed, compressed store of every fetched page, with a fetch index per (category, name).
+    Safe to share between threads; separate processes may append to the same store.
+    """
+    def __init__(self, root_dir=SNAPSHOT_DIR):
+        self.root_dir = root_dir
+        self.index_path = os.path.join(root_dir, INDEX_FILE_NAME)
+        self._lock = threading.Lock()
+        self._latest = {} # (category, name) -> newest index entry
+        os.makedirs(os.path.join(root_dir, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(root_dir, "results"), exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try: entry = json.loads(line)
+                    except ValueError: continue # Torn last line from an interrupted run
+                    self._latest[(entry.get("category"), entry.get("name"))] = entry
+        except FileNotFoundError: pass
+
+    def blob_path(self, digest):
+        """Path of the stored blob for `digest` (whichever codec it was written with), or None."""
+        blob_dir = os.path.join(self.root_dir, "blobs", digest[:2])
+        for extension in (".html.zst", ".html.gz"):
+            candidate = os.path.join(blob_dir, digest + extension)
+            if os.path.exists(candidate): return candidate
+        return None
+
+    def put(self, category, name, html_content, kind="page"):
+        """
+        Stores one fetched page and appends an index entry. Identical content is stored once.
+        Returns (digest, changed) where `changed` is False if the previous fetch of this page had the same content.
+        """
+        digest = content_fingerprint(html_content)
+        if not self.blob_path(digest):
+            extension, data = compress_html(html_content)
+            blob_dir = os.path.join(self.root_dir, "blobs", digest[:2])
+            os.makedirs(blob_dir, exist_ok=True)
+            write_atomic(os.path.join(blob_dir, digest + extension), data)
+        entry = {"category": category, "name": str(name), "fetchedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                 "sha256": digest, "kind": kind, "bytes": len(html_content)}
+        with self._lock:
+            previous = self._latest.get((category, str(name)))
+            self._latest[(category, str(name))] = entry
+            with open(self.index_path, "a", encoding="utf-8") as f: f.write(json.dumps(entry) + "\n") # One write per line (O_APPEND)
+        return digest, not previous or previous.get("sha256") != digest
+
+    def latest(self, category, name):
+        """Newest index entry for a page, or None."""
+        with self._lock: return self._latest.get((category, str(name)))
+
+    def latest_entries(self, kind=None):
+        """Newest index entry of every page (optionally only those of one `kind`)."""
+        with self._lock: entries = list(self._latest.values())
+        return [entry for entry in entries if kind is None or entry.get("kind") == kind]
+
+    def get(self, digest):
+        """Decompressed HTML for a content digest, or None if the blob is missing."""
+        blob_path = self.blob_path(digest)
+        return read_blob(blob_path) if blob_path else None
+
+    def history(self, category, name):
+        """All index entries for a page, oldest first (reads the full index)."""
+        entries = []
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try: entry = json.loads(line)
+                    except ValueError: continue
+                    if entry.get("category") == category and entry.get("name") == str(name): entries.append(entry)
+        except FileNotFoundError: pass
+        return entries
+
+    def save_result(self, category, name, digest, parsed_data, source):
+        """Records the parsed definition of one page for a content digest so an unchanged page is never parsed twice."""
+        payload = json.dumps({"category": category, "name": str(name), "sha256": digest, "source": source, "data": parsed_data}, ensure_ascii=False).encode("utf-8")
+        write_atomic(os.path.join(self.root_dir, "results", f"{result_key(category, name, digest)}.json"), payload)
+
+    def load_result(self, category, name, digest):
+        """Returns (parsed_data, source) recorded for this page and content digest, or (None, None)."""
+        try:
+            with open(os.path.join(self.root_dir, "results", f"{result_key(category, name, digest)}.json"), "r", encoding="utf-8") as f: payload = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if (payload.get("category"), payload.get("name"), payload.get("sha256")) != (category, str(name), digest): return None, None
+        return payload.get("data"), payload.get("source")
@@ -8,9 +8,9 @@ import json
 import os
 import shutil
 import time
-import re # Import regex for camel case conversion
 # import base64 # Not used currently
-# import requests # Not used currently
+import requests
+from requests.adapters import HTTPAdapter
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
@@ -20,25 +20,416 @@ from selenium.common.exceptions import StaleElementReferenceException
 from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
 from PIL import Image #, ImageTk # ImageTk not used currently
-import google.generativeai as genai
 import google.api_core.exceptions
 import traceback
-import concurrent.futures # For ThreadPoolExecutor
+import concurrent.futures # For ThreadPoolExecutor / ProcessPoolExecutor
+import asyncio
+import multiprocessing
+import multiprocessing.util
+import functools
+import itertools
+import hashlib
+from datetime import datetime, timezone
+from hl7_html_parser import (is_table_id, build_definition_part, build_definition_structure,
+                             add_table_rows_from_matrix, add_definition_parts_from_matrix,
+                             parse_definition_page_html, page_has_no_values, minimize_definition_html) # Row -> part rules + offline HTML parser
+from hl7_snapshot_store import SnapshotStore
+from hl7_gemini_cache import GeminiResponseCache, response_cache_key
+from hl7_gemini_async import AsyncGeminiStage, RequestBatcher, backoff_delay
+from hl7_gemini_schema import response_schema, salvage_json
+from hl7_llm_backend import BACKENDS_NEEDING_API_KEY, make_llm_model, record_response
+from hl7_results_journal import ResultsJournal, merge_definition_result
 
 # --- Configuration, Globals ---
 BASE_URL = "https://hl7-definition.caristix.com/v2/HL7v2.6"
 OUTPUT_JSON_FILE = "hl7_definitions_v2.6.json"
+RESULTS_JOURNAL_FILE = "hl7_definitions_v2.6.journal.jsonl" # Each validated definition is appended here as it completes; a crashed run resumes from it (None = disabled)
+SALVAGED_RESULTS_FILE = "hl7_definitions_v2.6.salvaged.json" # AI answers only salvaged from truncated responses (not in the output; retried next run)
 FALLBACK_HTML_DIR = "fallback_html" # Directory for saving HTML on fallback
 API_KEY_FILE = "api_key.txt"
 HL7_VERSION = "2.6"
 GEMINI_API_KEY = None
 GEMINI_MODEL = None
+GEMINI_MODEL_NAME = "gemini-1.5-flash" # Keep flash for now
+LLM_BACKEND = "gemini" # "gemini" = google.generativeai (needs api_key.txt); "standin" = local hl7_gemini_standin.py server
+LLM_STANDIN_URL = "http://127.0.0.1:8766"
+LLM_RECORD_DIR = None # e.g. "llm_recordings": save every prompt -> answer for replay with hl7_gemini_standin.py --record-dir
 # Global variable to hold the app instance for access in functions
 app = None
 # --- Parallelization Configuration ---
 # Adjust based on your system (CPU cores, RAM) and network/API limits
 # Start conservatively (e.g., 8-12) and increase if stable. 16 might be too high for many systems.
 MAX_WORKERS = 20 # Max concurrent Selenium instances + AI calls
+EXECUTION_MODE = "threads" # "threads" = one process, MAX_WORKERS threads; "processes" = ProcessPoolExecutor, one driver per process
+PROCESS_WORKERS = MAX_WORKERS # Worker processes in "processes" mode (each owns one Chrome)
+# --- Adaptive Concurrency Configuration (AIMD) ---
+ADAPTIVE_CONCURRENCY = True # False = fixed limits at the configured maximums
+BROWSER_CONCURRENCY_BOUNDS = (2, MAX_WORKERS) # (min, max) browser pages in flight at once
+BROWSER_CONCURRENCY_INITIAL = 8 # Start mid-range; the controller climbs +1 per healthy window
+GEMINI_CONCURRENCY_BOUNDS = (1, 8) # (min, max) Gemini requests in flight at once
+GEMINI_CONCURRENCY_INITIAL = 4
+AIMD_WINDOW = 8 # Samples per additive-increase decision
+AIMD_LATENCY_FACTOR = 2.0 # Window mean page latency above factor x best window so far = congestion
+AIMD_TIMEOUT_RATE = 0.1 # Share of WebDriver timeouts in a window that counts as congestion
+AIMD_GEMINI_COOLDOWN = 5.0 # Seconds between successive Gemini cuts (one burst of 429s = one halving)
+# --- WebDriver Pool Configuration ---
+DRIVER_POOL_SIZE = MAX_WORKERS # Max live Chrome instances shared by the list phase and all workers
+DRIVER_RECYCLE_AFTER_PAGES = 40 # Quit and replace a driver after this many pages to cap Chrome memory growth
+DRIVER_POOL_WARMUP = 4 # Drivers launched up front (in parallel) before any work is submitted
+# --- Browser Profile Configuration ---
+BROWSER_PROFILE = "lean" # "lean" = block unused resources, eager page loads, no background services; "default" = plain headless Chrome
+LEAN_BLOCK_STYLESHEETS = True # Scrapers read textContent, so CSS is not needed (set False if a layout-dependent scrape breaks)
+LEAN_BLOCKED_URL_PATTERNS = [ # Passed to CDP Network.setBlockedURLs (wildcards allowed)
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*fonts.googleapis.com*", "*fonts.gstatic.com*",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*hotjar.com*", "*clarity.ms*",
+]
+LEAN_CHROME_ARGUMENTS = [
+    "--disable-extensions", "--disable-background-networking", "--disable-component-update",
+    "--disable-default-apps", "--disable-sync", "--disable-client-side-phishing-detection",
+    "--disable-features=Translate,OptimizationHints,MediaRouter", "--no-first-run", "--mute-audio",
+    "--blink-settings=imagesEnabled=false",
+]
+# --- Scraping Configuration ---
+SCRAPE_EXTRACTION_MODE = "js" # "js" = one execute_script per scroll pass returns all cell texts; "cells" = legacy per-cell WebDriver calls
+# --- Wait Strategy Configuration ---
+WAIT_STRATEGY = "event" # "event" = MutationObserver/network-idle waits; "fixed" = legacy time.sleep() pauses
+DOM_QUIET_MS = 250 # DOM (and XHR/fetch) must be quiet this long before a page/table counts as settled
+DOM_SETTLE_TIMEOUT = 10 # Seconds before an event wait gives up and scraping proceeds anyway
+EVENT_MAX_STALE_SCROLLS = 2 # Empty scroll passes tolerated in event mode (fixed mode keeps the old 5/8/10)
+WAIT_METRICS_FILE = "wait_metrics.json" # Per-page wait timings written at the end of each run
+# --- Fetch Backend Configuration ---
+FETCH_BACKEND = "selenium" # "selenium" = browser scraping; "http" = JSON API first, Selenium only as per-item fallback
+API_BASE_URL = "https://hl7-definition.caristix.com/v2-api/1/HL7v2.6" # Backend the Angular site loads its data from
+HTTP_TIMEOUT = 15 # Seconds per API request
+HTTP_CAPTURE_DIR = None # e.g. "http_capture": save raw API responses for offline replay with hl7_http_standin.py
+OFFLINE_HTML_PARSE = True # Parse driver.page_source with BeautifulSoup before falling back to Gemini
+MINIMIZE_GEMINI_HTML = True # Send Gemini only the title, Length and definition table instead of the full ~150 KB page
+GEMINI_CACHE_DIR = "gemini_cache" # Parsed Gemini answers keyed by model, prompt version and prompt HTML hash (None = disabled)
+GEMINI_CACHE_MAX_MB = 50 # Least recently used answers are evicted above this size
+GEMINI_PROMPT_VERSION = 1 # Bump whenever an analyze_*_html_with_gemini prompt changes, so cached answers are not reused
+GEMINI_STRUCTURED_OUTPUT = True # JSON mode + per-category response schema (falls back to prompt-only JSON on older clients)
+GEMINI_ASYNC_STAGE = True # Thread mode: browser workers hand pages needing AI to an asyncio stage and move on
+GEMINI_REQUESTS_PER_MINUTE = 60 # Token-bucket rate shared by all Gemini requests of the async stage
+GEMINI_BURST = 4 # Requests the bucket lets through back-to-back
+GEMINI_MAX_RETRIES = 3
+GEMINI_BACKOFF_BASE_S = 2.0 # Retry n waits uniform(0, min(cap, base * 2**n)) ("full jitter")
+GEMINI_BACKOFF_CAP_S = 30.0
+GEMINI_BATCHING = True # Async stage only: pack several minimized pages of one category into one request
+GEMINI_BATCH_TOKEN_BUDGET = 12000 # Estimated prompt-HTML tokens per batched request
+GEMINI_BATCH_MAX_ITEMS = 10
+GEMINI_BATCH_WINDOW_S = 1.5 # How long the first page of a batch waits for more pages
+SNAPSHOT_STORE_DIR = "page_snapshots" # Compressed, content-addressed copy of every fetched page (None = disabled)
+SKIP_UNCHANGED_PAGES = True # Reuse the stored parse result when a page's content fingerprint was parsed before
+SAVE_LOOSE_FALLBACK_HTML = False # Also write uncompressed fallback_html/*.html files (always on if the store is disabled)
+# --- Definition Index Configuration ---
+DEFINITION_INDEX_FILE = "definition_index.json" # Persisted category name lists; list pages are only scrolled when stale/missing
+DEFINITION_INDEX_TTL_DAYS = 30 # Entries older than this are re-discovered (None = never expire)
+REFRESH_DEFINITION_INDEX = False # True (or the "Refresh lists" checkbox / --refresh-index) ignores the index for one run
+
+# --- Adaptive Concurrency ---
+class AdaptiveLimiter:
+    """Counting limiter (semaphore-like) whose capacity can be raised or lowered while permits are held."""
+    def __init__(self, limit, minimum, maximum):
+        self.minimum = max(1, minimum); self.maximum = max(self.minimum, maximum)
+        self.limit = max(self.minimum, min(limit, self.maximum))
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, stop_event=None):
+        """Blocks until a permit is free. Returns False (without a permit) if stop is requested while waiting."""
+        with self._cond:
+            while self.in_use >= self.limit:
+                if stop_event is not None and stop_event.is_set(): return False
+                self._cond.wait(timeout=0.5)
+            self.in_use += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.in_use = max(0, self.in_use - 1)
+            self._cond.notify()
+
+    def set_limit(self, limit):
+        with self._cond:
+            self.limit = max(self.minimum, min(int(limit), self.maximum))
+            self._cond.notify_all() # A raise may unblock several waiters
+            return self.limit
+
+class ConcurrencyController:
+    """
+    AIMD controller for browser pages and Gemini calls: +1 after a healthy window,
+    halve on WebDriver timeouts, page-latency spikes or Gemini 429/ResourceExhausted.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status_queue = None
+        self.reset(None)
+
+    def reset(self, status_queue):
+        """Starts a run: fresh limits and statistics, limit changes reported to `status_queue`."""
+        with self._lock:
+            self.status_queue = status_queue
+            self.browser = AdaptiveLimiter(BROWSER_CONCURRENCY_INITIAL if ADAPTIVE_CONCURRENCY else BROWSER_CONCURRENCY_BOUNDS[1], *BROWSER_CONCURRENCY_BOUNDS)
+            self.gemini = AdaptiveLimiter(GEMINI_CONCURRENCY_INITIAL if ADAPTIVE_CONCURRENCY else GEMINI_CONCURRENCY_BOUNDS[1], *GEMINI_CONCURRENCY_BOUNDS)
+            self._latencies = []; self._timeouts = 0; self._best_latency = None
+            self._gemini_ok = 0; self._last_gemini_cut = 0.0
+        if status_queue: self._publish("initial") # Silent at import time
+
+    def _publish(self, reason):
+        msg = f"Concurrency limits: browsers {self.browser.limit}/{self.browser.maximum}, Gemini {self.gemini.limit}/{self.gemini.maximum} ({reason})"
+        if self.status_queue:
+            self.status_queue.put(('limits', self.browser.limit, self.browser.maximum, self.gemini.limit, self.gemini.maximum))
+            self.status_queue.put(('status', msg))
+        else: print(msg)
+
+    def record_timeout(self):
+        if not ADAPTIVE_CONCURRENCY: return
+        with self._lock: self._timeouts += 1
+
+    def record_page(self, latency_s):
+        """Adds one page-load/scrape latency sample; every AIMD_WINDOW samples the browser limit is adjusted."""
+        if not ADAPTIVE_CONCURRENCY: return
+        with self._lock:
+            self._latencies.append(latency_s)
+            if len(self._latencies) < AIMD_WINDOW: return
+            mean_latency = sum(self._latencies) / len(self._latencies)
+            timeout_rate = self._timeouts / len(self._latencies)
+            congested = timeout_rate >= AIMD_TIMEOUT_RATE or (self._best_latency is not None and mean_latency > AIMD_LATENCY_FACTOR * self._best_latency)
+            self._best_latency = mean_latency if self._best_latency is None else min(self._best_latency, mean_latency)
+            self._latencies = []; self._timeouts = 0
+            old_limit = self.browser.limit
+            new_limit = self.browser.set_limit(old_limit // 2 if congested else old_limit + 1)
+        if new_limit != old_limit:
+            self._publish(f"{'cut' if congested else 'raise'}: mean page {mean_latency:.1f}s, timeouts {timeout_rate:.0%}")
+
+    def record_gemini(self, rate_limited):
+        if not ADAPTIVE_CONCURRENCY: return
+        with self._lock:
+            old_limit = self.gemini.limit
+            if rate_limited:
+                self._gemini_ok = 0
+                if time.monotonic() - self._last_gemini_cut < AIMD_GEMINI_COOLDOWN: return
+                self._last_gemini_cut = time.monotonic()
+                new_limit = self.gemini.set_limit(old_limit // 2)
+            else:
+                self._gemini_ok += 1
+                if self._gemini_ok < AIMD_WINDOW: return
+                self._gemini_ok = 0
+                new_limit = self.gemini.set_limit(old_limit + 1)
+        if new_limit != old_limit:
+            self._publish("Gemini rate limited" if rate_limited else "Gemini healthy")
+
+CONCURRENCY = ConcurrencyController()
+
+def gemini_generation_config(category, definition_names):
+    """JSON-mode generation config with the keyed response schema for these definitions, or None if disabled."""
+    if not GEMINI_STRUCTURED_OUTPUT: return None
+    return {"response_mime_type": "application/json", "response_schema": response_schema(category, definition_names)}
+
+def disable_structured_output(error):
+    """Falls back to prompt-only JSON for the rest of the run (google-generativeai too old for response_schema)."""
+    global GEMINI_STRUCTURED_OUTPUT
+    if GEMINI_STRUCTURED_OUTPUT: print(f"Warn: Gemini structured output unavailable ({error}); using prompt-only JSON.")
+    GEMINI_STRUCTURED_OUTPUT = False
+
+def send_gemini_request(prompt_text, generation_config=None):
+    """GEMINI_MODEL.generate_content, with the JSON schema config when given and supported."""
+    if generation_config and GEMINI_STRUCTURED_OUTPUT:
+        try: return GEMINI_MODEL.generate_content(prompt_text, generation_config=generation_config)
+        except (TypeError, ValueError) as config_err: disable_structured_output(config_err) # Rejected client-side, nothing was sent
+    return GEMINI_MODEL.generate_content(prompt_text)
+
+def record_gemini_exchange(prompt_text, response):
+    """Saves prompt -> answer text under LLM_RECORD_DIR (if set) for offline replay by hl7_gemini_standin.py."""
+    if not LLM_RECORD_DIR or LLM_BACKEND == "standin": return # Never re-record the stand-in's own answers
+    try:
+        script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+        record_response(os.path.join(script_dir, LLM_RECORD_DIR), GEMINI_MODEL_NAME, prompt_text, response.text)
+    except (OSError, ValueError) as rec_err: print(f"Warn: Could not record Gemini answer: {rec_err}")
+
+def generate_gemini_content(prompt_text, generation_config=None):
+    """GEMINI_MODEL.generate_content under the adaptive in-flight limit; 429/ResourceExhausted is reported to the controller."""
+    if not CONCURRENCY.gemini.acquire(app.stop_event if app else None):
+        raise KeyboardInterrupt("Stop requested while waiting for a Gemini slot.")
+    try:
+        response = send_gemini_request(prompt_text, generation_config)
+    except google.api_core.exceptions.ResourceExhausted:
+        CONCURRENCY.record_gemini(rate_limited=True)
+        raise
+    finally:
+        CONCURRENCY.gemini.release()
+    CONCURRENCY.record_gemini(rate_limited=False)
+    record_gemini_exchange(prompt_text, response)
+    return response
+
+_GEMINI_CACHE = None
+_GEMINI_CACHE_LOCK = threading.Lock()
+
+def get_gemini_cache():
+    """Returns the shared GeminiResponseCache (one per process), or None if GEMINI_CACHE_DIR is disabled."""
+    global _GEMINI_CACHE
+    if not GEMINI_CACHE_DIR: return None
+    with _GEMINI_CACHE_LOCK:
+        if _GEMINI_CACHE is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+            _GEMINI_CACHE = GeminiResponseCache(os.path.join(script_dir, GEMINI_CACHE_DIR), GEMINI_CACHE_MAX_MB * 1024 * 1024)
+        return _GEMINI_CACHE
+
+def lookup_gemini_cache(definition_type, definition_name, html_content):
+    """Cached parsed answer for this page's prompt, or None (also if the response cache is disabled)."""
+    cache = get_gemini_cache()
+    if not cache: return None
+    cached_json = cache.get(response_cache_key(GEMINI_MODEL_NAME, GEMINI_PROMPT_VERSION, definition_type, definition_name, html_content))
+    if cached_json is not None: print(f"  Using cached Gemini {definition_type} HTML response for {definition_name}.")
+    return cached_json
+
+def store_gemini_json(definition_type, definition_name, html_content, parsed_json):
+    """Caches an answer whose top-level key matches the definition (anything else would fail validation anyway)."""
+    cache = get_gemini_cache()
+    if not cache or not isinstance(parsed_json, dict) or str(definition_name) not in map(str, parsed_json): return
+    cache_key = response_cache_key(GEMINI_MODEL_NAME, GEMINI_PROMPT_VERSION, definition_type, definition_name, html_content)
+    try: cache.put(cache_key, parsed_json, model=GEMINI_MODEL_NAME, promptVersion=GEMINI_PROMPT_VERSION,
+                   definitionType=definition_type, name=str(definition_name), promptHtmlBytes=len(html_content))
+    except OSError as cache_err: print(f"Warn: Could not cache Gemini response for {definition_name}: {cache_err}")
+
+def estimate_prompt_tokens(text):
+    """Rough Gemini token count (~4 characters per token for HTML/English)."""
+    return len(text) // 4 + 1
+
+GEMINI_SALVAGED_SOURCE = "AI Fallback (salvaged)"
+
+class SalvagedAnswer(dict):
+    """
+    A parsed Gemini answer that only survived as the valid prefix of a truncated/malformed response (rows or parts
+    may be missing). Returned only once retries are used up; never cached, journaled or written to the output JSON.
+    """
+
+class SalvagedResult:
+    """Validated value of a SalvagedAnswer on its way to the orchestrator, which keeps it out of the journal and output."""
+    def __init__(self, value):
+        self.value = value
+
+def parse_gemini_answer(response_text, definition_type, definition_name):
+    """
+    Parses an answer with the tolerant salvage parser. Returns (parsed_json, salvaged); raises json.JSONDecodeError
+    only if no valid prefix exists. A salvaged (truncated/malformed) answer counts as a failed attempt and is never cached.
+    """
+    parsed_json, salvaged = salvage_json(response_text)
+    if salvaged: print(f"Warn: Gemini {definition_type} answer for '{definition_name}' was malformed/truncated; only its valid part is usable.")
+    else: print(f"  Successfully parsed Gemini {definition_type} HTML response for {definition_name}.")
+    return parsed_json, salvaged
+
+GEMINI_RETRYABLE_ERRORS = (google.api_core.exceptions.ResourceExhausted, google.api_core.exceptions.InternalServerError,
+                           google.api_core.exceptions.ServiceUnavailable, google.api_core.exceptions.GatewayTimeout)
+
+def last_resort_answer(salvaged_json, definition_type, definition_name):
+    """After the last attempt: the best salvaged answer as a SalvagedAnswer (or None if there was none)."""
+    if not isinstance(salvaged_json, dict): return None
+    print(f"Warn: Using a salvaged (possibly incomplete) Gemini {definition_type} answer for '{definition_name}' as a last resort.")
+    return SalvagedAnswer(salvaged_json)
+
+def request_gemini_json(definition_type, definition_name, prompt, html_content, max_retries=GEMINI_MAX_RETRIES, generation_config=None):
+    """
+    Sends prompt + page HTML to Gemini and returns the parsed JSON answer (None on failure), with retries.
+    Answers are served from / stored in the response cache, so an unchanged page is only ever sent once.
+    A truncated/malformed (salvaged) answer is retried; if every attempt fails, the last one comes back as a SalvagedAnswer.
+    `generation_config` (see gemini_generation_config) requests schema-constrained JSON.
+    """
+    cached_json = lookup_gemini_cache(definition_type, definition_name, html_content)
+    if cached_json is not None: return cached_json
+    if not GEMINI_MODEL:
+        print("Error: Gemini model not configured.")
+        return None
+
+    salvaged_json = None
+    for attempt in range(max_retries):
+        if app and app.stop_event.is_set():
+            print(f"  Skip Gemini {definition_type} HTML attempt {attempt+1}: Stop requested.")
+            return None
+        retry_delay = backoff_delay(attempt, GEMINI_BACKOFF_BASE_S, GEMINI_BACKOFF_CAP_S)
+        try:
+            print(f"  Attempt {attempt + 1} for {definition_name} {definition_type} HTML analysis...")
+            response = generate_gemini_content(prompt + "\n\nHTML SOURCE:\n```html\n" + html_content + "\n```", generation_config)
+            parsed_json, salvaged = parse_gemini_answer(response.text, definition_type, definition_name)
+            if not salvaged:
+                store_gemini_json(definition_type, definition_name, html_content, parsed_json)
+                return parsed_json
+            salvaged_json = parsed_json
+        except json.JSONDecodeError as e:
+            print(f"Error: Bad JSON from Gemini {definition_type} HTML analysis for '{definition_name}': {e}")
+            err_line, err_col = getattr(e, 'lineno', 'N/A'), getattr(e, 'colno', 'N/A')
+            print(f"  Error at line ~{err_line}, column ~{err_col}")
+            print(f"  Received Text: ```\n{response.text}\n```")
+        except GEMINI_RETRYABLE_ERRORS as e:
+             print(f"Warn: Gemini API error attempt {attempt+1} for {definition_type} HTML analysis of '{definition_name}': {e}")
+        except Exception as e:
+            print(f"Error: Unexpected Gemini {definition_type} HTML analysis error attempt {attempt+1} for '{definition_name}': {e}")
+            print(traceback.format_exc())
+            return last_resort_answer(salvaged_json, definition_type, definition_name)
+        if attempt == max_retries - 1:
+            print(f"Error: Max Gemini retries reached for {definition_type} HTML analysis of '{definition_name}'.")
+            return last_resort_answer(salvaged_json, definition_type, definition_name)
+        print(f"  Retrying Gemini {definition_type} HTML analysis in {retry_delay:.1f}s...")
+        time.sleep(retry_delay)
+    return last_resort_answer(salvaged_json, definition_type, definition_name)
+
+# --- Asynchronous Gemini Stage (GEMINI_ASYNC_STAGE; browser workers hand pages off instead of waiting) ---
+async def generate_gemini_content_async(gemini_stage, prompt_text, generation_config=None):
+    """Async GEMINI_MODEL.generate_content through the stage's token bucket and in-flight cap; 429s pause the whole stage."""
+    async def send_request():
+        generate_async = getattr(GEMINI_MODEL, "generate_content_async", None)
+        if not generate_async: return await asyncio.to_thread(send_gemini_request, prompt_text, generation_config) # Client without async support
+        if generation_config and GEMINI_STRUCTURED_OUTPUT:
+            try: return await generate_async(prompt_text, generation_config=generation_config)
+            except (TypeError, ValueError) as config_err: disable_structured_output(config_err)
+        return await generate_async(prompt_text)
+    try:
+        response = await gemini_stage.call(send_request)
+    except google.api_core.exceptions.ResourceExhausted:
+        CONCURRENCY.record_gemini(rate_limited=True)
+        raise
+    CONCURRENCY.record_gemini(rate_limited=False)
+    record_gemini_exchange(prompt_text, response)
+    return response
+
+async def request_gemini_json_async(gemini_stage, stop_event, definition_type, definition_name, prompt, html_content,
+                                    max_retries=GEMINI_MAX_RETRIES, use_cache=True, generation_config=None, retry_salvaged=True):
+    """
+    Coroutine twin of request_gemini_json: same cache, parsing and retry rules, but backoff never blocks a thread.
+    With `retry_salvaged` False a salvaged answer is returned at once as a SalvagedAnswer (batches split it themselves).
+    """
+    cached_json = lookup_gemini_cache(definition_type, definition_name, html_content) if use_cache else None
+    if cached_json is not None: return cached_json
+    if not GEMINI_MODEL:
+        print("Error: Gemini model not configured.")
+        return None
+
+    salvaged_json = None
+    for attempt in range(max_retries):
+        if stop_event.is_set(): return None
+        retry_delay = backoff_delay(attempt, GEMINI_BACKOFF_BASE_S, GEMINI_BACKOFF_CAP_S)
+        try:
+            print(f"  Attempt {attempt + 1} for {definition_name} {definition_type} HTML analysis (async)...")
+            response = await generate_gemini_content_async(gemini_stage, prompt + "\n\nHTML SOURCE:\n```html\n" + html_content + "\n```", generation_config)
+            parsed_json, salvaged = parse_gemini_answer(response.text, definition_type, definition_name)
+            if not salvaged:
+                if use_cache: store_gemini_json(definition_type, definition_name, html_content, parsed_json)
+                return parsed_json
+            salvaged_json = parsed_json
+            if not retry_salvaged: return SalvagedAnswer(parsed_json) if isinstance(parsed_json, dict) else None
+        except json.JSONDecodeError as e:
+            print(f"Error: Bad JSON from Gemini {definition_type} HTML analysis for '{definition_name}': {e}")
+            print(f"  Received Text: ```\n{response.text}\n```")
+        except GEMINI_RETRYABLE_ERRORS as e:
+            print(f"Warn: Gemini API error attempt {attempt+1} for {definition_type} HTML analysis of '{definition_name}': {e}")
+            if isinstance(e, google.api_core.exceptions.ResourceExhausted): gemini_stage.rate_limited(retry_delay) # Everyone backs off, not just this request
+        if attempt == max_retries - 1:
+            print(f"Error: Max Gemini retries reached for {definition_type} HTML analysis of '{definition_name}'.")
+            return last_resort_answer(salvaged_json, definition_type, definition_name)
+        print(f"  Retrying Gemini {definition_type} HTML analysis of {definition_name} in {retry_delay:.1f}s...")
+        await asyncio.sleep(retry_delay)
+    return last_resort_answer(salvaged_json, definition_type, definition_name)
 
 # --- Gemini API Functions (Unchanged) ---
 def load_api_key():
@@ -55,30 +446,33 @@ def load_api_key():
 
 def configure_gemini():
     global GEMINI_MODEL;
-    if not GEMINI_API_KEY: print("Error: API Key not loaded."); return False
+    if LLM_BACKEND in BACKENDS_NEEDING_API_KEY and not GEMINI_API_KEY: print("Error: API Key not loaded."); return False
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        GEMINI_MODEL = genai.GenerativeModel('gemini-1.5-flash') # Keep flash for now
-        print("Gemini configured successfully."); return True
+        GEMINI_MODEL = make_llm_model(LLM_BACKEND, GEMINI_MODEL_NAME, api_key=GEMINI_API_KEY, standin_url=LLM_STANDIN_URL)
+        print(f"LLM backend '{LLM_BACKEND}' configured successfully."); return True
     except Exception as e: messagebox.showerror("Gemini Config Error", f"Failed to configure Gemini: {e}"); return False
 
 # --- Gemini HTML Analysis Functions (Unchanged) ---
-def analyze_table_html_with_gemini(html_content, definition_name):
-    """Analyzes Table HTML source code with Gemini."""
-    global app
-    if not GEMINI_MODEL:
-        print("Error: Gemini model not configured.")
-        return None
-    if app and app.stop_event.is_set():
-        print(f"  Skip Gemini (Table HTML): Stop requested for {definition_name}.")
-        return None
-
-    definition_type = "Table" # For logging and clarity
-    print(f"  Analyzing {definition_type} '{definition_name}' HTML with Gemini...")
-    max_retries = 3
-    retry_delay = 5
-
-    prompt = f"""
+def add_segment_name_part(parsed_json, definition_name):
+    """Post-processing for AI Segment results: ensures the standard hl7SegmentName part comes first."""
+    if parsed_json and definition_name in parsed_json:
+        segment_data = parsed_json[definition_name]
+        if "versions" in segment_data and HL7_VERSION in segment_data["versions"]:
+            version_data = segment_data["versions"][HL7_VERSION]
+            if "parts" in version_data:
+                 parts_list = version_data["parts"]
+                 hl7_seg_part = {"mandatory": True, "name": "hl7SegmentName", "type": "ST", "table": "0076", "length": 3}
+                 if not parts_list or parts_list[0].get("name") != "hl7SegmentName":
+                      parts_list.insert(0, hl7_seg_part)
+                      # Recalculate totalFields if Gemini didn't already include it
+                      if 'totalFields' in version_data:
+                        version_data["totalFields"] = len(parts_list) # Update totalFields count
+                      print(f"  Prepended standard hl7SegmentName part for {definition_name} (AI Result)")
+    return parsed_json
+
+def table_html_prompt(definition_name):
+    """Gemini prompt for a Table page (request_gemini_json appends the page HTML)."""
+    return f"""
         Analyze the provided HTML source code for the HL7 Table definition page for ID '{definition_name}', version {HL7_VERSION}.
         Focus on the main data table, likely marked with classes like 'mat-table', 'table-definition', or similar structured `<tr>` and `<td>` elements within the primary content area (`<tbody>`). Ignore extraneous HTML like headers, footers, scripts, and sidebars.
         Find the table containing 'Value' and 'Description' (or 'Comment') columns.
@@ -104,63 +498,23 @@ def analyze_table_html_with_gemini(html_content, definition_name):
         Return ONLY the raw JSON object for table '{definition_name}' without any surrounding text or markdown formatting (` ```json ... ``` `).
     """
 
-    for attempt in range(max_retries):
-        if app and app.stop_event.is_set():
-            print(f"  Skip Gemini {definition_type} HTML attempt {attempt+1}: Stop requested.")
-            return None
-        try:
-            print(f"  Attempt {attempt + 1} for {definition_name} {definition_type} HTML analysis...")
-            response = GEMINI_MODEL.generate_content(prompt + "\n\nHTML SOURCE:\n```html\n" + html_content + "\n```")
-
-            json_text = response.text.strip()
-            if json_text.startswith("```json"): json_text = json_text[7:]
-            elif json_text.startswith("```"): json_text = json_text[3:]
-            if json_text.endswith("```"): json_text = json_text[:-3]
-            json_text = json_text.strip()
-
-            parsed_json = json.loads(json_text)
-            print(f"  Successfully parsed Gemini {definition_type} HTML response for {definition_name}.")
-            return parsed_json
-        except json.JSONDecodeError as e:
-            print(f"Error: Bad JSON from Gemini {definition_type} HTML analysis for '{definition_name}': {e}")
-            err_line, err_col = getattr(e, 'lineno', 'N/A'), getattr(e, 'colno', 'N/A')
-            print(f"  Error at line ~{err_line}, column ~{err_col}")
-            print(f"  Received Text: ```\n{response.text}\n```")
-            if attempt == max_retries - 1:
-                print(f"  Max retries reached for Gemini {definition_type} HTML analysis of {definition_name}.")
-                return None
-            print(f"  Retrying Gemini {definition_type} HTML analysis in {retry_delay}s...")
-            time.sleep(retry_delay)
-        except (google.api_core.exceptions.ResourceExhausted, google.api_core.exceptions.InternalServerError, google.api_core.exceptions.ServiceUnavailable, google.api_core.exceptions.GatewayTimeout) as e:
-             print(f"Warn: Gemini API error attempt {attempt+1} for {definition_type} HTML analysis of '{definition_name}': {e}")
-             if attempt < max_retries-1:
-                  print(f"  Retrying in {retry_delay}s...")
-                  time.sleep(retry_delay)
-             else:
-                  print(f"Error: Max Gemini retries reached for {definition_type} HTML analysis of '{definition_name}'."); return None
-        except Exception as e:
-            print(f"Error: Unexpected Gemini {definition_type} HTML analysis error attempt {attempt+1} for '{definition_name}': {e}")
-            print(traceback.format_exc())
-            return None
-    return None
-
-def analyze_datatype_html_with_gemini(html_content, definition_name):
-    """Analyzes DataType HTML source code with Gemini."""
+def analyze_table_html_with_gemini(html_content, definition_name):
+    """Analyzes Table HTML source code with Gemini."""
     global app
-    if not GEMINI_MODEL:
-        print("Error: Gemini model not configured.")
-        return None
     if app and app.stop_event.is_set():
-        print(f"  Skip Gemini (DataType HTML): Stop requested for {definition_name}.")
+        print(f"  Skip Gemini (Table HTML): Stop requested for {definition_name}.")
         return None
 
-    definition_type = "DataType" # For logging and clarity
+    definition_type = "Table" # For logging and clarity
     print(f"  Analyzing {definition_type} '{definition_name}' HTML with Gemini...")
-    max_retries = 3
-    retry_delay = 5
-    separator_value = "."
+    return request_gemini_json(definition_type, definition_name, table_html_prompt(definition_name), html_content,
+                               generation_config=gemini_generation_config("Tables", [definition_name]))
 
-    prompt = f"""
+def datatype_html_prompt(definition_name):
+    """Gemini prompt for a DataType page (request_gemini_json appends the page HTML)."""
+    definition_type = "DataType"
+    separator_value = "."
+    return f"""
         Analyze the provided HTML source code for the HL7 {definition_type} definition page for '{definition_name}', version {HL7_VERSION}.
         Focus on the main data table defining the components, likely marked with classes like 'mat-table', 'table-definition', or similar structured `<tr>` and `<td>` elements within the primary content area (`<tbody>`). Look for columns like 'FIELD', 'LENGTH', 'DATA TYPE', 'OPTIONALITY', 'REPEATABILITY', 'TABLE'. Ignore extraneous HTML like headers, footers, scripts, and sidebars.
         Extract the required information based on the rules below.
@@ -191,63 +545,23 @@ def analyze_datatype_html_with_gemini(html_content, definition_name):
         {{ "name": "assigningAuthority", "type": "HD", "length": 227, "table": "0363" }}
         """
 
-    for attempt in range(max_retries):
-        if app and app.stop_event.is_set():
-            print(f"  Skip Gemini {definition_type} HTML attempt {attempt+1}: Stop requested.")
-            return None
-        try:
-            print(f"  Attempt {attempt + 1} for {definition_name} {definition_type} HTML analysis...")
-            response = GEMINI_MODEL.generate_content(prompt + "\n\nHTML SOURCE:\n```html\n" + html_content + "\n```")
-
-            json_text = response.text.strip()
-            if json_text.startswith("```json"): json_text = json_text[7:]
-            elif json_text.startswith("```"): json_text = json_text[3:]
-            if json_text.endswith("```"): json_text = json_text[:-3]
-            json_text = json_text.strip()
-
-            parsed_json = json.loads(json_text)
-            print(f"  Successfully parsed Gemini {definition_type} HTML response for {definition_name}.")
-            return parsed_json
-        except json.JSONDecodeError as e:
-            print(f"Error: Bad JSON from Gemini {definition_type} HTML analysis for '{definition_name}': {e}")
-            err_line, err_col = getattr(e, 'lineno', 'N/A'), getattr(e, 'colno', 'N/A')
-            print(f"  Error at line ~{err_line}, column ~{err_col}")
-            print(f"  Received Text: ```\n{response.text}\n```")
-            if attempt == max_retries - 1:
-                print(f"  Max retries reached for Gemini {definition_type} HTML analysis of {definition_name}.")
-                return None
-            print(f"  Retrying Gemini {definition_type} HTML analysis in {retry_delay}s...")
-            time.sleep(retry_delay)
-        except (google.api_core.exceptions.ResourceExhausted, google.api_core.exceptions.InternalServerError, google.api_core.exceptions.ServiceUnavailable, google.api_core.exceptions.GatewayTimeout) as e:
-             print(f"Warn: Gemini API error attempt {attempt+1} for {definition_type} HTML analysis of '{definition_name}': {e}")
-             if attempt < max_retries-1:
-                  print(f"  Retrying in {retry_delay}s...")
-                  time.sleep(retry_delay)
-             else:
-                  print(f"Error: Max Gemini retries reached for {definition_type} HTML analysis of '{definition_name}'."); return None
-        except Exception as e:
-            print(f"Error: Unexpected Gemini {definition_type} HTML analysis error attempt {attempt+1} for '{definition_name}': {e}")
-            print(traceback.format_exc())
-            return None
-    return None
-
-def analyze_segment_html_with_gemini(html_content, definition_name):
-    """Analyzes Segment HTML source code with Gemini."""
+def analyze_datatype_html_with_gemini(html_content, definition_name):
+    """Analyzes DataType HTML source code with Gemini."""
     global app
-    if not GEMINI_MODEL:
-        print("Error: Gemini model not configured.")
-        return None
     if app and app.stop_event.is_set():
-        print(f"  Skip Gemini (Segment HTML): Stop requested for {definition_name}.")
+        print(f"  Skip Gemini (DataType HTML): Stop requested for {definition_name}.")
         return None
 
-    definition_type = "Segment" # For logging and clarity
+    definition_type = "DataType" # For logging and clarity
     print(f"  Analyzing {definition_type} '{definition_name}' HTML with Gemini...")
-    max_retries = 3
-    retry_delay = 5
-    separator_value = "."
+    return request_gemini_json(definition_type, definition_name, datatype_html_prompt(definition_name), html_content,
+                               generation_config=gemini_generation_config("DataTypes", [definition_name]))
 
-    prompt = f"""
+def segment_html_prompt(definition_name):
+    """Gemini prompt for a Segment page (request_gemini_json appends the page HTML)."""
+    definition_type = "Segment"
+    separator_value = "."
+    return f"""
         Analyze the provided HTML source code for the HL7 {definition_type} definition page for '{definition_name}', version {HL7_VERSION}.
         Focus on the main data table defining the fields, likely marked with classes like 'mat-table', 'table-definition', or similar structured `<tr>` and `<td>` elements within the primary content area (`<tbody>`). Look for columns like 'FIELD', 'LENGTH', 'DATA TYPE', 'OPTIONALITY', 'REPEATABILITY', 'TABLE'. Ignore extraneous HTML like headers, footers, scripts, and sidebars.
         Extract the required information based on the rules below.
@@ -278,62 +592,106 @@ def analyze_segment_html_with_gemini(html_content, definition_name):
         {{ "name": "patientClass", "type": "IS", "length": 1, "mandatory": true, "table": "0004" }}
         """
 
-    for attempt in range(max_retries):
-        if app and app.stop_event.is_set():
-            print(f"  Skip Gemini {definition_type} HTML attempt {attempt+1}: Stop requested.")
-            return None
-        try:
-            print(f"  Attempt {attempt + 1} for {definition_name} {definition_type} HTML analysis...")
-            response = GEMINI_MODEL.generate_content(prompt + "\n\nHTML SOURCE:\n```html\n" + html_content + "\n```")
-
-            json_text = response.text.strip()
-            if json_text.startswith("```json"): json_text = json_text[7:]
-            elif json_text.startswith("```"): json_text = json_text[3:]
-            if json_text.endswith("```"): json_text = json_text[:-3]
-            json_text = json_text.strip()
-
-            parsed_json = json.loads(json_text)
-            print(f"  Successfully parsed Gemini {definition_type} HTML response for {definition_name}.")
-            # --- Post-processing for Segments: Ensure standard part exists ---
-            if parsed_json and definition_name in parsed_json:
-                segment_data = parsed_json[definition_name]
-                if "versions" in segment_data and HL7_VERSION in segment_data["versions"]:
-                    version_data = segment_data["versions"][HL7_VERSION]
-                    if "parts" in version_data:
-                         parts_list = version_data["parts"]
-                         hl7_seg_part = {"mandatory": True, "name": "hl7SegmentName", "type": "ST", "table": "0076", "length": 3}
-                         if not parts_list or parts_list[0].get("name") != "hl7SegmentName":
-                              parts_list.insert(0, hl7_seg_part)
-                              # Recalculate totalFields if Gemini didn't already include it
-                              if 'totalFields' in version_data:
-                                version_data["totalFields"] = len(parts_list) # Update totalFields count
-                              print(f"  Prepended standard hl7SegmentName part for {definition_name} (AI Result)")
-            # --- End Post-processing ---
-            return parsed_json
-        except json.JSONDecodeError as e:
-            print(f"Error: Bad JSON from Gemini {definition_type} HTML analysis for '{definition_name}': {e}")
-            err_line, err_col = getattr(e, 'lineno', 'N/A'), getattr(e, 'colno', 'N/A')
-            print(f"  Error at line ~{err_line}, column ~{err_col}")
-            print(f"  Received Text: ```\n{response.text}\n```")
-            if attempt == max_retries - 1:
-                print(f"  Max retries reached for Gemini {definition_type} HTML analysis of {definition_name}.")
-                return None
-            print(f"  Retrying Gemini {definition_type} HTML analysis in {retry_delay}s...")
-            time.sleep(retry_delay)
-        except (google.api_core.exceptions.ResourceExhausted, google.api_core.exceptions.InternalServerError, google.api_core.exceptions.ServiceUnavailable, google.api_core.exceptions.GatewayTimeout) as e:
-             print(f"Warn: Gemini API error attempt {attempt+1} for {definition_type} HTML analysis of '{definition_name}': {e}")
-             if attempt < max_retries-1:
-                  print(f"  Retrying in {retry_delay}s...")
-                  time.sleep(retry_delay)
-             else:
-                  print(f"Error: Max Gemini retries reached for {definition_type} HTML analysis of '{definition_name}'."); return None
-        except Exception as e:
-            print(f"Error: Unexpected Gemini {definition_type} HTML analysis error attempt {attempt+1} for '{definition_name}': {e}")
-            print(traceback.format_exc())
-            return None
-    return None
+def analyze_segment_html_with_gemini(html_content, definition_name):
+    """Analyzes Segment HTML source code with Gemini."""
+    global app
+    if app and app.stop_event.is_set():
+        print(f"  Skip Gemini (Segment HTML): Stop requested for {definition_name}.")
+        return None
+
+    definition_type = "Segment" # For logging and clarity
+    print(f"  Analyzing {definition_type} '{definition_name}' HTML with Gemini...")
+    return add_segment_name_part(request_gemini_json(definition_type, definition_name, segment_html_prompt(definition_name), html_content,
+                               generation_config=gemini_generation_config("Segments", [definition_name])), definition_name)
+
+GEMINI_HTML_PROMPTS = { # Category -> (definition type used in logs and cache keys, prompt builder)
+    "Tables": ("Table", table_html_prompt), "DataTypes": ("DataType", datatype_html_prompt), "Segments": ("Segment", segment_html_prompt),
+}
+
+BATCH_NAME_PLACEHOLDER = "<NAME>"
+
+def batch_html_prompt(definition_type, build_prompt, definition_names):
+    """Prompt for several pages of one category in a single request; the answer is one object keyed by definition name."""
+    return f"""
+        The HTML SOURCE below contains {len(definition_names)} separate HL7 {definition_type} definition pages, version {HL7_VERSION}. Each page starts with a line '=== {definition_type} <name> ==='.
+        Apply the rules below to EACH page on its own, reading '{BATCH_NAME_PLACEHOLDER}' as that page's name.
+        Return ONE raw JSON object whose top-level keys are exactly {json.dumps([str(name) for name in definition_names])}.
+        The value under each key MUST be exactly the value the rules below specify for that page's top-level key.
+        Return ONLY this raw JSON object without any surrounding text or markdown formatting (` ```json ... ``` `).
+    """ + build_prompt(BATCH_NAME_PLACEHOLDER)
+
+async def send_gemini_batch_async(gemini_stage, stop_event, category, items):
+    """
+    RequestBatcher callback: one Gemini request for several (definition_name, html_content) pages of one category.
+    Returns a parsed {name: value} answer (or None) per page; pages missing from the batched answer are requested alone,
+    and so is the last page of a truncated (salvaged) batch answer.
+    """
+    definition_type, build_prompt = GEMINI_HTML_PROMPTS[category]
+    async def request_single(definition_name, html_content):
+        return await request_gemini_json_async(gemini_stage, stop_event, definition_type, definition_name, build_prompt(definition_name), html_content,
+                                               generation_config=gemini_generation_config(category, [definition_name]))
+    if len(items) == 1: return [await request_single(*items[0])]
+
+    names = [definition_name for definition_name, _ in items]
+    print(f"  Sending one batched Gemini {definition_type} request for {len(items)} pages: {', '.join(map(str, names))}")
+    batch_html = "\n".join(f"=== {definition_type} {definition_name} ===\n{html_content}" for definition_name, html_content in items)
+    batch_json = await request_gemini_json_async(gemini_stage, stop_event, f"{definition_type} batch", "+".join(map(str, names)),
+                                                 batch_html_prompt(definition_type, build_prompt, names), batch_html, use_cache=False,
+                                                 generation_config=gemini_generation_config(category, names), retry_salvaged=False)
+    answers = {str(key): value for key, value in batch_json.items()} if isinstance(batch_json, dict) else {}
+    salvaged = isinstance(batch_json, SalvagedAnswer)
+    if salvaged and answers: # Pages before the last key are complete; the last one may have lost rows/parts
+        truncated_name = list(answers)[-1]; del answers[truncated_name]
+        print(f"  Batched {definition_type} answer was truncated in '{truncated_name}'; keeping {len(answers)} complete pages (not cached).")
+    results = [None] * len(items); retry_indexes = []
+    for index, (definition_name, html_content) in enumerate(items):
+        value = answers.get(str(definition_name))
+        if value is None:
+            retry_indexes.append(index); continue
+        results[index] = {str(definition_name) if category == "Tables" else definition_name: value} # Same shape as a single answer
+        if not salvaged: store_gemini_json(definition_type, definition_name, html_content, results[index]) # Cached under the single-page key
+    if retry_indexes and not stop_event.is_set():
+        print(f"  Batched {definition_type} answer lacked {len(retry_indexes)} of {len(items)} pages; requesting those individually.")
+        retried = await asyncio.gather(*(request_single(*items[index]) for index in retry_indexes))
+        for index, parsed_json in zip(retry_indexes, retried): results[index] = parsed_json
+    return results
+
+async def analyze_html_with_gemini_async(gemini_stage, stop_event, category, definition_name, html_content):
+    """Async counterpart of analyze_*_html_with_gemini for one page ('Tables', 'DataTypes', 'Segments')."""
+    definition_type, build_prompt = GEMINI_HTML_PROMPTS[category]
+    print(f"  Analyzing {definition_type} '{definition_name}' HTML with Gemini (async stage)...")
+    if gemini_stage.batcher: # Cache hits skip the batch; misses wait up to GEMINI_BATCH_WINDOW_S for company
+        parsed_json = lookup_gemini_cache(definition_type, definition_name, html_content)
+        if parsed_json is None:
+            parsed_json = await gemini_stage.batcher.submit(category, (definition_name, html_content), estimate_prompt_tokens(html_content))
+    else:
+        parsed_json = await request_gemini_json_async(gemini_stage, stop_event, definition_type, definition_name, build_prompt(definition_name), html_content,
+                                                      generation_config=gemini_generation_config(category, [definition_name]))
+    return add_segment_name_part(parsed_json, definition_name) if category == "Segments" else parsed_json
+
+# --- Selenium Functions ---
+_CHROMEDRIVER_PATH = None # Resolved once per run; ChromeDriverManager().install() is slow (version lookup + cache check)
+_CHROMEDRIVER_LOCK = threading.Lock()
+
+def get_chromedriver_path():
+    """Returns the ChromeDriver executable path, installing/resolving it only on first use."""
+    global _CHROMEDRIVER_PATH
+    with _CHROMEDRIVER_LOCK:
+        if _CHROMEDRIVER_PATH is None:
+            # Suppress webdriver-manager logs
+            os.environ['WDM_LOG_LEVEL'] = '0'
+            _CHROMEDRIVER_PATH = ChromeDriverManager().install()
+        return _CHROMEDRIVER_PATH
+
+def apply_lean_network_blocking(driver):
+    """Blocks images, fonts, analytics (and optionally CSS) for every request this driver makes, via CDP."""
+    blocked = LEAN_BLOCKED_URL_PATTERNS + (["*.css"] if LEAN_BLOCK_STYLESHEETS else [])
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked})
+    except Exception as cdp_err: # Non-fatal: the page still loads, just heavier
+        print(f"Warn: Could not enable lean resource blocking: {cdp_err}")
 
-# --- Selenium Functions (Unchanged) ---
 def setup_driver():
     options = webdriver.ChromeOptions()
     options.add_argument("--headless")
@@ -341,14 +699,19 @@ def setup_driver():
     options.add_argument("--window-size=1920,1200")
     options.add_argument("--log-level=3")
     options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    if BROWSER_PROFILE == "lean":
+        for argument in LEAN_CHROME_ARGUMENTS: options.add_argument(argument)
+        options.add_experimental_option('prefs', {"profile.managed_default_content_settings.images": 2})
+        options.page_load_strategy = 'eager' # Return at DOMContentLoaded; settle waits cover the Angular data load
 
-    # Suppress webdriver-manager logs
-    os.environ['WDM_LOG_LEVEL'] = '0'
     # Make sure the cache path is user-writable, use temporary dir if needed
     try:
-        service = Service(ChromeDriverManager().install())
+        service = Service(get_chromedriver_path())
         driver = webdriver.Chrome(service=service, options=options)
         driver.implicitly_wait(3) # Implicit wait can sometimes help with dynamic content
+        driver.set_script_timeout(DOM_SETTLE_TIMEOUT + 5) # Headroom for the async settle waits
+        install_settle_hooks(driver)
+        if BROWSER_PROFILE == "lean": apply_lean_network_blocking(driver)
         return driver
     except WebDriverException as e:
         error_msg = f"Failed WebDriver init: {e}\n";
@@ -366,11 +729,263 @@ def setup_driver():
         else: print(err_msg); print(traceback.format_exc())
         return None
 
-def get_definition_list(driver, definition_type, status_queue, stop_event):
+class DriverPool:
+    """
+    Bounded, thread-safe pool of reusable WebDriver instances.
+    Drivers are health-checked on checkout (crashed sessions are discarded and replaced)
+    and recycled after DRIVER_RECYCLE_AFTER_PAGES pages to cap Chrome memory growth.
+    """
+    def __init__(self, size=DRIVER_POOL_SIZE, recycle_after=DRIVER_RECYCLE_AFTER_PAGES, status_queue=None):
+        self.size = max(1, size)
+        self.recycle_after = recycle_after
+        self.status_queue = status_queue
+        self._idle = queue.LifoQueue() # LIFO keeps the most recently used (warm) drivers busy
+        self._page_counts = {} # id(driver) -> pages served since launch
+        self._live_drivers = {} # id(driver) -> driver (idle and checked out)
+        self._lock = threading.Lock()
+        self._reserved = 0 # Drivers currently being launched (counted against size)
+        self._closed = False
+        self.created_count = 0 # Stats: total drivers launched over the pool's life
+        self.replaced_count = 0 # Stats: drivers discarded (crashed or recycled)
+
+    def _log(self, level, msg):
+        if self.status_queue: self.status_queue.put((level, msg))
+        else: print(msg)
+
+    def _launch(self):
+        """Creates a new driver and registers it. Caller must have reserved a slot."""
+        driver = setup_driver()
+        with self._lock:
+            self._reserved -= 1
+            if driver is None or self._closed:
+                if driver is not None:
+                    try: driver.quit()
+                    except Exception: pass
+                return None
+            self._live_drivers[id(driver)] = driver
+            self._page_counts[id(driver)] = 0
+            self.created_count += 1
+        return driver
+
+    def _reserve_slot(self):
+        """Reserves capacity for a new driver if the pool is below its size limit."""
+        with self._lock:
+            if self._closed or len(self._live_drivers) + self._reserved >= self.size: return False
+            self._reserved += 1
+            return True
+
+    def _discard(self, driver, reason):
+        with self._lock:
+            self._live_drivers.pop(id(driver), None)
+            pages = self._page_counts.pop(id(driver), 0)
+            self.replaced_count += 1
+        self._log('debug', f"  DriverPool: discarding driver ({reason}, {pages} pages served).")
+        try: driver.quit()
+        except Exception: pass
+
+    @staticmethod
+    def is_healthy(driver):
+        """Cheap liveness probe: a crashed/closed session raises on any command."""
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def warm_up(self, count=DRIVER_POOL_WARMUP):
+        """Launches up to `count` drivers in parallel so the first checkouts don't pay startup cost."""
+        count = min(max(0, count), self.size)
+        if count == 0: return 0
+        get_chromedriver_path() # Resolve once before the parallel launches
+        slots = [self._reserve_slot() for _ in range(count)]
+        to_launch = sum(1 for ok in slots if ok)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=to_launch or 1) as warm_executor:
+            drivers = list(warm_executor.map(lambda _: self._launch(), range(to_launch)))
+        started = 0
+        for driver in drivers:
+            if driver: self._idle.put(driver); started += 1
+        self._log('status', f"DriverPool warmed up: {started}/{count} drivers ready (pool size {self.size}).")
+        return started
+
+    def checkout(self, stop_event=None, timeout=None):
+        """
+        Returns a healthy driver, launching one if below the size limit, otherwise waiting for a return.
+        Returns None if the pool is closed, stop is requested, or `timeout` seconds pass.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self._closed:
+            if stop_event is not None and stop_event.is_set(): return None
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = None
+            if driver is not None:
+                if self.is_healthy(driver): return driver
+                self._discard(driver, "crashed session")
+                continue
+            if self._reserve_slot():
+                driver = self._launch()
+                if driver is not None: return driver
+                self._log('error', "  DriverPool: failed to launch a replacement driver.")
+                return None
+            if deadline is not None and time.monotonic() >= deadline: return None
+            try:
+                driver = self._idle.get(timeout=0.5) # Short waits so stop requests are noticed
+            except queue.Empty:
+                continue
+            if self.is_healthy(driver): return driver
+            self._discard(driver, "crashed session")
+        return None
+
+    def checkin(self, driver, pages_used=1):
+        """Returns a driver to the pool, recycling it if it has served too many pages."""
+        if driver is None: return
+        with self._lock:
+            known = id(driver) in self._live_drivers
+            if known: self._page_counts[id(driver)] = self._page_counts.get(id(driver), 0) + pages_used
+            pages = self._page_counts.get(id(driver), 0)
+        if not known or self._closed:
+            try: driver.quit()
+            except Exception: pass
+            return
+        if self.recycle_after and pages >= self.recycle_after:
+            self._discard(driver, "recycled")
+            return
+        self._idle.put(driver)
+
+    def close_all(self):
+        """Quits every driver (idle and checked out) and rejects further checkouts."""
+        with self._lock:
+            self._closed = True
+            drivers = list(self._live_drivers.values())
+            self._live_drivers.clear(); self._page_counts.clear()
+        for driver in drivers:
+            try: driver.quit()
+            except Exception as q_err: self._log('error', f"DriverPool: error quitting WebDriver: {q_err}")
+        self._log('status', f"DriverPool closed. Drivers launched: {self.created_count}, replaced/recycled: {self.replaced_count}.")
+
+# --- Event-Driven Wait Subsystem ---
+# Counts in-flight XHR/fetch requests in window.__hl7Inflight. Registered per driver as a new-document script
+# (see install_settle_hooks) so requests started while the page boots are counted too.
+INFLIGHT_HOOKS_JS = """
+if (!window.__hl7Inflight) {
+    window.__hl7Inflight = {count: 0, last: performance.now()};
+    const track = (delta) => { window.__hl7Inflight.count += delta; window.__hl7Inflight.last = performance.now(); };
+    const origSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() { track(1); this.addEventListener('loadend', () => track(-1)); return origSend.apply(this, arguments); };
+    if (window.fetch) { const origFetch = window.fetch; window.fetch = function() { track(1); return origFetch.apply(this, arguments).finally(() => track(-1)); }; }
+}
+"""
+
+# Resolves once the target (tbody at XPath arguments[0], or the whole document) exists and neither the DOM
+# nor any XHR/fetch request has changed for arguments[1] ms, or once the tbody holds every row its mat-table
+# data source reports. Re-runs the hooks above in case the CDP registration was unavailable.
+WAIT_FOR_SETTLED_JS = INFLIGHT_HOOKS_JS + """
+const [tbodyXPath, quietMs, timeoutMs, done] = arguments;
+const start = performance.now();
+const reportedRows = (target) => {
+    try {
+        const table = target.closest ? target.closest('table') : null;
+        const cmp = table && window.ng && window.ng.getComponent ? window.ng.getComponent(table) : null;
+        const source = cmp ? cmp.dataSource : null;
+        const data = Array.isArray(source) ? source : (source ? source.data : null);
+        return Array.isArray(data) ? data.length : 0;
+    } catch (e) { return 0; }
+};
+const findTarget = () => tbodyXPath ? document.evaluate(tbodyXPath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue : document.body;
+let lastChange = performance.now();
+const observer = new MutationObserver(() => { lastChange = performance.now(); });
+observer.observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+let timer = null;
+const finish = (status) => {
+    observer.disconnect(); clearInterval(timer);
+    const target = findTarget();
+    done({status: status, elapsedMs: Math.round(performance.now() - start), rows: target && target.rows ? target.rows.length : 0});
+};
+timer = setInterval(() => {
+    const now = performance.now(); const target = findTarget();
+    if (now - start > timeoutMs) { finish(target ? 'timeout' : 'missing'); return; }
+    if (!target) return;
+    const expectedRows = tbodyXPath ? reportedRows(target) : 0;
+    if (expectedRows > 0 && target.rows && target.rows.length >= expectedRows) { finish('complete'); return; }
+    const net = window.__hl7Inflight;
+    if (net.count <= 0 && now - Math.max(lastChange, net.last) >= quietMs) finish('stable');
+}, 50);
+"""
+
+class WaitMetrics:
+    """Thread-safe per-page record of time spent waiting vs. the fixed-sleep budget it replaced."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pages = {} # page_key -> {"waits", "waited_s", "fixed_equiv_s", "page_s"}
+
+    def reset(self):
+        with self._lock: self.pages = {}
+
+    def _entry(self, page_key):
+        return self.pages.setdefault(page_key, {"waits": 0, "waited_s": 0.0, "fixed_equiv_s": 0.0, "page_s": 0.0})
+
+    def record_wait(self, page_key, waited_s, fixed_equiv_s):
+        with self._lock:
+            entry = self._entry(page_key or "unknown")
+            entry["waits"] += 1; entry["waited_s"] += waited_s; entry["fixed_equiv_s"] += fixed_equiv_s
+
+    def record_page(self, page_key, page_s):
+        with self._lock: self._entry(page_key)["page_s"] += page_s
+
+    def pop_page(self, page_key):
+        """Removes and returns one page's entry (used to ship metrics back from worker processes)."""
+        with self._lock: return self.pages.pop(page_key, None)
+
+    def merge_page(self, page_key, entry):
+        with self._lock:
+            target = self._entry(page_key)
+            for metric, value in entry.items(): target[metric] = target.get(metric, 0) + value
+
+    def summary(self):
+        """Returns (pages, total waited seconds, total fixed-sleep seconds replaced, total page seconds)."""
+        with self._lock:
+            entries = list(self.pages.values())
+        return (len(entries), sum(e["waited_s"] for e in entries), sum(e["fixed_equiv_s"] for e in entries), sum(e["page_s"] for e in entries))
+
+    def save(self, file_path):
+        with self._lock:
+            data = {"strategy": WAIT_STRATEGY, "pages": {k: {m: round(v, 3) for m, v in e.items()} for k, e in sorted(self.pages.items())}}
+        with open(file_path, 'w', encoding='utf-8') as f: json.dump(data, f, indent=2)
+
+WAIT_METRICS = WaitMetrics()
+
+def install_settle_hooks(driver):
+    """Registers the XHR/fetch in-flight counters to run before any page script on every navigation, via CDP."""
+    try: driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": INFLIGHT_HOOKS_JS})
+    except Exception as cdp_err: # Non-fatal: the settle wait installs the hooks itself, missing bootstrap requests
+        print(f"Warn: Could not register settle wait network hooks: {cdp_err}")
+
+def wait_for_dom_settled(driver, tbody_xpath=None, page_key=None, fixed_equiv_s=0.5):
+    """
+    Waits for the page (or the tbody at `tbody_xpath`) to settle. In "fixed" mode this is just
+    time.sleep(fixed_equiv_s). Returns the JS result dict ({'status', 'elapsedMs', 'rows'}), or {} on error.
+    """
+    start = time.monotonic()
+    result = {}
+    if WAIT_STRATEGY == "fixed":
+        time.sleep(fixed_equiv_s)
+        result = {"status": "fixed"}
+    else:
+        try:
+            result = driver.execute_async_script(WAIT_FOR_SETTLED_JS, tbody_xpath, DOM_QUIET_MS, int(DOM_SETTLE_TIMEOUT * 1000)) or {}
+        except (TimeoutException, WebDriverException) as wait_err:
+            print(f"  Warn: Settle wait failed for {page_key}: {str(wait_err).splitlines()[0] if str(wait_err) else wait_err}")
+    WAIT_METRICS.record_wait(page_key, time.monotonic() - start, fixed_equiv_s)
+    return result
+
+def get_definition_list(driver, definition_type, status_queue, stop_event, on_name=None):
+    """Scrolls a category list page and returns the sorted valid names. `on_name(name)` is called as each new name is found."""
     list_url = f"{BASE_URL}/{definition_type}"
     status_queue.put(('status', f"Fetching {definition_type} list from: {list_url}"))
     if stop_event.is_set(): return []
-    try: driver.get(list_url); time.sleep(0.2) # Short pause after load
+    page_key = f"list:{definition_type}"
+    try: driver.get(list_url); wait_for_dom_settled(driver, None, page_key, 0.2) # Short settle after load
     except WebDriverException as e: status_queue.put(('error', f"Navigation error: {list_url}: {e}")); return []
 
     definitions = []; wait_time_initial = 15; pause_after_scroll = 0.2
@@ -381,7 +996,7 @@ def get_definition_list(driver, definition_type, status_queue, stop_event):
         try: wait.until(EC.presence_of_element_located((By.XPATH, link_pattern_xpath))); status_queue.put(('status', "  Initial links detected. Starting scroll loop..."))
         except TimeoutException: status_queue.put(('error', f"Timeout waiting for initial links for {definition_type}.")); return []
 
-        found_hrefs = set(); stale_scroll_count = 0; max_stale_scrolls = 5
+        found_hrefs = set(); stale_scroll_count = 0; max_stale_scrolls = 5 if WAIT_STRATEGY == "fixed" else EVENT_MAX_STALE_SCROLLS
         last_scroll_position = -1 # Track scroll position to detect end more reliably
 
         while stale_scroll_count < max_stale_scrolls:
@@ -411,7 +1026,9 @@ def get_definition_list(driver, definition_type, status_queue, stop_event):
                                     is_valid_name = True
                             # --- End Validation ---
 
-                            if is_valid_name: found_hrefs.add(href); newly_added_this_pass += 1
+                            if is_valid_name:
+                                found_hrefs.add(href); newly_added_this_pass += 1
+                                if on_name: on_name(name) # Stream to the work queue while scrolling continues
                             elif name and name != "#": status_queue.put(('debug', f"  Skipping invalid name '{name}' for type '{definition_type}'"))
                     except StaleElementReferenceException: status_queue.put(('warning', "  Warn: Stale link encountered during scroll check.")); continue
                     except Exception as e: status_queue.put(('warning', f"  Warn: Error processing link attribute: {e}"))
@@ -426,12 +1043,12 @@ def get_definition_list(driver, definition_type, status_queue, stop_event):
                     try:
                         # Try scrolling last element into view first
                         driver.execute_script("arguments[0].scrollIntoView(true);", current_links[-1])
-                        time.sleep(pause_after_scroll)
+                        wait_for_dom_settled(driver, None, page_key, pause_after_scroll)
                         new_scroll_position = driver.execute_script("return window.pageYOffset;")
                         # If scrollIntoView didn't change position significantly, try scrolling page down
                         if abs(new_scroll_position - current_scroll_position) < 10:
                             driver.execute_script("window.scrollBy(0, window.innerHeight * 0.8);") # Scroll 80% of viewport
-                            time.sleep(pause_after_scroll)
+                            wait_for_dom_settled(driver, None, page_key, pause_after_scroll)
                             new_scroll_position = driver.execute_script("return window.pageYOffset;")
 
                         if abs(new_scroll_position - last_scroll_position) < 10: # Check if position actually changed much
@@ -471,18 +1088,69 @@ def get_definition_list(driver, definition_type, status_queue, stop_event):
     status_queue.put(('status', f"Final count: Found {len(definitions)} unique valid {definition_type}."))
     return definitions
 
-# Helper: Camel Case Conversion (Unchanged)
-def convert_to_camel_case(text):
-    if not text: return "unknownFieldName"
-    text = re.sub(r"^[A-Z0-9]{3}\s*-\s*\d+\s*-\s*", "", text) # Remove PV1-1- type prefixes
-    text = re.sub(r"^[A-Z0-9]{3}\s*-\s*\d+\s*", "", text)    # Remove PV1-1 type prefixes
-    s = re.sub(r"[^a-zA-Z0-9\s]", "", text).strip()          # Keep only letters, numbers, spaces
-    if not s: return "unknownFieldName"
-    s = s.title()                                           # Title Case
-    s = s.replace(" ", "")                                  # Remove spaces
-    return s[0].lower() + s[1:] if s else "unknownFieldName" # camelCase
-
-# --- Direct Scraping Functions (Improved Scroll/Stale Handling, Unchanged from previous version) ---
+# --- Single-Call DOM Extraction ---
+# Returns the rows of the first tbody matched by XPath arguments[0] as a matrix of trimmed cell texts,
+# replacing ~8 WebDriver round-trips per row with one round-trip per scroll pass.
+EXTRACT_TABLE_MATRIX_JS = """
+const tbody = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!tbody) { return null; }
+return Array.from(tbody.rows, row => Array.from(row.cells, cell => (cell.textContent || '').trim()));
+"""
+
+def extract_table_matrix(driver, tbody_xpath):
+    """Returns [[cell_text, ...], ...] for the table body at `tbody_xpath`. Raises NoSuchElementException if absent."""
+    row_matrix = driver.execute_script(EXTRACT_TABLE_MATRIX_JS, tbody_xpath)
+    if row_matrix is None: raise NoSuchElementException(f"No table body for XPath: {tbody_xpath}")
+    return row_matrix
+
+# --- Virtual-Scroll Harvesting (CDK virtual-scroll viewports) ---
+VIRTUAL_SCROLL_MAX_STEPS = 400 # Safety cap on viewport steps per page
+# Sets the viewport's own scrollTop to arguments[0], waits until the rendered range stops changing, then returns
+# the viewport geometry, the total item count (from the Angular component if exposed, else spacer height / row height)
+# and the rendered rows as a cell-text matrix. Returns null when the page has no virtual-scroll viewport.
+VIRTUAL_SCROLL_STEP_JS = """
+const [targetTop, done] = arguments;
+const viewport = document.querySelector('cdk-virtual-scroll-viewport');
+if (!viewport) { done(null); return; }
+const snapshot = () => {
+    const rows = Array.from(viewport.querySelectorAll('tbody tr'));
+    const rowHeight = rows.length ? (rows[0].getBoundingClientRect().height || 48) : 48;
+    let total = 0;
+    try { const cmp = window.ng && window.ng.getComponent ? window.ng.getComponent(viewport) : null; if (cmp && cmp.getDataLength) total = cmp.getDataLength(); } catch (e) {}
+    const spacer = viewport.querySelector('.cdk-virtual-scroll-spacer');
+    if (!total && spacer) total = Math.round(spacer.getBoundingClientRect().height / rowHeight);
+    done({total: total, rowHeight: rowHeight, scrollTop: viewport.scrollTop, viewportHeight: viewport.clientHeight,
+          maxScrollTop: viewport.scrollHeight - viewport.clientHeight,
+          rows: rows.map(row => Array.from(row.cells, cell => (cell.textContent || '').trim()))});
+};
+viewport.scrollTop = targetTop;
+viewport.dispatchEvent(new Event('scroll'));
+let lastChange = performance.now(); const start = performance.now();
+const observer = new MutationObserver(() => { lastChange = performance.now(); });
+observer.observe(viewport, {childList: true, subtree: true, characterData: true});
+const timer = setInterval(() => {
+    const now = performance.now();
+    if (now - lastChange >= 100 || now - start > 3000) { clearInterval(timer); observer.disconnect(); snapshot(); }
+}, 30);
+"""
+
+def iter_virtual_scroll_pages(driver, page_key=None):
+    """
+    Steps a CDK virtual-scroll viewport a viewport-height (whole rows) at a time, yielding
+    (total_rows, row_matrix) per step. Yields nothing if the page has no virtual-scroll viewport.
+    """
+    scroll_top = 0
+    for _ in range(VIRTUAL_SCROLL_MAX_STEPS):
+        step_start = time.monotonic()
+        result = driver.execute_async_script(VIRTUAL_SCROLL_STEP_JS, scroll_top)
+        WAIT_METRICS.record_wait(page_key, time.monotonic() - step_start, 0.5) # Replaces one 0.5s scroll pass
+        if not result: return
+        yield result.get("total") or 0, result.get("rows") or []
+        if result["scrollTop"] >= result["maxScrollTop"] - 1: return # Reached the end of the viewport
+        row_height = max(1, int(result["rowHeight"]))
+        scroll_top = result["scrollTop"] + max(row_height, (int(result["viewportHeight"]) // row_height) * row_height)
+
+# --- Direct Scraping Functions (Improved Scroll/Stale Handling) ---
 def scrape_table_details(driver, table_id, status_queue, stop_event):
     """Scrapes Value and Description columns for a Table definition using persistent content-based scrolling."""
     status_queue.put(('debug', f"  Scraping Table {table_id}..."))
@@ -494,52 +1162,70 @@ def scrape_table_details(driver, table_id, status_queue, stop_event):
     desc_col_index = 1
     pause_after_scroll = 0.5
     stale_content_count = 0
-    max_stale_content_scrolls = 10 # Increased tolerance
+    max_stale_content_scrolls = 10 if WAIT_STRATEGY == "fixed" else EVENT_MAX_STALE_SCROLLS # Increased tolerance for fixed sleeps
     scroll_amount = 800 # Pixels to scroll each time
+    page_key = f"Tables/{table_id}"
 
     try:
         WebDriverWait(driver, 15).until(EC.presence_of_element_located(table_locator))
         status_queue.put(('debug', f"    Table body located for Table {table_id}."))
 
+        # Virtual-scroll viewport: step the viewport itself and stop exactly at its item count
+        if SCRAPE_EXTRACTION_MODE == "js":
+            virtual_total = None
+            for virtual_total, row_matrix in iter_virtual_scroll_pages(driver, page_key):
+                if stop_event.is_set(): raise KeyboardInterrupt("Stop requested during virtual-scroll harvest.")
+                add_table_rows_from_matrix(row_matrix, table_data, processed_values, value_col_index, desc_col_index)
+                if virtual_total and len(table_data) >= virtual_total: break
+            if virtual_total is not None:
+                if virtual_total and len(table_data) < virtual_total:
+                    status_queue.put(('warning', f"    Virtual-scroll harvest for Table {table_id} got {len(table_data)}/{virtual_total} rows (duplicate values?)."))
+                else: status_queue.put(('debug', f"    Virtual-scroll harvest for Table {table_id}: {len(table_data)} rows."))
+                stale_content_count = max_stale_content_scrolls # Viewport fully stepped; skip the window-scroll passes
+
         last_scroll_pos = -1
         while stale_content_count < max_stale_content_scrolls:
             if stop_event.is_set(): raise KeyboardInterrupt("Stop requested during table scroll scrape.")
 
-            tbody = driver.find_element(*table_locator)
-            current_view_rows = []
-            try:
-                current_view_rows = tbody.find_elements(*row_locator)
-            except StaleElementReferenceException:
-                status_queue.put(('warning', f"    TBody became stale for Table {table_id} while finding rows, retrying scroll/find..."))
-                time.sleep(0.3)
-                try: driver.execute_script(f"window.scrollBy(0, {scroll_amount // 4});")
-                except Exception: pass # Ignore scroll error if driver closed
-                time.sleep(pause_after_scroll)
-                continue
+            if SCRAPE_EXTRACTION_MODE == "js":
+                current_view_rows = extract_table_matrix(driver, table_locator[1])
+                newly_added_this_pass = add_table_rows_from_matrix(current_view_rows, table_data, processed_values, value_col_index, desc_col_index)
+            else:
+                tbody = driver.find_element(*table_locator)
+                current_view_rows = []
+                try:
+                    current_view_rows = tbody.find_elements(*row_locator)
+                except StaleElementReferenceException:
+                    status_queue.put(('warning', f"    TBody became stale for Table {table_id} while finding rows, retrying scroll/find..."))
+                    time.sleep(0.3)
+                    try: driver.execute_script(f"window.scrollBy(0, {scroll_amount // 4});")
+                    except Exception: pass # Ignore scroll error if driver closed
+                    time.sleep(pause_after_scroll)
+                    continue
 
-            newly_added_this_pass = 0
-            for row_index, row in enumerate(current_view_rows):
-                value_text = None; desc_text = None
-                row_identifier_for_log = f"view_row_{row_index}"
+                newly_added_this_pass = 0
+                for row_index, row in enumerate(current_view_rows):
+                    value_text = None; desc_text = None
+                    row_identifier_for_log = f"view_row_{row_index}"
 
-                try:
-                    cells = row.find_elements(By.TAG_NAME, "td")
-                    if len(cells) > desc_col_index:
-                        try: value_text = cells[value_col_index].text.strip()
-                        except StaleElementReferenceException: continue # Skip row if value cell stale
-                        row_identifier_for_log = f"value:'{value_text[:20]}...'"
+                    try:
+                        cells = row.find_elements(By.TAG_NAME, "td")
+                        if len(cells) > desc_col_index:
+                            try: value_text = cells[value_col_index].text.strip()
+                            except StaleElementReferenceException: continue # Skip row if value cell stale
+                            row_identifier_for_log = f"value:'{value_text[:20]}...'"
 
-                        if value_text and value_text not in processed_values:
-                            try: desc_text = cells[desc_col_index].get_attribute('textContent').strip()
-                            except StaleElementReferenceException: continue # Skip row if desc cell stale
-                            except Exception as desc_err: desc_text = f"Error: {desc_err}"
+                            if value_text and value_text not in processed_values:
+                                try: desc_text = cells[desc_col_index].get_attribute('textContent').strip()
+                                except StaleElementReferenceException: continue # Skip row if desc cell stale
+                                except Exception as desc_err: desc_text = f"Error: {desc_err}"
 
-                            processed_values.add(value_text)
-                            table_data.append({"value": value_text, "description": desc_text or ""})
-                            newly_added_this_pass += 1
+                                processed_values.add(value_text)
+                                table_data.append({"value": value_text, "description": desc_text or ""})
+                                newly_added_this_pass += 1
 
-                except StaleElementReferenceException: continue # Skip row
-                except Exception as cell_err: status_queue.put(('warning', f"    Error processing cells row {row_identifier_for_log}: {cell_err}")); continue
+                    except StaleElementReferenceException: continue # Skip row
+                    except Exception as cell_err: status_queue.put(('warning', f"    Error processing cells row {row_identifier_for_log}: {cell_err}")); continue
 
             current_total_rows = len(table_data)
             status_queue.put(('debug', f"    Table {table_id} scroll pass: Found {len(current_view_rows)} rows, added {newly_added_this_pass}. Total: {current_total_rows}"))
@@ -555,9 +1241,9 @@ def scrape_table_details(driver, table_id, status_queue, stop_event):
                     current_scroll_pos = driver.execute_script("return window.pageYOffset;")
                     # Scroll relative first, then ensure bottom is reached
                     driver.execute_script(f"window.scrollBy(0, {scroll_amount});")
-                    time.sleep(pause_after_scroll / 3)
+                    wait_for_dom_settled(driver, table_locator[1], page_key, pause_after_scroll / 3)
                     driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                    time.sleep(pause_after_scroll * 2 / 3)
+                    wait_for_dom_settled(driver, table_locator[1], page_key, pause_after_scroll * 2 / 3)
                     new_scroll_pos = driver.execute_script("return window.pageYOffset;")
                     if abs(new_scroll_pos - last_scroll_pos) < 10: # Check if actually scrolled
                         stale_content_count +=1 # Increment if stuck
@@ -567,7 +1253,7 @@ def scrape_table_details(driver, table_id, status_queue, stop_event):
                     status_queue.put(('warning', f"    Scroll error for Table {table_id}: {scr_err}. Assuming end or error."))
                     stale_content_count = max_stale_content_scrolls # Break loop on scroll error
 
-    except TimeoutException: status_queue.put(('error', f"  Timeout finding table body for Table {table_id}.")); return None
+    except TimeoutException: CONCURRENCY.record_timeout(); status_queue.put(('error', f"  Timeout finding table body for Table {table_id}.")); return None
     except NoSuchElementException: status_queue.put(('error', f"  Could not find table body for Table {table_id}.")); return None
     except KeyboardInterrupt: raise
     except Exception as e: status_queue.put(('error', f"  Unexpected error scraping Table {table_id}: {e}")); status_queue.put(('error', traceback.format_exc())); return None
@@ -588,8 +1274,9 @@ def scrape_segment_or_datatype_details(driver, definition_type, definition_name,
     opt_col_index = 4; repeat_col_index = 5; table_col_index = 6
 
     overall_length = -1; pause_after_scroll = 0.5
-    stale_content_count = 0; max_stale_content_scrolls = 8 # Increased tolerance
+    stale_content_count = 0; max_stale_content_scrolls = 8 if WAIT_STRATEGY == "fixed" else EVENT_MAX_STALE_SCROLLS # Increased tolerance for fixed sleeps
     scroll_amount = 800
+    page_key = f"{definition_type}/{definition_name}"
 
     try:
         try: # Get overall length
@@ -606,66 +1293,62 @@ def scrape_segment_or_datatype_details(driver, definition_type, definition_name,
         while stale_content_count < max_stale_content_scrolls:
             if stop_event.is_set(): raise KeyboardInterrupt("Stop requested during detail scroll scrape.")
 
-            tbody = driver.find_element(*table_locator)
-            current_view_rows = []
-            try:
-                current_view_rows = tbody.find_elements(*row_locator)
-            except StaleElementReferenceException:
-                status_queue.put(('warning', f"    TBody became stale for {definition_name}, retrying scroll/find..."))
-                time.sleep(0.2)
-                try: driver.execute_script(f"window.scrollBy(0, {scroll_amount // 4});")
-                except Exception: pass
-                time.sleep(pause_after_scroll)
-                continue
+            if SCRAPE_EXTRACTION_MODE == "js":
+                current_view_rows = extract_table_matrix(driver, table_locator[1])
+                newly_added_count = add_definition_parts_from_matrix(current_view_rows, parts_data, processed_row_identifiers)
+            else:
+                tbody = driver.find_element(*table_locator)
+                current_view_rows = []
+                try:
+                    current_view_rows = tbody.find_elements(*row_locator)
+                except StaleElementReferenceException:
+                    status_queue.put(('warning', f"    TBody became stale for {definition_name}, retrying scroll/find..."))
+                    time.sleep(0.2)
+                    try: driver.execute_script(f"window.scrollBy(0, {scroll_amount // 4});")
+                    except Exception: pass
+                    time.sleep(pause_after_scroll)
+                    continue
+
+                newly_added_count = 0
+                for row in current_view_rows:
+                    part = {}; row_identifier = None; table_text = ""
 
-            newly_added_count = 0
-            for row in current_view_rows:
-                part = {}; row_identifier = None; table_text = ""
+                    try:
+                        cells = row.find_elements(By.TAG_NAME, "td")
+                        if len(cells) > table_col_index: # Need all columns
+                            try: row_identifier = cells[seq_col_index].text.strip()
+                            except StaleElementReferenceException: continue # Skip stale cell
+                            if not row_identifier or row_identifier in processed_row_identifiers: continue
 
-                try:
-                    cells = row.find_elements(By.TAG_NAME, "td")
-                    if len(cells) > table_col_index: # Need all columns
-                        try: row_identifier = cells[seq_col_index].text.strip()
-                        except StaleElementReferenceException: continue # Skip stale cell
-                        if not row_identifier or row_identifier in processed_row_identifiers: continue
-
-                        processed_row_identifiers.add(row_identifier)
-
-                        # Extract Data reliably (using get_attribute for robustness)
-                        try: desc_text = cells[desc_col_index].get_attribute('textContent').strip()
-                        except StaleElementReferenceException: processed_row_identifiers.remove(row_identifier); continue
-                        try: type_text = cells[type_col_index].get_attribute('textContent').strip()
-                        except StaleElementReferenceException: processed_row_identifiers.remove(row_identifier); continue
-                        try: len_text = cells[len_col_index].get_attribute('textContent').strip()
-                        except StaleElementReferenceException: processed_row_identifiers.remove(row_identifier); continue
-                        try: opt_text = cells[opt_col_index].get_attribute('textContent').strip().upper()
-                        except StaleElementReferenceException: processed_row_identifiers.remove(row_identifier); continue
-                        try: repeat_text = cells[repeat_col_index].get_attribute('textContent').strip().upper()
-                        except StaleElementReferenceException: processed_row_identifiers.remove(row_identifier); continue
-                        try: table_text = cells[table_col_index].get_attribute('textContent').strip()
-                        except StaleElementReferenceException: processed_row_identifiers.remove(row_identifier); continue
-
-                        # Build Part Dictionary
-                        part['name'] = convert_to_camel_case(desc_text)
-                        part['type'] = type_text if type_text else "Unknown"
-                        try: part['length'] = int(len_text) if len_text.isdigit() else -1
-                        except ValueError: part['length'] = -1
-                        if opt_text in ['R', 'C', 'B']: part['mandatory'] = True # Expanded mandatory flags
-                        if repeat_text and '-' not in repeat_text: part['repeats'] = True # Simpler repeats check
-                        if table_text and (table_text.isdigit() or (table_text.count('.') == 1 and all(p.isdigit() for p in table_text.split('.')))):
-                            part['table'] = table_text
-
-                        parts_data.append(part)
-                        newly_added_count += 1
-
-                    else: # Log rows with insufficient columns
-                         row_text = ""
-                         try: row_text = row.text[:60].replace('\n',' ')
-                         except StaleElementReferenceException: row_text = "[Stale Row]"
-                         status_queue.put(('debug', f"    Skipping row {len(cells)} cols <= {table_col_index}: '{row_text}' in {definition_name}"))
-
-                except StaleElementReferenceException: continue # Skip row if stale during processing
-                except Exception as cell_err: status_queue.put(('warning', f"    Error processing row/cell {row_identifier}: {cell_err}")); continue
+                            processed_row_identifiers.add(row_identifier)
+
+                            # Extract Data reliably (using get_attribute for robustness)
+                            try: desc_text = cells[desc_col_index].get_attribute('textContent').strip()
+                            except StaleElementReferenceException: processed_row_identifiers.remove(row_identifier); continue
+                            try: type_text = cells[type_col_index].get_attribute('textContent').strip()
+                            except StaleElementReferenceException: processed_row_identifiers.remove(row_identifier); continue
+                            try: len_text = cells[len_col_index].get_attribute('textContent').strip()
+                            except StaleElementReferenceException: processed_row_identifiers.remove(row_identifier); continue
+                            try: opt_text = cells[opt_col_index].get_attribute('textContent').strip().upper()
+                            except StaleElementReferenceException: processed_row_identifiers.remove(row_identifier); continue
+                            try: repeat_text = cells[repeat_col_index].get_attribute('textContent').strip().upper()
+                            except StaleElementReferenceException: processed_row_identifiers.remove(row_identifier); continue
+                            try: table_text = cells[table_col_index].get_attribute('textContent').strip()
+                            except StaleElementReferenceException: processed_row_identifiers.remove(row_identifier); continue
+
+                            # Build Part Dictionary
+                            part = build_definition_part(desc_text, type_text, len_text, opt_text, repeat_text, table_text)
+                            parts_data.append(part)
+                            newly_added_count += 1
+
+                        else: # Log rows with insufficient columns
+                             row_text = ""
+                             try: row_text = row.text[:60].replace('\n',' ')
+                             except StaleElementReferenceException: row_text = "[Stale Row]"
+                             status_queue.put(('debug', f"    Skipping row {len(cells)} cols <= {table_col_index}: '{row_text}' in {definition_name}"))
+
+                    except StaleElementReferenceException: continue # Skip row if stale during processing
+                    except Exception as cell_err: status_queue.put(('warning', f"    Error processing row/cell {row_identifier}: {cell_err}")); continue
 
             current_parts_count = len(parts_data)
             status_queue.put(('debug', f"    {definition_type} {definition_name} scroll pass: Found {len(current_view_rows)}, added {newly_added_count}. Total: {current_parts_count}"))
@@ -680,9 +1363,9 @@ def scrape_segment_or_datatype_details(driver, definition_type, definition_name,
                 try:
                     current_scroll_pos = driver.execute_script("return window.pageYOffset;")
                     driver.execute_script(f"window.scrollBy(0, {scroll_amount});")
-                    time.sleep(pause_after_scroll / 3)
+                    wait_for_dom_settled(driver, table_locator[1], page_key, pause_after_scroll / 3)
                     driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                    time.sleep(pause_after_scroll * 2/ 3)
+                    wait_for_dom_settled(driver, table_locator[1], page_key, pause_after_scroll * 2 / 3)
                     new_scroll_pos = driver.execute_script("return window.pageYOffset;")
                     if abs(new_scroll_pos - last_scroll_pos) < 10: # Check if actually scrolled
                          stale_content_count +=1 # Increment if stuck
@@ -692,7 +1375,7 @@ def scrape_segment_or_datatype_details(driver, definition_type, definition_name,
                     status_queue.put(('warning', f"    Scroll error for {definition_name}: {scr_err}. Assuming end or error."))
                     stale_content_count = max_stale_content_scrolls # Break loop
 
-    except TimeoutException: status_queue.put(('error', f"  Timeout finding table body for {definition_name}.")); return None
+    except TimeoutException: CONCURRENCY.record_timeout(); status_queue.put(('error', f"  Timeout finding table body for {definition_name}.")); return None
     except NoSuchElementException: status_queue.put(('error', f"  Could not find table body for {definition_name}.")); return None
     except KeyboardInterrupt: raise
     except Exception as e: status_queue.put(('error', f"  Unexpected error scraping {definition_name}: {e}")); status_queue.put(('error', traceback.format_exc())); return None
@@ -702,42 +1385,297 @@ def scrape_segment_or_datatype_details(driver, definition_type, definition_name,
     # Add standard segment part *if necessary* - done later during final merge now
 
     # Assemble final structure
-    separator_char = "."
-    final_structure = {
-        "separator": separator_char,
-        "versions": {
-            HL7_VERSION: {
-                "appliesTo": "equalOrGreater",
-                "totalFields": len(parts_data), # Will be updated later if standard part added
-                "length": overall_length,
-                "parts": parts_data
-            }
-        }
-    }
+    final_structure = build_definition_structure(parts_data, overall_length)
     status_queue.put(('debug', f"  Finished scraping {definition_type} {definition_name}. Parts: {len(parts_data)}"))
     return {definition_name: final_structure} if parts_data else None
 
+# --- HTTP Fetch Backend (JSON API, no browser) ---
+_HTTP_SESSION = None
+_HTTP_SESSION_LOCK = threading.Lock()
+
+def get_http_session():
+    """Returns the shared keep-alive Session, sized so every worker can hold a pooled connection."""
+    global _HTTP_SESSION
+    with _HTTP_SESSION_LOCK:
+        if _HTTP_SESSION is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(MAX_WORKERS, 4), max_retries=2)
+            session.mount("http://", adapter); session.mount("https://", adapter)
+            session.headers.update({"Accept": "application/json", "User-Agent": "HL7_AutoParse"})
+            _HTTP_SESSION = session
+        return _HTTP_SESSION
+
+def fetch_api_json(definition_type, definition_name=None):
+    """GETs a category list (name=None) or a single definition from API_BASE_URL. Returns parsed JSON or raises."""
+    url = f"{API_BASE_URL}/{definition_type}" + (f"/{definition_name}" if definition_name else "")
+    response = get_http_session().get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    if HTTP_CAPTURE_DIR: # Record for the offline replay server
+        try:
+            script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+            capture_dir = os.path.join(script_dir, HTTP_CAPTURE_DIR, definition_type)
+            os.makedirs(capture_dir, exist_ok=True)
+            with open(os.path.join(capture_dir, f"{definition_name or 'index'}.json"), 'wb') as f: f.write(response.content)
+        except OSError as cap_err: print(f"Warn: Could not capture API response for {url}: {cap_err}")
+    return response.json()
+
+# API payload shape (PascalCase; what HTTP_CAPTURE_DIR records and hl7_http_standin.py replays):
+#   <Category>               -> [{"Id": "0001", ...}, ...]
+#   Tables/<Id>              -> {"Entries": [{"Value": "A", "Description": "..."}, ...], ...}
+#   DataTypes|Segments/<Id>  -> {"Length": 250 (optional), "Fields": [{"Name", "DataType", "Length", "Usage", "Rpt", "TableId"}, ...], ...}
+
+class ApiShapeError(ValueError):
+    """An API payload does not have the documented response shape (see the comment above)."""
+
+def _api_value(record, key, where):
+    """Returns record[key]. Raises ApiShapeError if `record` is not an object or has no `key`."""
+    if not isinstance(record, dict): raise ApiShapeError(f"{where}: expected an object, got {type(record).__name__}")
+    if key not in record: raise ApiShapeError(f"{where}: missing key '{key}' (has {', '.join(sorted(record)) or 'no keys'})")
+    return record[key]
+
+def _api_list(record, key, where):
+    """Returns record[key], which must be a list."""
+    value = _api_value(record, key, where)
+    if not isinstance(value, list): raise ApiShapeError(f"{where}: '{key}' should be a list, got {type(value).__name__}")
+    return value
+
+def _api_text(record, key, where):
+    """Returns record[key] as stripped text (null -> '')."""
+    value = _api_value(record, key, where)
+    return "" if value is None else str(value).strip()
+
+def _api_repeat_text(raw_rpt):
+    """Maps the API repeat value onto the site's REPEATABILITY column text ('-' = does not repeat)."""
+    if isinstance(raw_rpt, bool): return "Y" if raw_rpt else "-"
+    text = str(raw_rpt).strip() if raw_rpt is not None else ""
+    return "-" if text in ("", "-", "0", "1") else text
+
+def convert_api_table(table_id, payload):
+    """Converts a Table API payload into {id: [{value, description}]} (same shape as scrape_table_details)."""
+    where = f"Tables/{table_id}"
+    table_data = []; processed_values = set()
+    for index, entry in enumerate(_api_list(payload, "Entries", where)):
+        value_text = _api_text(entry, "Value", f"{where} Entries[{index}]")
+        desc_text = _api_text(entry, "Description", f"{where} Entries[{index}]")
+        if not value_text or value_text in processed_values: continue
+        processed_values.add(value_text)
+        table_data.append({"value": value_text, "description": desc_text})
+    return {str(table_id): table_data} if table_data else None
+
+def convert_api_fields(definition_type, definition_name, payload):
+    """Converts a DataType/Segment API payload into {name: structure} (same shape as scrape_segment_or_datatype_details)."""
+    where = f"{definition_type}/{definition_name}"
+    parts_data = []
+    for index, field in enumerate(_api_list(payload, "Fields", where)):
+        field_where = f"{where} Fields[{index}]"
+        desc_text, type_text, len_text, opt_text = (_api_text(field, key, field_where) for key in ("Name", "DataType", "Length", "Usage"))
+        repeat_text = _api_repeat_text(_api_value(field, "Rpt", field_where)).upper()
+        raw_table = _api_value(field, "TableId", field_where)
+        table_text = f"{raw_table:04d}" if isinstance(raw_table, int) else ("" if raw_table is None else str(raw_table).strip()) # Numeric IDs lose their zero padding
+        parts_data.append(build_definition_part(desc_text, type_text, len_text, opt_text.upper(), repeat_text, table_text))
+    if not parts_data: return None
+    overall_length = payload.get("Length") # Only some DataTypes carry an overall length
+    if not isinstance(overall_length, int): overall_length = int(overall_length) if str(overall_length).isdigit() else -1
+    return {definition_name: build_definition_structure(parts_data, overall_length)}
+
+def fetch_definition_via_http(definition_type, definition_name, status_queue, stop_event):
+    """Fetches one definition over plain HTTP. Returns the same dict the Selenium path returns, or None to fall back."""
+    if stop_event.is_set(): return None
+    try:
+        payload = fetch_api_json(definition_type, definition_name)
+        if definition_type == "Tables": data = convert_api_table(definition_name, payload)
+        elif definition_type in ["DataTypes", "Segments"]: data = convert_api_fields(definition_type, definition_name, payload)
+        else: data = None
+        if data: status_queue.put(('status', f"  HTTP fetch successful for {definition_name}."))
+        else: status_queue.put(('warning', f"  HTTP fetch for {definition_name} returned no usable rows. Falling back to Selenium."))
+        return data
+    except ApiShapeError as shape_err:
+        status_queue.put(('error', f"  HTTP API response does not match the expected shape: {shape_err}. Falling back to Selenium."))
+        return None
+    except (requests.RequestException, ValueError) as http_err: # ValueError covers bad JSON bodies
+        status_queue.put(('warning', f"  HTTP fetch failed for {definition_type} {definition_name}: {http_err}. Falling back to Selenium."))
+        return None
+
+def get_definition_list_http(definition_type, status_queue, stop_event):
+    """Fetches a category's definition names from the API. Returns [] on failure so the caller can fall back."""
+    if stop_event.is_set(): return []
+    try:
+        payload = fetch_api_json(definition_type)
+        if not isinstance(payload, list): raise ApiShapeError(f"{definition_type}: expected a list of records, got {type(payload).__name__}")
+        record_names = [_api_text(record, "Id", f"{definition_type}[{index}]") for index, record in enumerate(payload)]
+    except ApiShapeError as shape_err:
+        status_queue.put(('error', f"HTTP API list does not match the expected shape: {shape_err}. Falling back to Selenium."))
+        return []
+    except (requests.RequestException, ValueError) as http_err:
+        status_queue.put(('warning', f"HTTP list fetch failed for {definition_type}: {http_err}. Falling back to Selenium."))
+        return []
+    names = set()
+    for name in record_names:
+        if definition_type == 'Tables' and is_table_id(name): names.add(name)
+        elif definition_type in ['DataTypes', 'Segments'] and name.isalnum(): names.add(name)
+    status_queue.put(('status', f"HTTP list fetch: Found {len(names)} unique valid {definition_type}."))
+    return sorted(names)
+
+# --- Definition Index (persisted list manifest) ---
+class DefinitionIndex:
+    """
+    Manifest of discovered definition names per category, with discovery time and a content hash.
+    Layout: {"hl7Version", "baseUrl", "categories": {category: {"names", "discoveredAt", "sha256"}}}.
+    """
+    def __init__(self, file_path, ttl_days=DEFINITION_INDEX_TTL_DAYS):
+        self.file_path = file_path; self.ttl_days = ttl_days
+        self.categories = {}; self.dirty = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(names):
+        return hashlib.sha256("\n".join(sorted(names)).encode("utf-8")).hexdigest()
+
+    def load(self, status_queue=None):
+        """Reads the manifest; entries for another HL7 version/base URL or with a bad hash are dropped."""
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f: data = json.load(f)
+        except FileNotFoundError: return self
+        except (OSError, ValueError) as e:
+            if status_queue: status_queue.put(('warning', f"Ignoring unreadable {os.path.basename(self.file_path)}: {e}"))
+            return self
+        if data.get("hl7Version") != HL7_VERSION or data.get("baseUrl") != BASE_URL: return self
+        for category, entry in (data.get("categories") or {}).items():
+            names = entry.get("names") if isinstance(entry, dict) else None
+            if isinstance(names, list) and names and entry.get("sha256") == self.content_hash(names):
+                self.categories[category] = entry
+            elif status_queue: status_queue.put(('warning', f"Definition index entry for {category} failed its hash check; it will be re-discovered."))
+        return self
+
+    def fresh_names(self, category):
+        """Returns the indexed names for `category`, or None if missing or older than the TTL."""
+        entry = self.categories.get(category)
+        if not entry: return None
+        if self.ttl_days is not None:
+            try: discovered_at = datetime.fromisoformat(entry["discoveredAt"])
+            except (KeyError, TypeError, ValueError): return None
+            if (datetime.now(timezone.utc) - discovered_at).total_seconds() > self.ttl_days * 86400: return None
+        return list(entry["names"])
+
+    def update(self, category, names):
+        """Records a freshly discovered list. Returns True if the content changed since the last index."""
+        names = sorted(names); digest = self.content_hash(names)
+        with self._lock:
+            changed = self.categories.get(category, {}).get("sha256") != digest
+            self.categories[category] = {"names": names, "discoveredAt": datetime.now(timezone.utc).isoformat(timespec="seconds"), "sha256": digest}
+            self.dirty = True
+        return changed
+
+    def save(self):
+        with self._lock:
+            if not self.dirty: return
+            data = {"hl7Version": HL7_VERSION, "baseUrl": BASE_URL, "categories": self.categories}
+            tmp_path = self.file_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.file_path) # Never leave a half-written index behind
+            self.dirty = False
+
+def discover_definition_list(definition_type, driver_pool, status_queue, stop_event, on_name, definition_index=None):
+    """
+    Fetches one category list (fresh index entry first, then the HTTP backend, else a pooled WebDriver),
+    calling `on_name(name)` for every valid name as soon as it is known. Returns the sorted list of names.
+    """
+    indexed = definition_index.fresh_names(definition_type) if definition_index else None
+    if indexed:
+        status_queue.put(('status', f"Using indexed {definition_type} list ({len(indexed)} names, discovered {definition_index.categories[definition_type]['discoveredAt']})."))
+        for name in indexed: on_name(name)
+        return indexed
+
+    definitions = get_definition_list_http(definition_type, status_queue, stop_event) if FETCH_BACKEND == "http" else []
+    for name in definitions: on_name(name)
+    if not definitions and not stop_event.is_set():
+        list_driver = driver_pool.checkout(stop_event)
+        if not list_driver:
+            if stop_event.is_set(): return []
+            raise Exception(f"Failed to create WebDriver for fetching the {definition_type} list.")
+        try: definitions = get_definition_list(list_driver, definition_type, status_queue, stop_event, on_name)
+        finally: driver_pool.checkin(list_driver) # Reused by the detail workers
+    if definitions and definition_index and not stop_event.is_set(): # A stopped scroll may be partial; never index it
+        if definition_index.update(definition_type, definitions): status_queue.put(('status', f"Definition index: {definition_type} list updated ({len(definitions)} names)."))
+    return definitions
+
+def discover_all_definition_lists(categories, all_definitions, driver_pool, status_queue, stop_event, on_name, discovery_done, definition_index=None):
+    """
+    Runs discover_definition_list for every category concurrently, storing each list in `all_definitions`
+    and calling `on_name(category, name)` per discovered name. Saves `definition_index` (if given) and
+    always sets `discovery_done` when finished.
+    """
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(categories), thread_name_prefix="ListDiscovery") as list_executor:
+            list_futures = {list_executor.submit(discover_definition_list, category, driver_pool, status_queue, stop_event,
+                                                 functools.partial(on_name, category), definition_index): category for category in categories}
+            for future in concurrent.futures.as_completed(list_futures):
+                category = list_futures[future]
+                try: all_definitions[category] = future.result()
+                except Exception as e:
+                    status_queue.put(('error', f"Error fetching {category} list: {e}"))
+                    continue
+                status_queue.put(('list_found', category, len(all_definitions[category]))) # Signal GUI (final count)
+        if definition_index:
+            try: definition_index.save()
+            except OSError as e: status_queue.put(('warning', f"Could not write {DEFINITION_INDEX_FILE}: {e}"))
+    finally:
+        discovery_done.set()
+
+# --- Page Snapshot Store ---
+_SNAPSHOT_STORE = None
+_SNAPSHOT_STORE_LOCK = threading.Lock()
+
+def get_snapshot_store():
+    """Returns the shared SnapshotStore (one per process), or None if SNAPSHOT_STORE_DIR is disabled."""
+    global _SNAPSHOT_STORE
+    if not SNAPSHOT_STORE_DIR: return None
+    with _SNAPSHOT_STORE_LOCK:
+        if _SNAPSHOT_STORE is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+            _SNAPSHOT_STORE = SnapshotStore(os.path.join(script_dir, SNAPSHOT_STORE_DIR))
+        return _SNAPSHOT_STORE
+
 # --- Fallback / Combined Processing Function ---
-def process_definition_page(driver, definition_type, definition_name, status_queue, stop_event):
-    """Attempts direct scraping. If fails or empty, falls back to HTML source + AI."""
+AI_PENDING = object() # Returned instead of page data when AI analysis was handed to the async Gemini stage
+def process_definition_page(driver, definition_type, definition_name, status_queue, stop_event, ai_handoff=None):
+    """
+    Attempts direct scraping. If fails or empty, falls back to HTML source + AI.
+    With `ai_handoff(definition_type, definition_name, prompt_html)`, AI analysis is handed off and AI_PENDING is returned.
+    """
     url = f"{BASE_URL}/{definition_type}/{definition_name}"
     status_queue.put(('status', f"Processing {definition_type}: {definition_name}"))
     if stop_event.is_set(): return None, definition_name
 
     scraped_data = None; ai_data = None; html_save_path = None
     final_data_source = "None"; final_data = None
+    page_key = f"{definition_type}/{definition_name}"; page_start = time.monotonic()
 
     # 1. Navigate
     try:
         driver.get(url)
         WebDriverWait(driver, 7).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-        time.sleep(0.5) # Extra buffer after body tag appears
+        wait_for_dom_settled(driver, None, page_key, 0.5) # Settle after body tag appears (fixed mode: 0.5s buffer)
     except WebDriverException as nav_err:
+        if isinstance(nav_err, TimeoutException) or "timeout" in str(nav_err).lower(): CONCURRENCY.record_timeout()
         status_queue.put(('error', f"Nav Error {definition_name}: {nav_err}"))
         return None, definition_name
     except TimeoutException:
+        CONCURRENCY.record_timeout()
         status_queue.put(('warning', f"Timeout waiting for body tag on {definition_name}, proceeding anyway."))
 
+    # 1b. Snapshot the rendered page; content parsed on an earlier run is not parsed again
+    snapshot_digest = None
+    if get_snapshot_store():
+        try:
+            snapshot_digest, page_changed = get_snapshot_store().put(definition_type, definition_name, driver.page_source)
+            stored_data, stored_source = get_snapshot_store().load_result(definition_type, definition_name, snapshot_digest) if SKIP_UNCHANGED_PAGES else (None, None)
+            if stored_data:
+                WAIT_METRICS.record_page(page_key, time.monotonic() - page_start)
+                status_queue.put(('status', f"  Finished {definition_name}. Source: Snapshot ({'unchanged page' if not page_changed else 'known content'}; parsed by {stored_source})"))
+                return stored_data, definition_name
+        except Exception as snap_err: status_queue.put(('warning', f"  Could not snapshot {definition_name}: {snap_err}"))
+
     # 2. Attempt Direct Scraping
     try:
         status_queue.put(('status', f"  Scraping {definition_name}..."))
@@ -785,9 +1723,11 @@ def process_definition_page(driver, definition_type, definition_name, status_que
         status_queue.put(('debug', traceback.format_exc()))
         scraped_data = None # Ensure fallback happens
 
-    # 3. Fallback to HTML Source and AI Analysis (if scraping failed/empty and not stopped)
+    CONCURRENCY.record_page(time.monotonic() - page_start) # Browser latency only (before any AI fallback)
+
+    # 3. Fallback to HTML Source: offline structural parse, then AI Analysis (if scraping failed/empty and not stopped)
     if final_data is None and not stop_event.is_set():
-        status_queue.put(('status', f"  AI Fallback for {definition_name}..."))
+        status_queue.put(('status', f"  HTML Fallback for {definition_name}..."))
         try:
             status_queue.put(('status', f"    Getting HTML source for {definition_name}..."))
             html_content = driver.page_source
@@ -795,37 +1735,73 @@ def process_definition_page(driver, definition_type, definition_name, status_que
                  raise ValueError(f"Failed to retrieve adequate page source for {definition_name} (len: {len(html_content)}).")
             status_queue.put(('status', f"    Got source ({len(html_content)} bytes)."))
 
-            # --- Save HTML for debugging ---
-            try:
-                script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
-                html_full_dir = os.path.join(script_dir, FALLBACK_HTML_DIR)
-                os.makedirs(html_full_dir, exist_ok=True)
-                html_filename = f"{definition_type}_{definition_name}_fallback.html"
-                html_save_path = os.path.join(html_full_dir, html_filename)
-                with open(html_save_path, 'w', encoding='utf-8') as f: f.write(html_content)
-                status_queue.put(('debug', f"    Saved fallback HTML: {html_filename}"))
-            except Exception as save_err: status_queue.put(('warning', f"    Could not save fallback HTML for {definition_name}: {save_err}"))
+            # --- Save HTML for debugging (snapshot store, and/or loose file) ---
+            if get_snapshot_store():
+                try:
+                    fallback_digest, _ = get_snapshot_store().put(definition_type, definition_name, html_content, kind="fallback")
+                    status_queue.put(('debug', f"    Saved fallback snapshot {fallback_digest[:12]} for {definition_name}"))
+                except Exception as save_err: status_queue.put(('warning', f"    Could not snapshot fallback HTML for {definition_name}: {save_err}"))
+            if SAVE_LOOSE_FALLBACK_HTML or not get_snapshot_store():
+                try:
+                    script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+                    html_full_dir = os.path.join(script_dir, FALLBACK_HTML_DIR)
+                    os.makedirs(html_full_dir, exist_ok=True)
+                    html_filename = f"{definition_type}_{definition_name}_fallback.html"
+                    html_save_path = os.path.join(html_full_dir, html_filename)
+                    with open(html_save_path, 'w', encoding='utf-8') as f: f.write(html_content)
+                    status_queue.put(('debug', f"    Saved fallback HTML: {html_filename}"))
+                except Exception as save_err: status_queue.put(('warning', f"    Could not save fallback HTML for {definition_name}: {save_err}"))
             # --- End Save HTML ---
 
-            if stop_event.is_set(): raise KeyboardInterrupt("Stop requested before AI HTML analysis.")
-
-            # --- AI Analysis of HTML ---
-            if definition_type == "Tables": ai_data = analyze_table_html_with_gemini(html_content, definition_name)
-            elif definition_type == "DataTypes": ai_data = analyze_datatype_html_with_gemini(html_content, definition_name)
-            elif definition_type == "Segments": ai_data = analyze_segment_html_with_gemini(html_content, definition_name)
-            else: status_queue.put(('error', f"    Unknown type '{definition_type}' for AI fallback."))
-
-            if ai_data:
-                # Basic Validation for AI data
-                if isinstance(ai_data, dict) and list(ai_data.keys())[0] == (str(definition_name) if definition_type == "Tables" else definition_name):
-                     status_queue.put(('status', f"  AI HTML Analysis successful for {definition_name}."))
-                     final_data_source = "AI Fallback (HTML)"
-                     final_data = ai_data
-                else:
-                     status_queue.put(('error', f"    AI HTML Analysis for {definition_name} failed validation (key/structure mismatch)."))
-                     final_data = None # Ensure it's None if validation fails
+            # --- Offline Structural Parse (BeautifulSoup; no network, deterministic) ---
+            parsed_data = None
+            if OFFLINE_HTML_PARSE:
+                try: parsed_data = parse_definition_page_html(definition_type, definition_name, html_content)
+                except Exception as parse_err: status_queue.put(('warning', f"    Offline HTML parse error for {definition_name}: {parse_err}"))
+            if parsed_data:
+                status_queue.put(('status', f"  Offline HTML parse successful for {definition_name}."))
+                final_data_source = "HTML Parser"
+                final_data = parsed_data
+            elif definition_type == "Tables" and page_has_no_values(html_content):
+                status_queue.put(('warning', f"    Table {definition_name} has no suggested values on the site; skipping AI analysis."))
             else:
-                status_queue.put(('error', f"    AI HTML Analysis failed for {definition_name} (returned None)."))
+                if OFFLINE_HTML_PARSE: status_queue.put(('status', f"    Offline HTML parse found no definition rows for {definition_name}; using AI."))
+
+                if stop_event.is_set(): raise KeyboardInterrupt("Stop requested before AI HTML analysis.")
+
+                # --- Minimize HTML for the prompt (fewer input tokens, less latency) ---
+                prompt_html = html_content
+                if MINIMIZE_GEMINI_HTML:
+                    try: prompt_html = minimize_definition_html(html_content)
+                    except Exception as minimize_err:
+                        status_queue.put(('warning', f"    HTML minimize failed for {definition_name} ({minimize_err}); sending full page."))
+                        prompt_html = html_content
+                    status_queue.put(('status', f"    Prompt HTML for {definition_name}: {len(html_content):,} -> {len(prompt_html):,} bytes ({len(prompt_html) / len(html_content):.1%})."))
+
+                # --- Hand off to the async Gemini stage (frees this browser immediately) ---
+                if ai_handoff and definition_type in GEMINI_HTML_PROMPTS:
+                    ai_handoff(definition_type, definition_name, prompt_html)
+                    status_queue.put(('status', f"  Handed {definition_name} to the Gemini stage."))
+                    WAIT_METRICS.record_page(page_key, time.monotonic() - page_start)
+                    return AI_PENDING, definition_name
+
+                # --- AI Analysis of HTML ---
+                if definition_type == "Tables": ai_data = analyze_table_html_with_gemini(prompt_html, definition_name)
+                elif definition_type == "DataTypes": ai_data = analyze_datatype_html_with_gemini(prompt_html, definition_name)
+                elif definition_type == "Segments": ai_data = analyze_segment_html_with_gemini(prompt_html, definition_name)
+                else: status_queue.put(('error', f"    Unknown type '{definition_type}' for AI fallback."))
+
+                if ai_data:
+                    # Basic Validation for AI data
+                    if isinstance(ai_data, dict) and list(ai_data.keys())[0] == (str(definition_name) if definition_type == "Tables" else definition_name):
+                         status_queue.put(('status', f"  AI HTML Analysis successful for {definition_name}."))
+                         final_data_source = GEMINI_SALVAGED_SOURCE if isinstance(ai_data, SalvagedAnswer) else "AI Fallback (HTML)"
+                         final_data = ai_data
+                    else:
+                         status_queue.put(('error', f"    AI HTML Analysis for {definition_name} failed validation (key/structure mismatch)."))
+                         final_data = None # Ensure it's None if validation fails
+                else:
+                    status_queue.put(('error', f"    AI HTML Analysis failed for {definition_name} (returned None)."))
 
         except KeyboardInterrupt:
             status_queue.put(('warning', f"Stop requested during AI fallback for {definition_name}."))
@@ -838,11 +1814,83 @@ def process_definition_page(driver, definition_type, definition_name, status_que
             status_queue.put(('error', f"Error during AI fallback processing {definition_name}: {e}"))
             status_queue.put(('error', traceback.format_exc()))
 
-    # 4. Log final source and return result
+    # 4. Remember the result for this page content, log final source and return result
+    if final_data is not None and snapshot_digest and not final_data_source.startswith("AI Fallback"): # AI answers are cached by the Gemini layer
+        try: get_snapshot_store().save_result(definition_type, definition_name, snapshot_digest, final_data, final_data_source)
+        except Exception as snap_err: status_queue.put(('warning', f"  Could not store parse result for {definition_name}: {snap_err}"))
+    WAIT_METRICS.record_page(page_key, time.monotonic() - page_start)
     status_queue.put(('status', f"  Finished {definition_name}. Source: {final_data_source}"))
     # time.sleep(0.05) # Reduce sleep
     return final_data, definition_name
 
+# --- Final Definition Assembly (shared by the orchestrator and hl7_reparse_fallback.py) ---
+def finalize_definitions(final_definitions, status_queue):
+    """
+    Post-processes merged definitions in place: prepends the standard hl7SegmentName part to Segments
+    and builds/updates the top-level HL7 structure. Returns the number of segments in the HL7 structure.
+    """
+    processed_segments_for_hl7_final = set() # Track segments found for HL7 build
+    # --- Add Standard Segment Part (Post-processing) ---
+    # **** MODIFIED LOGGING FOR CLARITY ****
+    status_queue.put(('status', "Post-processing: Ensuring standard parts for Segments within final 'dataTypes' structure..."))
+    items_to_process = list(final_definitions.get("dataTypes", {}).items()) # Create list to iterate over safely if modifying dict (though we only modify sub-parts here)
+    for seg_name, seg_data in items_to_process:
+        # Heuristic to identify items that are likely Segments (3-char alphanumeric name, period separator)
+        # This check runs on ALL items under the 'dataTypes' key now.
+        if isinstance(seg_data, dict) and seg_data.get("separator") == "." and seg_name.isalnum() and len(seg_name) == 3:
+            # If it looks like a segment, add its name for the HL7 structure build
+            processed_segments_for_hl7_final.add(seg_name)
+            # Check if it needs the standard hl7SegmentName part added
+            if "versions" in seg_data and HL7_VERSION in seg_data["versions"]:
+                version_data = seg_data["versions"][HL7_VERSION]
+                if "parts" in version_data:
+                    parts_list = version_data["parts"]
+                    hl7_seg_part = {"mandatory": True, "name": "hl7SegmentName", "type": "ST", "table": "0076", "length": 3}
+                    # Check if first part IS NOT the standard part
+                    if not parts_list or parts_list[0].get("name") != "hl7SegmentName":
+                        parts_list.insert(0, hl7_seg_part)
+                        # Update totalFields count after insertion
+                        version_data["totalFields"] = len(parts_list)
+                        # More specific log message:
+                        status_queue.put(('debug', f"  Prepended standard part for Segment '{seg_name}' (found in final 'dataTypes' dict)"))
+
+    # --- Build HL7 Structure ---
+    status_queue.put(('status', "Building/Updating HL7 Structure..."))
+    hl7_parts = []
+    common_order = ["MSH", "PID", "PV1", "OBR", "OBX"] # Example order
+    # Use the set of segment names identified during post-processing
+    ordered_segments = [s for s in common_order if s in processed_segments_for_hl7_final]
+    other_segments = sorted([s for s in processed_segments_for_hl7_final if s not in common_order])
+    final_segment_order = ordered_segments + other_segments
+
+    if not final_segment_order:
+        status_queue.put(('warning', "No segments identified in final data to build HL7 structure."))
+    else:
+        for seg_name in final_segment_order:
+            # Retrieve the segment definition (from the combined 'dataTypes' dictionary)
+            seg_def = final_definitions["dataTypes"].get(seg_name)
+            # Determine properties for the HL7 part definition
+            is_mand = (seg_name == "MSH")
+            repeats = (seg_name != "MSH") # Simplistic assumption
+            length = -1
+            # Extract length if available in the version data
+            if seg_def and isinstance(seg_def, dict) and 'versions' in seg_def:
+                version_key = next(iter(seg_def.get('versions', {})), None)
+                if version_key and isinstance(seg_def['versions'][version_key], dict):
+                    length = seg_def['versions'][version_key].get('length', -1)
+            # Create the part dictionary for the HL7 definition
+            part = {"name": seg_name.lower(), "type": seg_name, "length": length if length is not None else -1}
+            if is_mand: part["mandatory"] = True
+            if repeats: part["repeats"] = True
+            hl7_parts.append(part)
+        # Update the final dictionary with the HL7 definition
+        final_definitions.setdefault("HL7", {}).update({
+             "separator":"\r", "partId":"type",
+             "versions":{ HL7_VERSION: { "appliesTo":"equalOrGreater", "length":-1, "parts":hl7_parts }}
+        })
+        status_queue.put(('status', f"HL7 structure updated with {len(hl7_parts)} segments."))
+    return len(processed_segments_for_hl7_final)
+
 # --- Utility Functions (Unchanged) ---
 def clear_fallback_html_folder(status_queue):
     """Clears the directory used for saving fallback HTML files."""
@@ -886,126 +1934,195 @@ def item_exists_in_cache(definition_type, item_name, cache_dict):
         else: return False
     except Exception: return False # Be safe
 
-# --- NEW Worker Thread Function (Processes a chunk of definitions) ---
-# <<<< NOTE: This function is OUTSIDE the HL7ParserApp class >>>>
-def process_definition_chunk_thread(definition_type, definition_chunk, status_queue, stop_event, loaded_definitions):
+# --- Work Queue Planning ---
+# Relative scrape cost hints: big segments/tables go first so they never become the tail of a run.
+# Unlisted items use CATEGORY_COST_DEFAULTS; page times from the last run's WAIT_METRICS_FILE override both.
+DEFINITION_COST_HINTS = {
+    ("Segments", "IN2"): 10, ("Segments", "IN1"): 8, ("Segments", "GT1"): 8, ("Segments", "PV1"): 8,
+    ("Segments", "PID"): 7, ("Segments", "OBR"): 7, ("Segments", "PV2"): 7, ("Segments", "ORC"): 6,
+    ("Segments", "NK1"): 6, ("Segments", "STF"): 6, ("Segments", "IN3"): 6, ("Segments", "RXE"): 5,
+    ("Segments", "RXO"): 5, ("Segments", "SCH"): 5, ("Segments", "MSH"): 5, ("Segments", "OBX"): 5,
+    ("Tables", "0396"): 10,
+}
+CATEGORY_COST_DEFAULTS = {"Segments": 3, "DataTypes": 1, "Tables": 1}
+
+def load_previous_page_times():
+    """Returns {"Category/Name": seconds} from the last run's wait metrics file (empty if unavailable)."""
+    script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+    try:
+        with open(os.path.join(script_dir, WAIT_METRICS_FILE), 'r', encoding='utf-8') as f: pages = json.load(f).get("pages", {})
+        return {key: entry.get("page_s", 0.0) for key, entry in pages.items() if entry.get("page_s")}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+def estimate_definition_cost(category, item_name, previous_times):
+    """Expected relative cost of one definition: last run's page time, else the hint table, else the category default."""
+    return previous_times.get(f"{category}/{item_name}") or DEFINITION_COST_HINTS.get((category, item_name), CATEGORY_COST_DEFAULTS.get(category, 1))
+
+# --- Worker Functions ---
+# <<<< NOTE: These functions are OUTSIDE the HL7ParserApp class >>>>
+def validate_definition_result(definition_type, item_name, processed_data, status_queue, stop_event, thread_name):
     """
-    Worker thread function that processes a list (chunk) of HL7 definitions.
-    It manages its own WebDriver instance.
-    REMOVED 'progress_add' calls.
+    Checks a processed page result and returns the value to store (list for Tables, dict for DataTypes/Segments),
+    or None if it failed validation (a warning is logged unless the run was stopped).
+    A valid SalvagedAnswer comes back wrapped in a SalvagedResult (usable, but not to be saved as final).
     """
-    thread_name = f"Worker-{definition_type}-{os.getpid()}-{threading.get_ident()}" # More unique name
-    status_queue.put(('status', f"[{thread_name}] Starting, processing {len(definition_chunk)} items."))
-    driver = None
-    thread_local_results = {}
-    error_count = 0
-    items_processed_in_thread = 0
-    items_skipped_cache = 0
-
-    try:
-        # --- Initialize WebDriver for this worker ---
-        driver = setup_driver()
-        if not driver:
-            error_count = len(definition_chunk)
-            items_processed_in_thread = 0
-            status_queue.put(('error', f"[{thread_name}] WebDriver init FAILED. Cannot process {len(definition_chunk)} items."))
-            # No progress_add to send here anymore
-            return thread_local_results, error_count, items_processed_in_thread, items_skipped_cache # Return failure indication
-
-        # --- Process items in the chunk ---
-        for item_name in definition_chunk:
-            if stop_event.is_set():
-                status_queue.put(('warning', f"[{thread_name}] Stop requested before processing '{item_name}'."))
-                remaining_items = len(definition_chunk) - (items_processed_in_thread + items_skipped_cache)
-                status_queue.put(('debug', f"[{thread_name}] {remaining_items} items not processed due to stop."))
-                # No progress_add to send here anymore
-                break # Exit the loop for this chunk
-
-            # --- Caching Check ---
-            if item_exists_in_cache(definition_type, item_name, loaded_definitions):
-                status_queue.put(('debug', f"[{thread_name}] Skipping '{item_name}' - cached."))
-                items_skipped_cache += 1
-                # status_queue.put(('progress_add', 1)) # <-- REMOVED
-                continue # Move to the next item
-
-            # --- Process the Definition Page (Scrape or AI) ---
-            processed_data, _ = process_definition_page(driver, definition_type, item_name, status_queue, stop_event)
-            items_processed_in_thread += 1 # Increment actual processing attempt count
-
-            # --- Validation / Storing Result ---
-            corrected_item_data = None
-            processing_successful = False
-            actual_data_value = None # Store the value part for easier access
-
-            if processed_data and isinstance(processed_data, dict):
-                if len(processed_data) == 1:
-                    final_key = next(iter(processed_data))
-                    actual_data_value = processed_data[final_key] # Get the value (list for tables, dict for others)
-                    expected_key = str(item_name) if definition_type == "Tables" else item_name
-                    if final_key == expected_key:
-                        if definition_type == "Tables" and isinstance(actual_data_value, list) and actual_data_value: # Must not be empty list
-                            if all(isinstance(item, dict) and 'value' in item for item in actual_data_value):
-                                corrected_item_data = actual_data_value # Store the list for tables
-                                processing_successful = True
-                        elif definition_type in ["DataTypes", "Segments"] and isinstance(actual_data_value, dict) and "versions" in actual_data_value:
-                            version_key = next(iter(actual_data_value.get('versions', {})), None)
-                            # Check parts exist within the version structure
-                            if version_key and actual_data_value['versions'][version_key].get('parts'): # Must have parts
-                                corrected_item_data = actual_data_value # Store the dict for types/segments
-                                processing_successful = True
-                        # Add more specific validation if needed
-                        if not processing_successful:
-                            status_queue.put(('warning', f"[{thread_name}] Final '{item_name}' ({definition_type}) failed structure/content validation. Skip."))
-                            error_count += 1
-                    else: # Key mismatch
-                        status_queue.put(('warning', f"[{thread_name}] Final '{item_name}' ({definition_type}) key mismatch ('{final_key}' vs '{expected_key}'). Skip.")); error_count += 1
-                else: # Wrong number of keys
-                    status_queue.put(('warning', f"[{thread_name}] Final '{item_name}' ({definition_type}) dict has != 1 key. Skip.")); error_count += 1
-            elif processed_data is None and not stop_event.is_set():
-                status_queue.put(('warning', f"[{thread_name}] No final data for '{item_name}' ({definition_type}) (and not stopped). Skip."))
-                error_count += 1
-            elif processed_data and not isinstance(processed_data, dict) and not stop_event.is_set(): # Check wrong type
-                status_queue.put(('warning', f"[{thread_name}] Final data for '{item_name}' ({definition_type}) not dict type: {type(processed_data)}. Skip.")); error_count += 1
-
-            # If validation passed and we have data...
-            if processing_successful and corrected_item_data is not None:
-                result_key = str(item_name) if definition_type == "Tables" else item_name
-
+    if isinstance(processed_data, SalvagedAnswer):
+        value = validate_definition_result(definition_type, item_name, dict(processed_data), status_queue, stop_event, thread_name)
+        if value is None: return None
+        status_queue.put(('warning', f"[{thread_name}] '{item_name}' ({definition_type}) only has a salvaged AI answer (Source: {GEMINI_SALVAGED_SOURCE}); not saved as final."))
+        return SalvagedResult(value)
+    if processed_data and isinstance(processed_data, dict):
+        if len(processed_data) != 1: # Wrong number of keys
+            status_queue.put(('warning', f"[{thread_name}] Final '{item_name}' ({definition_type}) dict has != 1 key. Skip.")); return None
+        final_key = next(iter(processed_data))
+        actual_data_value = processed_data[final_key] # Get the value (list for tables, dict for others)
+        expected_key = str(item_name) if definition_type == "Tables" else item_name
+        if final_key != expected_key: # Key mismatch
+            status_queue.put(('warning', f"[{thread_name}] Final '{item_name}' ({definition_type}) key mismatch ('{final_key}' vs '{expected_key}'). Skip.")); return None
+        if definition_type == "Tables" and isinstance(actual_data_value, list) and actual_data_value: # Must not be empty list
+            if all(isinstance(item, dict) and 'value' in item for item in actual_data_value):
+                return actual_data_value # Store the list for tables
+        elif definition_type in ["DataTypes", "Segments"] and isinstance(actual_data_value, dict) and "versions" in actual_data_value:
+            version_key = next(iter(actual_data_value.get('versions', {})), None)
+            # Check parts exist within the version structure
+            if version_key and actual_data_value['versions'][version_key].get('parts'): # Must have parts
                 # **** ADD METADATA TAG for DataTypes/Segments ****
-                if definition_type in ["DataTypes", "Segments"]:
-                    # Ensure corrected_item_data is the dict (which it is for these types)
-                    if isinstance(corrected_item_data, dict):
-                         corrected_item_data["_original_type"] = definition_type # Store "DataTypes" or "Segments"
-                    # No else needed here because processing_successful ensures it's a dict for these types
+                actual_data_value["_original_type"] = definition_type # Store "DataTypes" or "Segments"
+                return actual_data_value # Store the dict for types/segments
+        status_queue.put(('warning', f"[{thread_name}] Final '{item_name}' ({definition_type}) failed structure/content validation. Skip."))
+    elif processed_data is None and not stop_event.is_set():
+        status_queue.put(('warning', f"[{thread_name}] No final data for '{item_name}' ({definition_type}) (and not stopped). Skip."))
+    elif processed_data and not isinstance(processed_data, dict) and not stop_event.is_set(): # Check wrong type
+        status_queue.put(('warning', f"[{thread_name}] Final data for '{item_name}' ({definition_type}) not dict type: {type(processed_data)}. Skip."))
+    return None
 
-                # Store the potentially modified data in the results
-                thread_local_results[result_key] = corrected_item_data
+def process_single_definition(definition_type, item_name, status_queue, stop_event, driver_pool, thread_name, ai_handoff=None):
+    """
+    Fetches one definition (HTTP backend, then a pooled WebDriver with AI fallback) and validates it.
+    Returns the validated value, None on failure/stop, or AI_PENDING if the page was handed to the Gemini stage.
+    """
+    # --- HTTP backend first (no browser needed if the API answers) ---
+    processed_data = None
+    if FETCH_BACKEND == "http":
+        processed_data = fetch_definition_via_http(definition_type, item_name, status_queue, stop_event)
+
+    if processed_data is None:
+        # --- Wait for a browser slot (adaptive limit), then borrow a WebDriver from the pool ---
+        if not CONCURRENCY.browser.acquire(stop_event): return None
+        try:
+            driver = driver_pool.checkout(stop_event)
+            if not driver:
+                if not stop_event.is_set(): status_queue.put(('error', f"[{thread_name}] No WebDriver available for '{item_name}'. Skip."))
+                return None
 
-            # status_queue.put(('progress_add', 1)) # <-- REMOVED (This was the main culprit)
+            # --- Process the Definition Page (Scrape or AI) ---
+            try:
+                processed_data, _ = process_definition_page(driver, definition_type, item_name, status_queue, stop_event, ai_handoff)
+            finally:
+                driver_pool.checkin(driver)
+        finally:
+            CONCURRENCY.browser.release()
 
-        # --- End of item loop ---
+    # --- Validation ---
+    if processed_data is AI_PENDING: return AI_PENDING # Validated by forward_ai_result when the answer arrives
+    return validate_definition_result(definition_type, item_name, processed_data, status_queue, stop_event, thread_name)
 
+def process_definition_queue_thread(work_queue, result_queue, status_queue, stop_event, driver_pool, discovery_done, gemini_stage=None):
+    """
+    Long-lived worker: pulls single (-cost, seq, (category, name)) entries from the shared priority queue
+    until it is empty and list discovery is done, putting (category, name, result_or_None) on result_queue
+    for every item it takes (pages handed to `gemini_stage` are put there by forward_ai_result instead).
+    Returns (items_processed, error_count) for this worker.
+    """
+    thread_name = f"Worker-{os.getpid()}-{threading.get_ident()}" # More unique name
+    ai_handoff = functools.partial(hand_off_to_gemini_stage, gemini_stage, result_queue, status_queue, stop_event, thread_name) if gemini_stage else None
+    items_processed = 0; error_count = 0
+    status_queue.put(('debug', f"[{thread_name}] Starting."))
+    try:
+        while not stop_event.is_set():
+            try: _, _, (definition_type, item_name) = work_queue.get(timeout=0.5)
+            except queue.Empty:
+                if discovery_done.is_set() and work_queue.empty(): break # Lists complete and queue drained; this worker is done
+                continue # Discovery still streaming names in
+            result = None
+            try:
+                result = process_single_definition(definition_type, item_name, status_queue, stop_event, driver_pool, thread_name, ai_handoff)
+            except Exception as e:
+                status_queue.put(('error', f"[{thread_name}] Error processing {definition_type} '{item_name}': {e}"))
+                status_queue.put(('error', traceback.format_exc()))
+            finally:
+                items_processed += 1
+                if result is not AI_PENDING:
+                    if result is None and not stop_event.is_set(): error_count += 1
+                    result_queue.put((definition_type, item_name, result))
     except KeyboardInterrupt:
         status_queue.put(('warning', f"[{thread_name}] Aborted by user request."))
         if not stop_event.is_set(): stop_event.set() # Ensure signal propagates
-        error_count += len(definition_chunk) - (items_processed_in_thread + items_skipped_cache) # Count remaining as errors/aborted
-        # No progress_add to send here anymore
-    except Exception as e:
-        status_queue.put(('error', f"[{thread_name}] CRITICAL ERROR: {e}"))
-        status_queue.put(('error', traceback.format_exc()))
-        error_count += len(definition_chunk) - (items_processed_in_thread + items_skipped_cache) # Count remaining as errors
-        # No progress_add to send here anymore
-        if not stop_event.is_set(): stop_event.set() # Signal stop on critical error
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except Exception as q_err:
-                status_queue.put(('error', f"[{thread_name}] Error quitting WebDriver: {q_err}"))
+    status_queue.put(('debug', f"[{thread_name}] Finished. Processed: {items_processed}, Errors: {error_count}"))
+    return items_processed, error_count
+
+def hand_off_to_gemini_stage(gemini_stage, result_queue, status_queue, stop_event, thread_name, definition_type, item_name, prompt_html):
+    """ai_handoff for browser workers: queues the page's AI analysis on the async stage and returns at once."""
+    gemini_stage.submit(analyze_html_with_gemini_async(gemini_stage, stop_event, definition_type, item_name, prompt_html),
+                        functools.partial(forward_ai_result, result_queue, status_queue, stop_event, thread_name, definition_type, item_name))
 
-        status_queue.put(('status', f"[{thread_name}] Finished. Processed: {items_processed_in_thread}, Skipped(Cache): {items_skipped_cache}, Errors: {error_count}"))
-        # Return the collected results, error count, and processed/skipped counts for this chunk
-        return thread_local_results, error_count, items_processed_in_thread, items_skipped_cache
+def forward_ai_result(result_queue, status_queue, stop_event, thread_name, definition_type, item_name, future):
+    """Gemini-stage done-callback: validates the AI answer and puts (category, name, result_or_None) on result_queue."""
+    item_result = None
+    try:
+        ai_data = future.result()
+        if ai_data:
+            item_result = validate_definition_result(definition_type, item_name, ai_data, status_queue, stop_event, thread_name)
+            if item_result is not None and not isinstance(item_result, SalvagedResult):
+                status_queue.put(('status', f"  AI HTML Analysis successful for {item_name}. Source: AI Fallback (HTML)"))
+        elif not stop_event.is_set():
+            status_queue.put(('error', f"    AI HTML Analysis failed for {item_name} (returned None)."))
+    except concurrent.futures.CancelledError: pass
+    except Exception as exc: status_queue.put(('error', f"Gemini stage failed on {definition_type} '{item_name}': {exc}"))
+    result_queue.put((definition_type, item_name, item_result))
+
+# --- Process-Pool Worker Functions (EXECUTION_MODE = "processes") ---
+# Per-process state, set by init_definition_worker_process in each worker process
+_PROCESS_STATUS_QUEUE = None
+_PROCESS_STOP_EVENT = None
+_PROCESS_DRIVER_POOL = None
+
+def init_definition_worker_process(mp_status_queue, mp_stop_event, api_key):
+    """ProcessPoolExecutor initializer: wires the cross-process status queue/stop event, a private driver, and Gemini."""
+    global _PROCESS_STATUS_QUEUE, _PROCESS_STOP_EVENT, _PROCESS_DRIVER_POOL, GEMINI_API_KEY, GEMINI_MODEL
+    _PROCESS_STATUS_QUEUE = mp_status_queue; _PROCESS_STOP_EVENT = mp_stop_event
+    _PROCESS_DRIVER_POOL = DriverPool(1, DRIVER_RECYCLE_AFTER_PAGES, mp_status_queue)
+    # atexit does not run in pool workers; multiprocessing finalizers do
+    multiprocessing.util.Finalize(None, _PROCESS_DRIVER_POOL.close_all, exitpriority=10)
+    if api_key or LLM_BACKEND not in BACKENDS_NEEDING_API_KEY:
+        GEMINI_API_KEY = api_key
+        try: GEMINI_MODEL = make_llm_model(LLM_BACKEND, GEMINI_MODEL_NAME, api_key=api_key, standin_url=LLM_STANDIN_URL)
+        except Exception as e: mp_status_queue.put(('error', f"Gemini config failed in worker process {os.getpid()}: {e}"))
+
+def process_definition_in_worker_process(definition_type, item_name):
+    """Runs one definition inside a worker process. Returns (validated result or None, wait-metrics entry or None)."""
+    if _PROCESS_STOP_EVENT.is_set(): return None, None
+    result = process_single_definition(definition_type, item_name, _PROCESS_STATUS_QUEUE, _PROCESS_STOP_EVENT, _PROCESS_DRIVER_POOL, f"Proc-{os.getpid()}")
+    return result, WAIT_METRICS.pop_page(f"{definition_type}/{item_name}")
+
+def forward_process_result(result_queue, status_queue, definition_type, item_name, future):
+    """Future done-callback: puts (category, name, result_or_None) on the orchestrator's result queue."""
+    item_result = None
+    try:
+        item_result, metrics_entry = future.result()
+        if metrics_entry: WAIT_METRICS.merge_page(f"{definition_type}/{item_name}", metrics_entry)
+    except concurrent.futures.CancelledError: pass
+    except Exception as exc: status_queue.put(('error', f"Worker process failed on {definition_type} '{item_name}': {exc}"))
+    result_queue.put((definition_type, item_name, item_result))
+
+def relay_process_messages(mp_status_queue, status_queue, stop_event, mp_stop_event, relay_done):
+    """Forwards worker-process messages into the GUI queue and mirrors the GUI stop request into the processes."""
+    while not (relay_done.is_set() and mp_status_queue.empty()):
+        if stop_event.is_set() and not mp_stop_event.is_set(): mp_stop_event.set()
+        try: status_queue.put(mp_status_queue.get(timeout=0.2))
+        except queue.Empty: continue
+        except (EOFError, OSError): break # Queue torn down
 
 # --- GUI Class ---
 class HL7ParserApp:
@@ -1016,6 +2133,8 @@ class HL7ParserApp:
         self.status_queue = queue.Queue()
         self.stop_event = threading.Event()
         self.executor = None # ThreadPoolExecutor instance
+        self.driver_pool = None # Shared DriverPool, created per run by the orchestrator
+        self.refresh_index_requested = REFRESH_DEFINITION_INDEX # Snapshot of the "Refresh lists" checkbox for the current run
         # self.worker_futures = [] # No longer storing futures here, managed in orchestrator
         self.orchestrator_thread = None # For the main orchestrator logic
 
@@ -1044,6 +2163,9 @@ class HL7ParserApp:
         ttk.Label(log_frame, text="Log:").pack(anchor='w'); self.log_area = scrolledtext.ScrolledText(log_frame, height=15, wrap=tk.WORD, state='disabled'); self.log_area.pack(fill=tk.BOTH, expand=True); self.log_area.tag_config('error', foreground='red'); self.log_area.tag_config('warning', foreground='orange'); self.log_area.tag_config('debug', foreground='gray')
         self.start_button = ttk.Button(button_frame, text="Start Processing", command=self.start_processing); self.start_button.pack(side=tk.RIGHT, padx=5)
         self.stop_button = ttk.Button(button_frame, text="Stop", command=self.stop_processing, state=tk.DISABLED); self.stop_button.pack(side=tk.RIGHT, padx=5)
+        self.refresh_index_var = tk.BooleanVar(value=REFRESH_DEFINITION_INDEX)
+        ttk.Checkbutton(button_frame, text="Refresh lists", variable=self.refresh_index_var).pack(side=tk.RIGHT, padx=5) # Ignore the definition index this run
+        self.lbl_limits = ttk.Label(button_frame, text="Limits: -"); self.lbl_limits.pack(side=tk.LEFT, padx=5) # Adaptive concurrency limits
         # --- End GUI Setup ---
 
     def log_message(self, message, level="info"): # Unchanged
@@ -1097,8 +2219,9 @@ class HL7ParserApp:
                     # 1. Update the specific category's stored progress & GUI
                     if cat_key in self.category_progress:
                         self.category_progress[cat_key]["current"] = current
-                        self.category_progress[cat_key]["total"] = total # Update total just in case
+                        self.category_progress[cat_key]["total"] = total # Grows while list discovery streams names in
                         self.update_progress(cat_key, current, total)
+                        self.grand_total_items = sum(prog["total"] for prog in self.category_progress.values())
 
                     # 2. Recalculate and update the overall progress
                     current_overall = sum(prog["current"] for prog in self.category_progress.values())
@@ -1109,6 +2232,10 @@ class HL7ParserApp:
 
                 # **** REMOVED 'progress_add' HANDLER ****
 
+                elif msg_type == 'limits': # Adaptive concurrency controller changed a limit
+                    browser_limit, browser_max, gemini_limit, gemini_max = message[1], message[2], message[3], message[4]
+                    self.lbl_limits.config(text=f"Limits: browsers {browser_limit}/{browser_max} | Gemini {gemini_limit}/{gemini_max}")
+
                 elif msg_type == 'list_found': # Sets total items and category max - MODIFIED
                     category_name = message[1]; count = message[2]
                     cat_key = category_name.lower()
@@ -1119,8 +2246,8 @@ class HL7ParserApp:
 
                     # Update category progress details
                     self.category_progress[cat_key]["total"] = count
-                    self.category_progress[cat_key]["current"] = 0 # Reset current count
-                    self.update_progress(cat_key, 0, count) # Update category bar
+                    # Keep current: items were already being processed while the list was still scrolling
+                    self.update_progress(cat_key, self.category_progress[cat_key]["current"], count) # Update category bar
 
                     # Update overall bar with potentially new grand total
                     current_overall = sum(prog["current"] for prog in self.category_progress.values())
@@ -1163,7 +2290,7 @@ class HL7ParserApp:
              if self.master.winfo_exists(): self.master.after(500, self.check_queue)
 
     def start_processing(self):
-        if not load_api_key(): return
+        if LLM_BACKEND in BACKENDS_NEEDING_API_KEY and not load_api_key(): return
         if not configure_gemini(): return
 
         if self.orchestrator_thread and self.orchestrator_thread.is_alive():
@@ -1171,6 +2298,7 @@ class HL7ParserApp:
             return
 
         self.stop_event.clear()
+        self.refresh_index_requested = self.refresh_index_var.get() # Read on the Tk thread; the orchestrator only sees the snapshot
         self.start_button.config(state=tk.DISABLED)
         self.stop_button.config(state=tk.NORMAL)
         self.log_message(f"Starting concurrent processing with up to {MAX_WORKERS} workers...")
@@ -1213,7 +2341,9 @@ class HL7ParserApp:
         """Orchestrator using ThreadPoolExecutor to manage workers."""
         categories = ["Tables", "DataTypes", "Segments"]
         all_definitions = {} # Holds the lists fetched for each category
-        all_new_results = {"Tables": {}, "DataTypes": {}, "Segments": {}}
+        new_result_count = 0 # Validated definitions this run (merged straight into loaded_definitions, journaled first)
+        salvaged_definitions = {} # SalvagedResult values: kept out of the journal and output JSON (written to SALVAGED_RESULTS_FILE)
+        results_journal = None
         total_error_count = 0
         # processed_item_tally = 0 # Not needed
 
@@ -1223,93 +2353,159 @@ class HL7ParserApp:
             "datatypes": {"current": 0, "total": 0},
             "segments": {"current": 0, "total": 0}
         }
-        future_to_category = {} # Map Future objects back to their category
+
+        relay_done = threading.Event(); relay_thread = None # Worker-process message relay ("processes" mode)
+        discovery_thread = None # Runs the three list fetches concurrently
+        gemini_stage = None # Async AI analysis (thread mode with GEMINI_ASYNC_STAGE)
 
         try:
             # --- Load Cache ---
             self.status_queue.put(('status', "Loading cached definitions..."))
             loaded_definitions = load_existing_definitions(OUTPUT_JSON_FILE, self.status_queue)
+            script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+            if RESULTS_JOURNAL_FILE:
+                results_journal = ResultsJournal(os.path.join(script_dir, RESULTS_JOURNAL_FILE))
+                journaled = results_journal.replay(self.status_queue)
+                for category, item_name, item_result in journaled: merge_definition_result(loaded_definitions, category, item_name, item_result)
+                if journaled:
+                    new_result_count += len(journaled) # Not in the output JSON yet
+                    self.status_queue.put(('status', f"Resuming: {len(journaled)} definitions recovered from the results journal of an unfinished run."))
             if stop_event.is_set(): raise KeyboardInterrupt("Stop requested during cache load.")
 
-            # --- Get Definition Lists Sequentially ---
-            self.status_queue.put(('status', "Fetching definition lists..."))
-            list_driver = setup_driver()
-            if not list_driver: raise Exception("Failed to create WebDriver for fetching lists.")
-
-            for category in categories:
-                if stop_event.is_set(): break
-                defs = get_definition_list(list_driver, category, self.status_queue, stop_event)
-                all_definitions[category] = defs
-                list_count = len(defs)
-                cat_key = category.lower()
-                local_category_progress[cat_key]["total"] = list_count
-                self.status_queue.put(('list_found', category, list_count)) # Signal GUI
-
-            if list_driver: list_driver.quit()
-            self.status_queue.put(('status', "Finished fetching lists."))
-            if stop_event.is_set(): raise KeyboardInterrupt("Stop requested after list fetch.")
-
-            # --- Setup ThreadPoolExecutor ---
-            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
-            self.status_queue.put(('status', f"Starting processing with up to {MAX_WORKERS} workers..."))
-
-            # --- Submit Tasks (Chunking) ---
-            for category, definitions in all_definitions.items():
-                if stop_event.is_set(): break
-                if not definitions: continue
-
-                num_items = len(definitions)
-                chunk_size = max(1, (num_items + MAX_WORKERS - 1) // MAX_WORKERS)
-                chunks = [definitions[i:i + chunk_size] for i in range(0, num_items, chunk_size)]
-                self.status_queue.put(('debug', f"Submitting {len(chunks)} chunks for {category} (size ~{chunk_size})"))
-
-                for chunk in chunks:
-                    if stop_event.is_set(): break
-                    future = self.executor.submit(
-                        process_definition_chunk_thread, # Worker function
-                        category, chunk, self.status_queue, stop_event, loaded_definitions
-                    )
-                    future_to_category[future] = category # Map future to its category
-
-                if stop_event.is_set(): break
-
-            if stop_event.is_set():
-                 self.status_queue.put(('warning', "Stop requested during task submission. Cancelling pending tasks."))
-                 for future in future_to_category:
-                     if not future.running() and not future.done():
-                         future.cancel()
-                 self.executor.shutdown(wait=False, cancel_futures=True)
-                 raise KeyboardInterrupt("Stop requested.")
-
-            # --- Collect Results as they Complete ---
-            self.status_queue.put(('status', f"Submitted all tasks. Waiting for {len(future_to_category)} chunks to complete..."))
-            for future in concurrent.futures.as_completed(future_to_category.keys()):
-                category = future_to_category[future] # Get category from completed future
+            WAIT_METRICS.reset()
+            CONCURRENCY.reset(self.status_queue)
+
+            # --- Load the Definition Index (skips list scrolling for fresh categories) ---
+            definition_index = DefinitionIndex(os.path.join(script_dir, DEFINITION_INDEX_FILE))
+            if self.refresh_index_requested: self.status_queue.put(('status', "Definition index refresh requested; all lists will be re-discovered."))
+            else: definition_index.load(self.status_queue)
+            indexed_lists = {category: definition_index.fresh_names(category) for category in categories}
+            # Warm run: every list is indexed and every name cached -> no browser is needed at all
+            nothing_to_fetch = all(indexed_lists.values()) and all(item_exists_in_cache(category, name, loaded_definitions)
+                                                                   for category, names in indexed_lists.items() for name in names)
+
+            # --- Start the shared WebDriver pool ---
+            self.driver_pool = DriverPool(DRIVER_POOL_SIZE, DRIVER_RECYCLE_AFTER_PAGES, self.status_queue)
+            if nothing_to_fetch:
+                self.status_queue.put(('status', "Definition index is fresh and every definition is cached; no WebDrivers needed."))
+            elif FETCH_BACKEND == "http":
+                self.status_queue.put(('status', f"Fetch backend: HTTP API ({API_BASE_URL}); WebDrivers launch only for fallbacks."))
+            elif EXECUTION_MODE == "processes":
+                self.status_queue.put(('status', "Execution mode: worker processes (each launches its own WebDriver)."))
+            else:
+                self.status_queue.put(('status', f"Warming up WebDriver pool ({DRIVER_POOL_WARMUP} of max {DRIVER_POOL_SIZE})..."))
+                self.driver_pool.warm_up(DRIVER_POOL_WARMUP)
+            if stop_event.is_set(): raise KeyboardInterrupt("Stop requested during WebDriver warm-up.")
+
+            # --- Dispatch Setup (workers start before the lists are complete) ---
+            work_queue = queue.PriorityQueue() # (-expected_cost, seq, (category, name)): largest first among queued items
+            result_queue = queue.Queue()
+            discovery_done = threading.Event()
+            dispatch_lock = threading.Lock() # Guards the counters below (three discovery threads + this one)
+            dispatch_seq = itertools.count(); seen_items = set(); skipped_count = 0; submitted_count = 0
+            previous_times = load_previous_page_times()
+            worker_futures = []
+
+            if EXECUTION_MODE == "processes":
+                # --- Setup ProcessPoolExecutor (one future per item; the pool's own queue hands items to idle processes) ---
+                num_workers = PROCESS_WORKERS
+                mp_context = multiprocessing.get_context("spawn") # Never fork a process running Tk + threads
+                mp_status_queue = mp_context.Queue(); mp_stop_event = mp_context.Event()
+                self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=max(1, num_workers), mp_context=mp_context,
+                                                                       initializer=init_definition_worker_process,
+                                                                       initargs=(mp_status_queue, mp_stop_event, GEMINI_API_KEY))
+                relay_thread = threading.Thread(target=relay_process_messages, args=(mp_status_queue, self.status_queue, stop_event, mp_stop_event, relay_done), daemon=True)
+                relay_thread.start()
+                self.status_queue.put(('status', f"Starting processing with {num_workers} worker processes..."))
+            else:
+                # --- Setup ThreadPoolExecutor (long-lived workers pull from the shared queue) ---
+                num_workers = MAX_WORKERS
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, num_workers))
+                self.status_queue.put(('status', f"Starting processing with {num_workers} workers..."))
+                if GEMINI_ASYNC_STAGE:
+                    gemini_stage = AsyncGeminiStage(GEMINI_REQUESTS_PER_MINUTE, GEMINI_BURST, lambda: CONCURRENCY.gemini.limit).start()
+                    if GEMINI_BATCHING:
+                        gemini_stage.batcher = RequestBatcher(functools.partial(send_gemini_batch_async, gemini_stage, stop_event),
+                                                              GEMINI_BATCH_TOKEN_BUDGET, GEMINI_BATCH_MAX_ITEMS, GEMINI_BATCH_WINDOW_S)
+                    self.status_queue.put(('status', f"Gemini stage: async, {GEMINI_REQUESTS_PER_MINUTE}/min (burst {GEMINI_BURST}), "
+                                                     f"{'batched' if GEMINI_BATCHING else 'one page per request'}, in-flight cap follows the adaptive Gemini limit."))
+                worker_futures = [self.executor.submit(process_definition_queue_thread, work_queue, result_queue, self.status_queue, stop_event, self.driver_pool, discovery_done, gemini_stage)
+                                  for _ in range(num_workers)]
+
+            def dispatch_discovered_item(category, item_name):
+                """Called by the list-discovery threads for every valid name: skip if cached, else queue/submit it."""
+                nonlocal skipped_count, submitted_count
                 cat_key = category.lower()
-                try:
-                    # Get results from worker: results_dict, errors, processed_count, skipped_count
-                    chunk_results, chunk_errors, chunk_processed, chunk_skipped = future.result()
-
-                    if chunk_results:
-                         all_new_results[category].update(chunk_results) # Add new results to category dict
+                with dispatch_lock:
+                    if (category, item_name) in seen_items or stop_event.is_set(): return
+                    seen_items.add((category, item_name))
+                    local_category_progress[cat_key]["total"] += 1
+                    if item_exists_in_cache(category, item_name, loaded_definitions): # Cached items never reach the queue
+                        skipped_count += 1
+                        local_category_progress[cat_key]["current"] += 1
+                    elif EXECUTION_MODE == "processes":
+                        submitted_count += 1
+                        future = self.executor.submit(process_definition_in_worker_process, category, item_name)
+                        future.add_done_callback(functools.partial(forward_process_result, result_queue, self.status_queue, category, item_name))
+                        worker_futures.append(future)
+                    else:
+                        submitted_count += 1
+                        work_queue.put((-estimate_definition_cost(category, item_name, previous_times), next(dispatch_seq), (category, item_name)))
+                    self.status_queue.put(('progress', cat_key, local_category_progress[cat_key]["current"], local_category_progress[cat_key]["total"]))
 
-                    total_error_count += chunk_errors # Accumulate errors
+            # --- Discover Definition Lists Concurrently (names stream into the work queue) ---
+            self.status_queue.put(('status', "Fetching definition lists (all categories in parallel)..."))
+            discovery_thread = threading.Thread(target=discover_all_definition_lists,
+                                                args=(categories, all_definitions, self.driver_pool, self.status_queue, stop_event, dispatch_discovered_item, discovery_done, definition_index),
+                                                daemon=True)
+            discovery_thread.start()
 
-                    # Update local progress counter for this category
-                    processed_in_chunk = chunk_processed + chunk_skipped
-                    local_category_progress[cat_key]["current"] += processed_in_chunk
+            # --- Collect Results per Item as they Complete (while discovery may still be adding items) ---
+            collected_count = 0; discovery_reported = False
+            while True:
+                with dispatch_lock: lists_complete = discovery_done.is_set(); remaining_items = submitted_count - collected_count
+                if lists_complete and not discovery_reported:
+                    discovery_reported = True
+                    missing = [c for c in categories if c not in all_definitions]
+                    if missing and not stop_event.is_set(): total_error_count += len(missing) # List fetch failed for these categories
+                    self.status_queue.put(('status', f"Finished fetching lists. Skipped {skipped_count} cached definitions; {submitted_count} queued."))
+                if lists_complete and remaining_items <= 0: break
+                try:
+                    category, item_name, item_result = result_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if gemini_stage and stop_event.is_set(): gemini_stage.cancel_pending() # Each cancelled page still reports a None result
+                    ai_pending = gemini_stage.pending_count() if gemini_stage else 0
+                    if lists_complete and all(f.done() for f in worker_futures) and result_queue.empty() and not ai_pending: break # Workers gone (stop/crash)
+                    continue
+                collected_count += 1
+                cat_key = category.lower()
+                if isinstance(item_result, SalvagedResult): # Possibly incomplete: not journaled or merged, so the next run retries it
+                    merge_definition_result(salvaged_definitions, category, item_name, item_result.value)
+                    if not stop_event.is_set(): total_error_count += 1
+                elif item_result is not None:
+                    if results_journal:
+                        try: results_journal.append(category, item_name, item_result) # On disk before anything else happens
+                        except (OSError, TypeError, ValueError) as j_err: self.status_queue.put(('warning', f"Could not journal {category} '{item_name}': {j_err}"))
+                    with dispatch_lock: merge_definition_result(loaded_definitions, category, item_name, item_result) # Discovery threads read it
+                    new_result_count += 1
+                elif not stop_event.is_set():
+                    total_error_count += 1
+                with dispatch_lock:
+                    local_category_progress[cat_key]["current"] += 1
                     # Send message for GUI to update its progress bars
                     self.status_queue.put(('progress', cat_key, local_category_progress[cat_key]["current"], local_category_progress[cat_key]["total"]))
 
-                    self.status_queue.put(('debug', f"Chunk for {category} finished. Processed: {chunk_processed}, Skipped: {chunk_skipped}, Errors: {chunk_errors}"))
-
-                except concurrent.futures.CancelledError:
-                     self.status_queue.put(('warning', f"Chunk for {category} was cancelled."))
-                     total_error_count += 1 # Treat cancellation as an issue
+            for future in (worker_futures if EXECUTION_MODE != "processes" else []): # Process results were checked in forward_process_result
+                try: future.result()
+                except concurrent.futures.CancelledError: pass
                 except Exception as exc:
-                    self.status_queue.put(('error', f"Chunk for {category} generated an exception: {exc}"))
-                    self.status_queue.put(('error', traceback.format_exc()))
-                    total_error_count += 1 # Count chunk failure as error
+                    self.status_queue.put(('error', f"Worker generated an exception: {exc}"))
+                    total_error_count += 1 # Count worker failure as error
+            remaining_items = submitted_count - collected_count
+            if remaining_items > 0:
+                self.status_queue.put(('warning', f"{remaining_items} queued definitions were not processed."))
+                if stop_event.is_set(): raise KeyboardInterrupt("Stop requested.")
+                total_error_count += remaining_items
 
             self.status_queue.put(('status', "All submitted tasks have completed or been cancelled."))
 
@@ -1330,82 +2526,39 @@ class HL7ParserApp:
             if self.executor:
                 self.executor.shutdown(wait=True) # Wait for running tasks unless stopped
                 self.status_queue.put(('status', "Worker pool shutdown complete."))
+            if gemini_stage:
+                gemini_stage.stop(cancel=True) # Normally idle by now; on stop/error drops queued AI requests
+                if gemini_stage.batcher and gemini_stage.batcher.items_sent:
+                    self.status_queue.put(('status', f"Gemini batching: {gemini_stage.batcher.items_sent} pages in {gemini_stage.batcher.batches_sent} requests."))
+            if relay_thread:
+                relay_done.set(); relay_thread.join(timeout=5.0)
+            if discovery_thread:
+                discovery_thread.join(timeout=30.0) # List drivers go back to the pool before it closes
+            if self.driver_pool:
+                self.driver_pool.close_all()
+                self.driver_pool = None
+
+            # --- Wait Metrics ---
+            pages_timed, waited_s, fixed_equiv_s, page_s = WAIT_METRICS.summary()
+            if pages_timed:
+                self.status_queue.put(('status', f"Wait metrics ({WAIT_STRATEGY}): {pages_timed} pages, {page_s:.1f}s total page time, "
+                                                 f"{waited_s:.1f}s waiting vs {fixed_equiv_s:.1f}s fixed-sleep budget (saved ~{fixed_equiv_s - waited_s:.1f}s)."))
+                try:
+                    script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+                    WAIT_METRICS.save(os.path.join(script_dir, WAIT_METRICS_FILE))
+                except Exception as m_err: self.status_queue.put(('warning', f"Could not write {WAIT_METRICS_FILE}: {m_err}"))
 
             # --- Final Merge, Save, Compare, Cleanup ---
             final_definitions = loaded_definitions # Start with the loaded cache
-            processed_segments_for_hl7_final = set() # Track segments found for HL7 build
             # Decide if we should proceed with merging and saving
-            should_process_results = not stop_event.is_set() or any(all_new_results.values())
+            should_process_results = not stop_event.is_set() or new_result_count > 0
 
             if should_process_results:
-                # --- Merge Cache with New Results ---
-                self.status_queue.put(('status', "Merging cached and new results..."))
-                # Update tables
-                final_definitions.setdefault("tables", {}).update(all_new_results.get("Tables", {}))
-                # Update dataTypes key with BOTH new DataTypes and new Segments
-                final_definitions.setdefault("dataTypes", {}).update(all_new_results.get("DataTypes", {}))
-                final_definitions["dataTypes"].update(all_new_results.get("Segments", {}))
-                self.status_queue.put(('debug', "Merged Tables, DataTypes, and Segments into final structure."))
-
-                # --- Add Standard Segment Part (Post-processing) ---
-                # **** MODIFIED LOGGING FOR CLARITY ****
-                self.status_queue.put(('status', "Post-processing: Ensuring standard parts for Segments within final 'dataTypes' structure..."))
-                items_to_process = list(final_definitions.get("dataTypes", {}).items()) # Create list to iterate over safely if modifying dict (though we only modify sub-parts here)
-                for seg_name, seg_data in items_to_process:
-                    # Heuristic to identify items that are likely Segments (3-char alphanumeric name, period separator)
-                    # This check runs on ALL items under the 'dataTypes' key now.
-                    if isinstance(seg_data, dict) and seg_data.get("separator") == "." and seg_name.isalnum() and len(seg_name) == 3:
-                        # If it looks like a segment, add its name for the HL7 structure build
-                        processed_segments_for_hl7_final.add(seg_name)
-                        # Check if it needs the standard hl7SegmentName part added
-                        if "versions" in seg_data and HL7_VERSION in seg_data["versions"]:
-                            version_data = seg_data["versions"][HL7_VERSION]
-                            if "parts" in version_data:
-                                parts_list = version_data["parts"]
-                                hl7_seg_part = {"mandatory": True, "name": "hl7SegmentName", "type": "ST", "table": "0076", "length": 3}
-                                # Check if first part IS NOT the standard part
-                                if not parts_list or parts_list[0].get("name") != "hl7SegmentName":
-                                    parts_list.insert(0, hl7_seg_part)
-                                    # Update totalFields count after insertion
-                                    version_data["totalFields"] = len(parts_list)
-                                    # More specific log message:
-                                    self.status_queue.put(('debug', f"  Prepended standard part for Segment '{seg_name}' (found in final 'dataTypes' dict)"))
-
-                # --- Build HL7 Structure ---
-                self.status_queue.put(('status', "Building/Updating HL7 Structure..."))
-                hl7_parts = []
-                common_order = ["MSH", "PID", "PV1", "OBR", "OBX"] # Example order
-                # Use the set of segment names identified during post-processing
-                ordered_segments = [s for s in common_order if s in processed_segments_for_hl7_final]
-                other_segments = sorted([s for s in processed_segments_for_hl7_final if s not in common_order])
-                final_segment_order = ordered_segments + other_segments
-
-                if not final_segment_order:
-                    self.status_queue.put(('warning', "No segments identified in final data to build HL7 structure."))
-                else:
-                    for seg_name in final_segment_order:
-                        # Retrieve the segment definition (from the combined 'dataTypes' dictionary)
-                        seg_def = final_definitions["dataTypes"].get(seg_name)
-                        # Determine properties for the HL7 part definition
-                        is_mand = (seg_name == "MSH")
-                        repeats = (seg_name != "MSH") # Simplistic assumption
-                        length = -1
-                        # Extract length if available in the version data
-                        if seg_def and isinstance(seg_def, dict) and 'versions' in seg_def:
-                            version_key = next(iter(seg_def.get('versions', {})), None)
-                            if version_key and isinstance(seg_def['versions'][version_key], dict):
-                                length = seg_def['versions'][version_key].get('length', -1)
-                        # Create the part dictionary for the HL7 definition
-                        part = {"name": seg_name.lower(), "type": seg_name, "length": length if length is not None else -1}
-                        if is_mand: part["mandatory"] = True
-                        if repeats: part["repeats"] = True
-                        hl7_parts.append(part)
-                    # Update the final dictionary with the HL7 definition
-                    final_definitions.setdefault("HL7", {}).update({
-                         "separator":"\r", "partId":"type",
-                         "versions":{ HL7_VERSION: { "appliesTo":"equalOrGreater", "length":-1, "parts":hl7_parts }}
-                    })
-                    self.status_queue.put(('status', f"HL7 structure updated with {len(hl7_parts)} segments."))
+                # New results were merged into the loaded cache as they arrived (and journaled), so nothing is held twice
+                self.status_queue.put(('status', f"Compacting {new_result_count} new definitions with the cache..."))
+
+                # --- Post-processing + HL7 Structure (shared with hl7_reparse_fallback.py) ---
+                finalize_definitions(final_definitions, self.status_queue)
             # --- End should_process_results block ---
 
             # --- Write Final JSON ---
@@ -1414,9 +2567,13 @@ class HL7ParserApp:
                 script_dir=os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
                 output_path=os.path.join(script_dir, OUTPUT_JSON_FILE)
                 try:
-                    # Write the final merged dictionary to the JSON file
-                    with open(output_path,'w',encoding='utf-8') as f:
+                    # Write the final merged dictionary to a temp file, then swap it in (a crash mid-write keeps the old file)
+                    tmp_output_path = output_path + ".tmp"
+                    with open(tmp_output_path,'w',encoding='utf-8') as f:
                         json.dump(final_definitions, f, indent=2, ensure_ascii=False)
+                        f.flush(); os.fsync(f.fileno())
+                    os.replace(tmp_output_path, output_path)
+                    if results_journal: results_journal.clear() # Everything journaled is in the output JSON now
                     self.status_queue.put(('status', "JSON file written successfully."))
 
                     # --- Run Comparison ---
@@ -1465,11 +2622,23 @@ class HL7ParserApp:
                  # Log if no new results were processed (e.g., all cached)
                  self.status_queue.put(('status', "No new results processed or processing skipped, JSON file not updated."))
 
+            if results_journal: results_journal.close() # Kept on disk if the output JSON was not written; the next run resumes from it
+
+            # --- Salvaged AI answers (last resort, for manual review; never part of the output JSON) ---
+            if salvaged_definitions and SALVAGED_RESULTS_FILE:
+                salvaged_count = sum(len(values) for values in salvaged_definitions.values())
+                try:
+                    script_dir = os.path.dirname(os.path.abspath(__file__)) if '__file__' in globals() else os.getcwd()
+                    with open(os.path.join(script_dir, SALVAGED_RESULTS_FILE), 'w', encoding='utf-8') as f: json.dump(salvaged_definitions, f, indent=2, ensure_ascii=False)
+                    self.status_queue.put(('warning', f"{salvaged_count} definitions only had salvaged (possibly incomplete) AI answers; written to {SALVAGED_RESULTS_FILE}, retried next run."))
+                except OSError as s_err: self.status_queue.put(('warning', f"Could not write {SALVAGED_RESULTS_FILE}: {s_err}"))
+
             # Signal Overall Completion to GUI, passing the final error count
             self.status_queue.put(('finished', total_error_count if should_process_results else 0))
 # --- Run Application ---
 if __name__ == "__main__":
     app = None # Ensure app is None initially
+    if "--refresh-index" in sys.argv: REFRESH_DEFINITION_INDEX = True # Re-discover all lists (ignores DEFINITION_INDEX_FILE)
     root = tk.Tk()
     app = HL7ParserApp(root) # Create instance, sets global 'app'
     try: